@@ -0,0 +1,170 @@
+
+# Headless batch export of Blender scenes to the Mufflon format.
+#
+# Inside Blender (exports the given or the currently opened .blend files one after another):
+#   blender -b scene.blend --python mff_batch_export.py -- [options] [more.blend ...]
+# With a plain Python interpreter (starts one background Blender per .blend file, --jobs at a time):
+#   python mff_batch_export.py --blender /path/to/blender [options] a.blend b.blend ...
+#
+# The exit code is non-zero if any of the exports failed.
+
+import argparse
+import concurrent.futures
+import fnmatch
+import os
+import subprocess
+import sys
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+
+def create_argument_parser():
+    parser = argparse.ArgumentParser(description="Batch export of Blender scenes to Mufflon (.json/.mff)")
+    parser.add_argument("blend_files", nargs='*', help=".blend files to export (inside Blender defaults to the opened file)")
+    parser.add_argument("--scene", action='append', default=[], help="Scene to export (repeatable; default: active scene)")
+    parser.add_argument("--output", default="{blend}.json",
+                        help="Output JSON path; '{blend}' and '{scene}' are replaced by the file and scene name (default: '{blend}.json')")
+    parser.add_argument("--select", action='append', default=[], metavar="PATTERN",
+                        help="Export only objects whose name matches the pattern (repeatable, implies selection only)")
+    parser.add_argument("--selection-only", action='store_true', help="Export the objects selected in the .blend file only")
+    parser.add_argument("--compression", action='store_true', help="Compress vertex normals (octahedral)")
+    parser.add_argument("--deflation", action='store_true', help="Deflate the binary data blocks")
+    parser.add_argument("--triangulate", action='store_true', help="Triangulate all exported objects")
+    parser.add_argument("--animation", action='store_true', help="Export the animation of the whole frame range")
+    parser.add_argument("--bake-textures", action='store_true', help="Bake procedural textures")
+    parser.add_argument("--bake-resolution", type=int, default=1024, help="Width and height of baked textures")
+    parser.add_argument("--keep-default-scenario", action='store_true', help="Keep the default scenario of an existing JSON")
+    parser.add_argument("--object-cache", action='store_true', help="Reuse unchanged objects from previous exports")
+    parser.add_argument("--animation-workers", type=int, default=0,
+                        help="Background Blender processes per export for the frames of cloth/fluid objects")
+    parser.add_argument("--no-deduplication", action='store_true', help="Export meshes with identical content separately")
+    parser.add_argument("--no-instancers", action='store_true',
+                        help="Do not export the instances of collection instances, particle systems and geometry nodes")
+    parser.add_argument("--index", action='store_true', help="Write an object index (offsets, bounds, instances) next to the .mff")
+    parser.add_argument("--profile", action='store_true', help="Write a JSON profile next to the .mff")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of Blender processes to run at once (outside of Blender)")
+    parser.add_argument("--blender", default="blender", help="Blender executable (outside of Blender)")
+    return parser
+
+# Rebuilds the exporter options for the Blender child processes
+def get_forwarded_arguments(args):
+    forwarded = ["--output", args.output, "--animation-workers", str(args.animation_workers),
+                 "--bake-resolution", str(args.bake_resolution)]
+    for scene in args.scene:
+        forwarded += ["--scene", scene]
+    for pattern in args.select:
+        forwarded += ["--select", pattern]
+    for flag in ["selection_only", "compression", "deflation", "triangulate", "animation", "bake_textures",
+                 "keep_default_scenario", "object_cache", "no_deduplication", "no_instancers", "index", "profile"]:
+        if getattr(args, flag):
+            forwarded.append("--" + flag.replace('_', '-'))
+    return forwarded
+
+def get_output_path(template, blendFile, sceneName, sceneCount):
+    if sceneCount > 1 and "{scene}" not in template:
+        root, ext = os.path.splitext(template)
+        template = root + "_{scene}" + ext
+    blendName = os.path.splitext(os.path.basename(blendFile))[0]
+    outputPath = template.replace("{blend}", blendName).replace("{scene}", sceneName)
+    if not os.path.isabs(outputPath):
+        outputPath = os.path.join(os.path.dirname(os.path.abspath(blendFile)), outputPath)
+    return outputPath
+
+
+#   Inside Blender
+
+def register_exporter():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import mff_exporter_28
+    try:
+        mff_exporter_28.register()
+    except ValueError:
+        pass # Already registered (e.g. installed as add-on)
+
+def select_objects(scene, patterns):
+    for obj in scene.objects:
+        obj.select_set(any(fnmatch.fnmatchcase(obj.name, pattern) for pattern in patterns))
+
+def export_scene(args, blendFile, scene, sceneCount):
+    if args.select:
+        select_objects(scene, args.select)
+    outputPath = get_output_path(args.output, blendFile, scene.name, sceneCount)
+    print("Exporting scene '%s' of '%s' to '%s'"%(scene.name, blendFile, outputPath))
+    window = bpy.context.window_manager.windows[0] if len(bpy.context.window_manager.windows) > 0 else None
+    overrideContext = bpy.context.copy()
+    overrideContext['scene'] = scene
+    overrideContext['view_layer'] = scene.view_layers[0]
+    if window is not None:
+        window.scene = scene
+    result = bpy.ops.mufflon.exporter(overrideContext, 'EXEC_DEFAULT', filepath=outputPath,
+                                      use_selection=args.selection_only or len(args.select) > 0,
+                                      use_compression=args.compression, use_deflation=args.deflation,
+                                      triangulate=args.triangulate, export_animation=args.animation,
+                                      bake_textures=args.bake_textures, bake_resolution=args.bake_resolution,
+                                      overwrite_default_scenario=not args.keep_default_scenario,
+                                      use_object_cache=args.object_cache, animation_workers=args.animation_workers,
+                                      deduplicate_meshes=not args.no_deduplication,
+                                      export_instancers=not args.no_instancers, write_index=args.index,
+                                      write_profile=args.profile)
+    return 'FINISHED' in result
+
+def run_in_blender(argv):
+    args = create_argument_parser().parse_args(argv)
+    register_exporter()
+    blendFiles = args.blend_files if args.blend_files else [bpy.data.filepath]
+    failures = 0
+    for blendFile in blendFiles:
+        try:
+            if os.path.abspath(blendFile) != os.path.abspath(bpy.data.filepath):
+                bpy.ops.wm.open_mainfile(filepath=blendFile)
+            if args.scene:
+                scenes = [bpy.data.scenes[name] for name in args.scene]
+            else:
+                scenes = [bpy.context.scene]
+            for scene in scenes:
+                if not export_scene(args, blendFile, scene, len(scenes)):
+                    print("Failed exporting scene '%s' of '%s'"%(scene.name, blendFile))
+                    failures += 1
+        except Exception as e:
+            print("Failed exporting '%s': %s"%(blendFile, str(e)))
+            failures += 1
+    return 1 if failures > 0 else 0
+
+
+#   Outside of Blender
+
+def run_blender_process(args, blendFile):
+    command = [args.blender, "-b", blendFile, "--python-exit-code", "1", "--python", os.path.abspath(__file__), "--"]
+    command += get_forwarded_arguments(args)
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    return blendFile, process.returncode, process.stdout
+
+def run_batch(argv):
+    args = create_argument_parser().parse_args(argv)
+    if not args.blend_files:
+        print("No .blend files given")
+        return 2
+    failures = 0
+    # The exports themselves run in separate Blender processes; the threads only wait for them
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        jobs = [executor.submit(run_blender_process, args, blendFile) for blendFile in args.blend_files]
+        for job in jobs:
+            blendFile, returnCode, output = job.result()
+            print(output)
+            if returnCode != 0:
+                print("Failed exporting '%s' (exit code %d)"%(blendFile, returnCode))
+                failures += 1
+            else:
+                print("Succeeded exporting '%s'"%(blendFile))
+    print("Exported %d of %d files"%(len(args.blend_files) - failures, len(args.blend_files)))
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    if bpy is not None:
+        sys.exit(run_in_blender(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
+    else:
+        sys.exit(run_batch(sys.argv[1:]))
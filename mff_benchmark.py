@@ -0,0 +1,321 @@
+
+# Throughput benchmark for the Mufflon exporter's hot paths on synthetic scenes.
+#
+#   blender -b --factory-startup --python mff_benchmark.py -- --output bench.json [--scale 1.0] [--repeat 3]
+#
+# Every scenario builds a fresh scene and times the frame sweep, export_json, export_binary,
+# write_mesh_lod, write_animation_binary and write_instances separately. The results (seconds, vertices/s, MB/s)
+# are written to JSON so that they can be compared between commits.
+
+import argparse
+import collections
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import bpy
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mff_exporter_28 as exporter
+
+
+# Stands in for the export operator: the export functions only read its options and report through it
+class BenchmarkOptions:
+    def __init__(self, filepath, **options):
+        self.filepath = filepath
+        self.use_selection = False
+        self.use_compression = False
+        self.use_deflation = False
+        self.triangulate = False
+        self.overwrite_default_scenario = True
+        self.export_animation = False
+        self.bake_textures = False
+        self.bake_resolution = 1024
+        self.use_object_cache = False
+        self.animation_workers = 0
+        self.deduplicate_meshes = True
+        self.export_instancers = True
+        self.write_index = False
+        self.write_profile = False
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    def report(self, level, message):
+        pass
+
+
+#   Scene generation
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    cameraObject = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    cameraObject.location = (0.0, -10.0, 5.0)
+    scene.collection.objects.link(cameraObject)
+    scene.camera = cameraObject
+    scene.frame_start = 1
+    scene.frame_end = 1
+    return scene
+
+def create_material(name):
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    return material
+
+# Builds an (n x n) vertex grid with UVs in bulk
+def create_grid_mesh(name, n, size=10.0):
+    coords = numpy.linspace(-size / 2, size / 2, n, dtype=numpy.float32)
+    x, y = numpy.meshgrid(coords, coords)
+    positions = numpy.stack((x.ravel(), y.ravel(), numpy.zeros(n * n, dtype=numpy.float32)), axis=1)
+    corners = numpy.arange(n * n).reshape(n, n)[:-1, :-1].ravel()
+    loops = numpy.stack((corners, corners + 1, corners + n + 1, corners + n), axis=1).ravel()
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(n * n)
+    mesh.vertices.foreach_set('co', positions.ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set('vertex_index', loops.astype(numpy.int32))
+    mesh.polygons.add(len(corners))
+    mesh.polygons.foreach_set('loop_start', numpy.arange(0, len(loops), 4, dtype=numpy.int32))
+    mesh.polygons.foreach_set('loop_total', numpy.full(len(corners), 4, dtype=numpy.int32))
+    mesh.polygons.foreach_set('use_smooth', numpy.ones(len(corners), dtype=numpy.bool_))
+    uvLayer = mesh.uv_layers.new()
+    uvLayer.data.foreach_set('uv', ((positions[loops, :2] / size) + 0.5).ravel())
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    return mesh
+
+def add_object(scene, name, data):
+    obj = bpy.data.objects.new(name, data)
+    scene.collection.objects.link(obj)
+    return obj
+
+def build_dense_grid(scene, scale):
+    mesh = create_grid_mesh("DenseGrid", int(1000 * math.sqrt(scale)))
+    mesh.materials.append(create_material("Grid"))
+    add_object(scene, "DenseGrid", mesh)
+
+def build_many_instances(scene, scale):
+    mesh = create_grid_mesh("InstancedGrid", 8, 1.0)
+    mesh.materials.append(create_material("Instance"))
+    count = int(20000 * scale)
+    random = numpy.random.RandomState(42)
+    offsets = random.uniform(-100.0, 100.0, (count, 3))
+    for i in range(count):
+        obj = add_object(scene, "Instance%d"%(i), mesh)
+        obj.location = offsets[i]
+        obj.rotation_euler = (0.0, 0.0, offsets[i][0])
+
+def build_many_materials(scene, scale):
+    mesh = create_grid_mesh("MaterialGrid", int(500 * math.sqrt(scale)))
+    materialCount = 200
+    for i in range(materialCount):
+        mesh.materials.append(create_material("Material%d"%(i)))
+    materialIndices = numpy.arange(len(mesh.polygons), dtype=numpy.int32) % materialCount
+    mesh.polygons.foreach_set('material_index', materialIndices)
+    add_object(scene, "MaterialGrid", mesh)
+
+def build_skinned_mesh(scene, scale):
+    n = int(300 * math.sqrt(scale))
+    boneCount = 64
+    scene.frame_end = 50
+    armature = bpy.data.armatures.new("Rig")
+    rig = add_object(scene, "Rig", armature)
+    bpy.context.view_layer.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+    for b in range(boneCount):
+        bone = armature.edit_bones.new("Bone%d"%(b))
+        bone.head = (-5.0 + 10.0 * b / boneCount, 0.0, 0.0)
+        bone.tail = (-5.0 + 10.0 * (b + 1) / boneCount, 0.0, 0.0)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    for b, poseBone in enumerate(rig.pose.bones):
+        for frame in (scene.frame_start, scene.frame_end):
+            poseBone.rotation_quaternion = (1.0, 0.0, 0.0, 0.0) if frame == scene.frame_start else (0.9, 0.1 * (b % 3), 0.0, 0.0)
+            poseBone.keyframe_insert('rotation_quaternion', frame=frame)
+
+    mesh = create_grid_mesh("SkinnedGrid", n)
+    mesh.materials.append(create_material("Skin"))
+    obj = add_object(scene, "SkinnedGrid", mesh)
+    obj.parent = rig
+    obj.modifiers.new("Armature", 'ARMATURE').object = rig
+    # Every vertex is influenced by the two bones closest along x
+    xs = get_vertex_x(mesh)
+    boneCoords = (xs + 5.0) / 10.0 * boneCount
+    for b in range(boneCount):
+        group = obj.vertex_groups.new(name="Bone%d"%(b))
+        distance = numpy.abs(boneCoords - (b + 0.5))
+        influenced = numpy.nonzero(distance < 1.0)[0]
+        for weight in numpy.unique(numpy.round(1.0 - distance[influenced], 2)):
+            group.add(influenced[numpy.round(1.0 - distance[influenced], 2) == weight].tolist(), float(weight), 'REPLACE')
+
+def get_vertex_x(mesh):
+    positions = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get('co', positions)
+    return positions[0::3]
+
+def build_deforming_mesh(scene, scale):
+    scene.frame_end = max(2, int(10 * scale))
+    mesh = create_grid_mesh("Cloth", int(100 * math.sqrt(scale)), 2.0)
+    mesh.materials.append(create_material("Cloth"))
+    obj = add_object(scene, "Cloth", mesh)
+    obj.location = (0.0, 0.0, 2.0)
+    obj.modifiers.new("Cloth", 'CLOTH')
+
+Scenario = collections.namedtuple('Scenario', ['name', 'build', 'options'])
+SCENARIOS = [
+    Scenario("dense_grid", build_dense_grid, {}),
+    Scenario("dense_grid_compressed_deflated", build_dense_grid, {'use_compression': True, 'use_deflation': True}),
+    Scenario("many_instances", build_many_instances, {}),
+    Scenario("many_materials", build_many_materials, {}),
+    Scenario("skinned_mesh", build_skinned_mesh, {'export_animation': True}),
+    Scenario("deforming_frames", build_deforming_mesh, {'export_animation': True}),
+]
+
+
+#   Measurements
+
+def get_mesh_vertex_count():
+    return sum(len(obj.data.vertices) for obj in bpy.data.objects if exporter.is_instance(obj) and obj.type == 'MESH')
+
+def make_result(seconds, vertexCount, byteCount):
+    result = collections.OrderedDict()
+    result['seconds'] = seconds
+    result['vertices'] = vertexCount
+    result['bytes'] = byteCount
+    result['vertices_per_second'] = vertexCount / seconds if seconds > 0 else 0.0
+    result['mb_per_second'] = byteCount / (1024 * 1024) / seconds if seconds > 0 else 0.0
+    return result
+
+def time_export_json(context, options, binFilepath):
+    start = time.perf_counter()
+    if exporter.export_json(context, options, binFilepath) != 0:
+        raise Exception("export_json failed")
+    return make_result(time.perf_counter() - start, 0, os.path.getsize(options.filepath))
+
+def time_export_binary(context, options, binFilepath):
+    start = time.perf_counter()
+    if exporter.export_binary(context, options, binFilepath) != 0:
+        raise Exception("export_binary failed")
+    return make_result(time.perf_counter() - start, get_mesh_vertex_count(), os.path.getsize(binFilepath))
+
+def get_material_lookup():
+    return collections.OrderedDict((material.name, i) for i, material in enumerate(bpy.data.materials))
+
+# Records the bone poses and instance transformations the binary writers read
+def get_binary_frame_sweep(context, options):
+    frameSweep = exporter.FrameSweep(context.scene, exporter.get_export_frame_range(options, context.scene))
+    exporter.add_binary_samplers(options, frameSweep)
+    frameSweep.run()
+    return frameSweep
+
+def time_frame_sweep(context, options):
+    start = time.perf_counter()
+    frameSweep = exporter.FrameSweep(context.scene, exporter.get_export_frame_range(options, context.scene))
+    exporter.add_json_samplers(options, frameSweep)
+    exporter.add_binary_samplers(options, frameSweep)
+    frameSweep.run()
+    return make_result(time.perf_counter() - start, 0, 0)
+
+def time_write_mesh_lod(context, options):
+    depsgraph = context.evaluated_depsgraph_get()
+    materialLookup = get_material_lookup()
+    boneLookup = exporter.write_animation_binary(options, context, exporter.ObjectBinary(), get_binary_frame_sweep(context, options))
+    deflationPool = exporter.DeflationPool() if options.use_deflation else None
+    seconds = 0.0
+    vertexCount = 0
+    byteCount = 0
+    for obj in {o.data: o for o in bpy.data.objects if exporter.is_instance(o) and o.type == 'MESH'}.values():
+        binary = exporter.ObjectBinary(deflationPool)
+        mesh, splitMesh = exporter.prepare_object_mesh(options, depsgraph, obj)
+        start = time.perf_counter()
+        exporter.write_mesh_lod(options, obj, 0, 0, mesh, splitMesh, binary, materialLookup, boneLookup)
+        byteCount += len(binary)
+        seconds += time.perf_counter() - start
+        vertexCount += len(splitMesh.vertexIndices)
+    if deflationPool is not None:
+        deflationPool.shutdown()
+    return make_result(seconds, vertexCount, byteCount)
+
+def time_write_animation_binary(context, options):
+    frameSweep = get_binary_frame_sweep(context, options)
+    binary = exporter.ObjectBinary()
+    start = time.perf_counter()
+    exporter.write_animation_binary(options, context, binary, frameSweep)
+    return make_result(time.perf_counter() - start, 0, len(binary))
+
+def time_write_instances(context, options):
+    frameSweep = get_binary_frame_sweep(context, options)
+    instances, animationObjects = exporter.get_exported_instances(options)
+    exportedObjects = collections.OrderedDict()
+    for obj in instances:
+        exportedObjects.setdefault(obj.data, len(exportedObjects))
+    binary = exporter.ObjectBinary()
+    start = time.perf_counter()
+    exporter.write_instances(options, binary, instances, animationObjects, exportedObjects, frameSweep)
+    return make_result(time.perf_counter() - start, 0, len(binary))
+
+def run_scenario(scenario, scale, repeat, directory):
+    print("Benchmarking '%s'..."%(scenario.name))
+    reset_scene()
+    scenario.build(bpy.context.scene, scale)
+    context = bpy.context
+    options = BenchmarkOptions(os.path.join(directory, scenario.name + ".json"), **scenario.options)
+    binFilepath = os.path.join(directory, scenario.name + ".mff")
+    timers = collections.OrderedDict([
+        ('frame_sweep', lambda: time_frame_sweep(context, options)),
+        ('export_json', lambda: time_export_json(context, options, binFilepath)),
+        ('export_binary', lambda: time_export_binary(context, options, binFilepath)),
+        ('write_mesh_lod', lambda: time_write_mesh_lod(context, options)),
+        ('write_animation_binary', lambda: time_write_animation_binary(context, options)),
+        ('write_instances', lambda: time_write_instances(context, options)),
+    ])
+    results = collections.OrderedDict()
+    for name, timer in timers.items():
+        # Keep the fastest run to reduce noise
+        results[name] = min((timer() for i in range(repeat)), key=lambda r: r['seconds'])
+        print("  %-24s %9.3f s %14.0f vertices/s %9.2f MB/s"%(name, results[name]['seconds'],
+                                                             results[name]['vertices_per_second'], results[name]['mb_per_second']))
+    return results
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark of the Mufflon exporter")
+    parser.add_argument("--output", default="bench_output.json", help="JSON file for the results")
+    parser.add_argument("--scale", type=float, default=1.0, help="Scales the size of the synthetic scenes")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per measurement (the fastest is kept)")
+    parser.add_argument("--scenario", action='append', default=[], help="Run only the given scenario (repeatable)")
+    args = parser.parse_args(argv)
+
+    try:
+        exporter.register()
+    except ValueError:
+        pass # Already registered (e.g. installed as add-on)
+    benchmark = collections.OrderedDict()
+    benchmark['blender'] = bpy.app.version_string
+    benchmark['exporter'] = ".".join(str(v) for v in exporter.bl_info['version'])
+    benchmark['revision'] = get_git_revision()
+    benchmark['scale'] = args.scale
+    benchmark['scenarios'] = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in SCENARIOS:
+            if args.scenario and scenario.name not in args.scenario:
+                continue
+            benchmark['scenarios'][scenario.name] = run_scenario(scenario, args.scale, max(1, args.repeat), directory)
+    with open(args.output, 'w') as file:
+        json.dump(benchmark, file, indent=4)
+    print("Wrote benchmark results to '%s'"%(args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
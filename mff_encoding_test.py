@@ -0,0 +1,116 @@
+
+# Checks the vectorized encoders of mff_exporter_28.py (skinning weights, packed normals) against the
+# per-vertex code they replaced.
+# Works without Blender; the Blender modules the exporter imports are replaced by placeholders:
+#
+#   python mff_encoding_test.py [--seed 0]
+
+import argparse
+import os
+import sys
+import types
+
+import numpy
+
+
+# Attribute access on the placeholder modules yields dummy classes, which is enough to define the
+# exporter's operators and property groups
+class PlaceholderModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return type(name, (), {'__init__': lambda self, *args, **kwargs: None,
+                               '__call__': lambda self, *args, **kwargs: None})
+
+def import_exporter():
+    for name in ['bpy', 'bpy.props', 'bpy.types', 'bpy_extras', 'bpy_extras.io_utils', 'bmesh', 'mathutils']:
+        try:
+            __import__(name)
+        except ImportError:
+            sys.modules[name] = PlaceholderModule(name)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import mff_exporter_28
+    return mff_exporter_28
+
+
+#   Skinning weights
+
+# The per-vertex insertion sort of the original exporter
+def encode_skinning_weights_scalar(offsets, groups, weights, groupBones):
+    codes = []
+    for v in range(len(offsets) - 1):
+        vertexWeights = [0, 0, 0, 0]
+        idx = [0x003fffff, 0x003fffff, 0x003fffff, 0x003fffff]
+        for g in range(offsets[v], offsets[v + 1]):
+            w = weights[g]
+            b = int(groupBones[groups[g]])
+            for i in range(4):
+                if w > vertexWeights[i]:
+                    w, vertexWeights[i] = vertexWeights[i], w
+                    b, idx[i] = idx[i], b
+        for i in range(4):
+            codes.append((idx[i] & 0x003fffff) | (round(vertexWeights[i] * 1023) << 22))
+    return numpy.array(codes, dtype=numpy.uint32).reshape(-1, 4)
+
+def test_skinning_weights(exporter, rng, tied):
+    vertexCount = 2000
+    groupCount = 12
+    counts = rng.integers(0, 9, vertexCount)
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    groups = numpy.concatenate([rng.permutation(groupCount)[:count] for count in counts]).astype(numpy.int64)
+    if tied:
+        # Few distinct values so that most vertices with more than 4 groups have ties at the cut-off
+        weights = rng.choice([0.25, 0.5, 0.75, 1.0], len(groups))
+    else:
+        weights = rng.random(len(groups))
+    groupBones = rng.permutation(groupCount).astype(numpy.int64)
+    expected = encode_skinning_weights_scalar(offsets, groups, weights, groupBones)
+    codes = exporter.encode_skinning_weights(offsets, groups, weights, groupBones)
+    mismatches = numpy.flatnonzero(numpy.any(codes != expected, axis=1))
+    wideVertices = numpy.count_nonzero(counts > 4)
+    if len(mismatches) > 0:
+        v = mismatches[0]
+        raise AssertionError("Skinning weights of %d vertices differ, e.g. vertex %d: %s instead of %s"
+                             %(len(mismatches), v, codes[v], expected[v]))
+    print("Skinning weights%s: %d vertices (%d with more than 4 groups) match"%(" (tied)" if tied else "", vertexCount, wideVertices))
+
+
+#   Normals
+
+def test_normals(exporter, rng):
+    normals = rng.normal(size=(10000, 3))
+    normals /= numpy.linalg.norm(normals, axis=1)[:, numpy.newaxis]
+    specialCases = [(0.0, 0.0, 0.0), (-0.0, -0.0, -0.0)]
+    # Axes and the diagonals between them, including signed zeros in both hemispheres
+    for x in (-1.0, -0.0, 0.0, 1.0):
+        for y in (-1.0, -0.0, 0.0, 1.0):
+            for z in (-1.0, -0.0, 0.0, 1.0):
+                specialCases.append((x, y, z))
+    # Lower hemisphere with every sign combination of x and y
+    for x in (-0.6, 0.6):
+        for y in (-0.48, 0.48):
+            specialCases.append((x, y, -0.64))
+    normals = numpy.concatenate((normals, numpy.array(specialCases)))
+    expected = numpy.array([exporter.pack_normal32(normal) for normal in normals.tolist()], dtype=numpy.uint32)
+    codes = exporter.pack_normals32(normals)
+    mismatches = numpy.flatnonzero(codes != expected)
+    if len(mismatches) > 0:
+        n = mismatches[0]
+        raise AssertionError("%d normals are packed differently, e.g. %s: 0x%08x instead of 0x%08x"
+                             %(len(mismatches), normals[n], codes[n], expected[n]))
+    print("Normals: %d packed codes match"%(len(normals)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the exporter's vectorized encoders")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    exporter = import_exporter()
+    rng = numpy.random.default_rng(args.seed)
+    test_skinning_weights(exporter, rng, False)
+    test_skinning_weights(exporter, rng, True)
+    test_normals(exporter, rng)
+
+
+if __name__ == "__main__":
+    main()
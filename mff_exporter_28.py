@@ -11,6 +11,15 @@ import struct
 import numpy
 import math
 import zlib
+import concurrent.futures
+import hashlib
+import contextlib
+import threading
+import time
+import shutil
+import subprocess
+import sys
+import tempfile
 from collections import OrderedDict
 import re
 from enum import Enum
@@ -91,6 +100,154 @@ def remove_known_matkeys(json_material):
         json_material.pop(key, None)
 
 
+# Node properties which do not influence the baked result
+ignoredNodeProperties = {'rna_type', 'name', 'label', 'location', 'width', 'width_hidden', 'height', 'dimensions',
+                         'select', 'show_options', 'show_preview', 'show_texture', 'hide', 'mute', 'color',
+                         'use_custom_color', 'parent', 'internal_links', 'inputs', 'outputs', 'type', 'bl_idname',
+                         'bl_label', 'bl_description', 'bl_icon', 'bl_static_type', 'bl_width_default',
+                         'bl_width_min', 'bl_width_max', 'bl_height_default', 'bl_height_min', 'bl_height_max'}
+
+# Property values as plain Python values (bpy arrays only repr their data path)
+def get_hashable_value(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, set):
+        return sorted(value)
+    if hasattr(value, '__len__'):
+        return tuple(value)
+    return value
+
+# State of an image which a bake depends on: the content of the file behind it rather than just its path.
+# Returns None for images with unsaved changes since those cannot be tracked across exports
+def get_image_state(image):
+    if image.is_dirty:
+        return None
+    if image.packed_file is not None:
+        return (image.source, 'packed', image.packed_file.size)
+    if image.source == 'GENERATED':
+        return (image.source, image.generated_type, image.generated_width, image.generated_height,
+                tuple(image.generated_color), image.use_generated_float)
+    path = bpy.path.abspath(image.filepath, library=image.library)
+    try:
+        fileStat = os.stat(path)
+    except OSError:
+        return (image.source, image.filepath, None)
+    return (image.source, image.filepath, fileStat.st_mtime_ns, fileStat.st_size)
+
+# Feeds a shader node's settings, its unconnected input values and (recursively) everything linked
+# into it into the hasher. Returns False if the result must not be cached
+def hash_shader_node(hasher, node, visited):
+    if node in visited:
+        hasher.update(("@" + node.name).encode())
+        return True
+    visited.add(node)
+    cacheable = True
+    hasher.update(node.bl_idname.encode())
+    for prop in node.bl_rna.properties:
+        if prop.identifier in ignoredNodeProperties:
+            continue
+        value = getattr(node, prop.identifier, None)
+        if prop.type == 'POINTER':
+            if isinstance(value, bpy.types.NodeTree):
+                cacheable = hash_shader_node_tree(hasher, value, visited) and cacheable
+            elif isinstance(value, bpy.types.Image):
+                imageState = get_image_state(value)
+                if imageState is None:
+                    cacheable = False
+                hasher.update(repr(imageState).encode())
+            elif value is not None and hasattr(value, 'bl_rna'):
+                # Settings structs like texture mappings or color ramps
+                hasher.update(repr([(p.identifier, get_hashable_value(getattr(value, p.identifier, None)))
+                                    for p in value.bl_rna.properties if p.type != 'POINTER' and p.type != 'COLLECTION']).encode())
+        elif prop.type != 'COLLECTION':
+            hasher.update(repr((prop.identifier, get_hashable_value(value))).encode())
+    # Control points are stored in collections
+    if node.bl_idname == 'ShaderNodeValToRGB':
+        hasher.update(repr([(element.position, element.color[:]) for element in node.color_ramp.elements]).encode())
+    elif node.bl_idname in ('ShaderNodeRGBCurve', 'ShaderNodeVectorCurve', 'ShaderNodeFloatCurve'):
+        hasher.update(repr([[(point.location[:], point.handle_type) for point in curve.points]
+                            for curve in node.mapping.curves]).encode())
+    for socket in node.inputs:
+        if len(socket.links) > 0:
+            link = socket.links[0]
+            hasher.update(repr((socket.identifier, link.from_socket.identifier)).encode())
+            cacheable = hash_shader_node(hasher, link.from_node, visited) and cacheable
+        elif hasattr(socket, 'default_value'):
+            value = socket.default_value
+            hasher.update(repr((socket.identifier, get_hashable_value(value))).encode())
+    return cacheable
+
+# Node groups are hashed as a whole
+def hash_shader_node_tree(hasher, tree, visited):
+    if tree in visited:
+        hasher.update(("@" + tree.name).encode())
+        return True
+    visited.add(tree)
+    cacheable = True
+    for node in tree.nodes:
+        cacheable = hash_shader_node(hasher, node, visited) and cacheable
+    hasher.update(repr([(link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+                        for link in tree.links]).encode())
+    return cacheable
+
+# Bakes of identical node subtrees are shared within an export and reused by later exports as long as
+# the baked file and the subtree hash recorded for it are unchanged
+class BakeCache:
+    def __init__(self, directory, resolution):
+        self.directory = directory
+        self.resolution = resolution
+        self.indexPath = os.path.join(directory, "bake_cache.json")
+        self.bakedFiles = dict()    # Subtree hash -> file name, for this export
+        self.fileHashes = dict()    # File name -> subtree hash
+        if os.path.isfile(self.indexPath):
+            try:
+                with open(self.indexPath, 'r') as indexFile:
+                    self.fileHashes = json.load(indexFile)
+            except ValueError:
+                print("Ignoring broken bake cache index '%s'"%(self.indexPath))
+        self.hitCount = 0
+
+    # Returns None if the subtree depends on state which cannot be hashed (e.g. unsaved image edits)
+    def get_key(self, node, outputName, isScalar, resolution):
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(repr((outputName, isScalar, resolution)).encode())
+        if not hash_shader_node(hasher, node, set()):
+            return None
+        return hasher.hexdigest()
+
+    # Returns the file name of an up-to-date bake with the given key or None
+    def lookup(self, key, fileName):
+        if key is None:
+            return None
+        if key not in self.bakedFiles:
+            candidates = [fileName] + [name for name, fileHash in self.fileHashes.items() if name != fileName]
+            for candidate in candidates:
+                if self.fileHashes.get(candidate) == key and os.path.isfile(os.path.join(self.directory, candidate)):
+                    self.bakedFiles[key] = candidate
+                    break
+            else:
+                return None
+        self.hitCount += 1
+        return self.bakedFiles[key]
+
+    def store(self, key, fileName):
+        if key is None:
+            # The file no longer matches whatever was recorded for it
+            self.fileHashes.pop(fileName, None)
+            self.bakedFiles = {bakeKey: name for bakeKey, name in self.bakedFiles.items() if name != fileName}
+            return
+        self.bakedFiles[key] = fileName
+        self.fileHashes[fileName] = key
+
+    def save(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(self.indexPath, 'w') as indexFile:
+            json.dump(self.fileHashes, indexFile, indent=4)
+
+# Set up by export_json if textures are baked
+bakeCache = None
+
 def bake_texture_node(node, material, outputName, isScalar, bakeTextures):
     fileName = material.name + "_" + node.name + ".png"
     filePath = "//baked_textures//" + fileName
@@ -99,11 +256,18 @@ def bake_texture_node(node, material, outputName, isScalar, bakeTextures):
     if not bakeTextures:
         return filePath
 
+    # Materials may override the export's bake resolution
+    resolution = material.mufflon_bake_resolution if material.mufflon_bake_resolution > 0 else bakeCache.resolution
+    bakeKey = bakeCache.get_key(node, outputName, isScalar, resolution)
+    cachedFileName = bakeCache.lookup(bakeKey, fileName)
+    if cachedFileName is not None:
+        print("Reusing baked texture '%s' for node '%s' of material '%s'"%(cachedFileName, node.name, material.name))
+        return "baked_textures/" + cachedFileName
+
     print("Baking node '%s' of material '%s'"%(node.name, material.name))
-    # TODO: how to allow resolutions other than 1024x1024
-    # TODO: don't bake textures multiple times
-    bakeWidth = 1024
-    bakeHeight = 1024
+    bakeStart = time.perf_counter()
+    bakeWidth = resolution
+    bakeHeight = resolution
     
     # Remember what object to select later
     prevActiveObject = bpy.context.view_layer.objects.active
@@ -157,7 +321,7 @@ def bake_texture_node(node, material, outputName, isScalar, bakeTextures):
     emissiveOutputLink = material.node_tree.links.new(outputNode.inputs['Surface'], emissiveNode.outputs['Emission'])
     
     # Create the directory for the image if necessary
-    imageFolder = os.path.join(os.path.abspath('//'), "baked_textures")
+    imageFolder = bakeCache.directory
     if not os.path.exists(imageFolder):
         os.makedirs(imageFolder)
         
@@ -195,6 +359,8 @@ def bake_texture_node(node, material, outputName, isScalar, bakeTextures):
     bpy.context.view_layer.objects.active = prevActiveObject
     bpy.context.view_layer.update()
     
+    bakeCache.store(bakeKey, fileName)
+    profiler.add('baking', time.perf_counter() - bakeStart)
     return "baked_textures/" + fileName
 
 def property_array_to_color(prop_array):
@@ -522,97 +688,105 @@ def get_light_color_or_temperature(self, light, emissionType, emissionNode):
         color = get_scalar_def_only_input(emissionNode, 'Color')
         return [light.color.r * color[0], light.color.g * color[1], light.color.b * color[2]]
 
-def write_point_light(self, light, lampObject, emissionNode, scene, frame_range):
+# Raises for emission setups the light type cannot export
+def check_light_emission(lamp, emissionNode):
+    if emissionNode is None or get_emission_type(emissionNode) != EmissionType.GONIOMETRIC:
+        return
+    if lamp.type == "POINT":
+        raise Exception("light '%s' is detected to be goniometric (color input other than 'Blackbody'); this is not supported yet!"%(lamp.name))
+    elif lamp.type == "SPOT":
+        raise Exception("spot light '%s' does not support non-scalar or non-black-body emission!"%(lamp.name))
+    elif lamp.type == "SUN":
+        raise Exception("directional light '%s' does not support non-scalar or non-black-body emission!"%(lamp.name))
+
+# Fetches the emission node if the light uses nodes, None otherwise
+def get_light_emission_node(lamp):
+    if not (lamp.use_nodes and lamp.node_tree):
+        return None
+    outputNode = find_light_output_node(lamp)
+    if len(outputNode.inputs['Surface'].links) == 0:
+        raise Exception("light '%s' is missing output link"%(lamp.name))
+    emissionNode = outputNode.inputs['Surface'].links[0].from_node
+    if emissionNode.bl_idname != 'ShaderNodeEmission':
+        raise Exception("light '%s' does not have emission node as last output node (other nodes not yet supported!)"%(lamp.name))
+    return emissionNode
+
+# Color (or temperature) and the factor on the light's energy, with or without emission node
+def get_light_emission(self, light, emissionNode):
+    if emissionNode is None:
+        # TODO: this needs nodes too for goniometric lights!
+        return [light.color.r, light.color.g, light.color.b], 1.0
     emissionType = get_emission_type(emissionNode)
-    if emissionType == EmissionType.GONIOMETRIC:
-        raise Exception("light '%s' is detected to be goniometric (color input other than 'Blackbody'); this is not supported yet!"%(light.name))
-    
-    positions = []
-    fluxes = [] # May also be temperature in case of blackbody
-    scales = []
-    # Go through all frames, accumulate the to-be-exported quantities
-    for f in frame_range:
-        scene.frame_set(f)
-        positions.append(flip_space(lampObject.location))
-        fluxes.append(get_light_color_or_temperature(self, light, emissionType, emissionNode))
-        scales.append(light.energy * get_scalar_def_only_input(emissionNode, 'Strength'))
-        if light.shadow_soft_size != 0.0:
-            self.report({'WARNING'}, ("Point light '%s' has non-zero size, which is not supported!" % (light.name)))
-    dict = collections.OrderedDict()
-    dict['type'] = "point"
-    dict['type'] = "point"
-    dict['position'] = junction_path(positions)
-    if emissionType == EmissionType.BLACKBODY:
-        dict['temperature'] = junction_path(fluxes)
+    return get_light_color_or_temperature(self, light, emissionType, emissionNode), get_scalar_def_only_input(emissionNode, 'Strength')
+
+# The sample_* functions record the time-varying quantities of an entity at the current frame;
+# they are evaluated by the FrameSweep
+def sample_point_light(self, light, lampObject, emissionNode):
+    flux, strength = get_light_emission(self, light, emissionNode)
+    if emissionNode is not None and light.shadow_soft_size != 0.0:
+        self.report({'WARNING'}, ("Point light '%s' has non-zero size, which is not supported!" % (light.name)))
+    return flip_space(lampObject.location), flux, light.energy * strength
+
+def sample_spot_light(self, light, lampObject, emissionNode):
+    intensity, strength = get_light_emission(self, light, emissionNode)
+    if emissionNode is None:
+        scale = light.energy
     else:
-        dict['flux'] = junction_path(fluxes)
-    dict['scale'] = junction_path(scales)
-    return dict
-
-def write_spot_light(self, light, lampObject, emissionNode, scene, frame_range):
-    emissionType = get_emission_type(emissionNode)
-    if emissionType == EmissionType.GONIOMETRIC:
-        raise Exception("spot light '%s' does not support non-scalar or non-black-body emission!"%(light.name))
-    
-    positions = []
-    directions = []
-    intensities = [] # May also be temperature in case of blackbody
-    scales = []
-    widths = []
-    falloffs = []
-    # Go through all frames, accumulate the to-be-exported quantities
-    for f in frame_range:
-        scene.frame_set(f)
-        positions.append(flip_space(lampObject.location))
-        directions.append(flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))))
-        intensities.append(get_light_color_or_temperature(self, light, emissionType, emissionNode))
-        widths.append(light.spot_size / 2)
-        # Try to match the inner circle for the falloff (not exact, blender seems buggy):
-        # https://blender.stackexchange.com/questions/39555/how-to-calculate-blend-based-on-spot-size-and-inner-cone-angle
-        falloffs.append(math.atan(math.tan(light.spot_size / 2) * math.sqrt(1-light.spot_blend)))
         # We have to convert the flux as defined by blender to the peak intensity
         # To retain the same brightness impression, blender always distributes the flux
         # on the unit sphere and culls the parts which are not in the spot, leaving
         # an equal intensity when changing the spot size
-        flux = light.energy * get_scalar_def_only_input(emissionNode, 'Strength')
-        scales.append(flux / (4.0 * math.pi))
+        scale = light.energy * strength / (4.0 * math.pi)
         if light.shadow_soft_size != 0.0:
             self.report({'WARNING'}, ("Spot light '%s' has non-zero size, which is not supported!" % (light.name)))
+    # Try to match the inner circle for the falloff (not exact, blender seems buggy):
+    # https://blender.stackexchange.com/questions/39555/how-to-calculate-blend-based-on-spot-size-and-inner-cone-angle
+    falloff = math.atan(math.tan(light.spot_size / 2) * math.sqrt(1-light.spot_blend))
+    return (flip_space(lampObject.location), flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))),
+            intensity, scale, light.spot_size / 2, falloff)
+
+def sample_directional_light(self, light, lampObject, emissionNode):
+    radiance, strength = get_light_emission(self, light, emissionNode)
+    return flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))), radiance, light.energy * strength
+
+def sample_camera(cameraObject):
+    trans, rot, scale = cameraObject.matrix_world.decompose()
+    return flip_space(cameraObject.location), flip_space(rot @ Vector((0.0, 0.0, -1.0))), flip_space(rot @ Vector((0.0, 1.0, 0.0)))
+
+# Name of the emission entry; lights without nodes always export an RGB value
+def get_light_emission_key(emissionNode, colorKey):
+    if emissionNode is not None and get_emission_type(emissionNode) == EmissionType.BLACKBODY:
+        return 'temperature'
+    return colorKey
+
+def write_point_light(self, light, emissionNode, samples):
+    positions, fluxes, scales = zip(*samples)   # Fluxes may also be temperatures in case of blackbody
+    dict = collections.OrderedDict()
+    dict['type'] = "point"
+    dict['position'] = junction_path(list(positions))
+    dict[get_light_emission_key(emissionNode, 'flux' if emissionNode is not None else 'intensity')] = junction_path(list(fluxes))
+    dict['scale'] = junction_path(list(scales))
+    return dict
+
+def write_spot_light(self, light, emissionNode, samples):
+    positions, directions, intensities, scales, widths, falloffs = zip(*samples)
     dict = collections.OrderedDict()
     dict['type'] = "spot"
-    dict['position'] = junction_path(positions)
-    dict['direction'] = junction_path(directions)
-    if emissionType == EmissionType.BLACKBODY:
-        dict['temperature'] = junction_path(intensities)
-    else:
-        dict['intensity'] = junction_path(intensities)
-    dict['scale'] = junction_path(scales)
-    dict['width'] = junction_path(widths)
-    dict['falloffStart'] = junction_path(falloffs)
+    dict['position'] = junction_path(list(positions))
+    dict['direction'] = junction_path(list(directions))
+    dict[get_light_emission_key(emissionNode, 'intensity')] = junction_path(list(intensities))
+    dict['scale'] = junction_path(list(scales))
+    dict['width'] = junction_path(list(widths))
+    dict['falloffStart'] = junction_path(list(falloffs))
     return dict
     
-def write_directional_light(self, light, lampObject, emissionNode, scene, frame_range):
-    emissionType = get_emission_type(emissionNode)
-    if emissionType == EmissionType.GONIOMETRIC:
-        raise Exception("directional light '%s' does not support non-scalar or non-black-body emission!"%(light.name))
-    
-    directions = []
-    radiances = [] # May also be temperature in case of blackbody
-    scales = []
-    # Go through all frames, accumulate the to-be-exported quantities
-    for f in frame_range:
-        scene.frame_set(f)
-        directions.append(flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))))
-        radiances.append(get_light_color_or_temperature(self, light, emissionType, emissionNode))
-        scales.append(light.energy * get_scalar_def_only_input(emissionNode, 'Strength'))
+def write_directional_light(self, light, emissionNode, samples):
+    directions, radiances, scales = zip(*samples)
     dict = collections.OrderedDict()
     dict['type'] = "directional"
-    dict['direction'] = junction_path(directions)
-    if emissionType == EmissionType.BLACKBODY:
-        dict['temperature'] = junction_path(radiances)
-    else:
-        dict['radiance'] = junction_path(radiances)
-    dict['scale'] = junction_path(scales)
+    dict['direction'] = junction_path(list(directions))
+    dict[get_light_emission_key(emissionNode, 'radiance')] = junction_path(list(radiances))
+    dict['scale'] = junction_path(list(scales))
     return dict
 
 def write_background(self, outNodeInput):
@@ -694,10 +868,134 @@ def junction_path(path):
     return path
     
 
+def get_export_frame_range(self, scene):
+    return range(scene.frame_start, scene.frame_end + 1) if self.export_animation else [scene.frame_current]
+
+# Walks the frame range exactly once and records the time-varying data of all entities.
+# Samplers are registered per entity (camera, light, instance, bones) before run(); each one is
+# called at every frame and its results are collected in a per-entity list, ordered by frame.
+class FrameSweep:
+    def __init__(self, scene, frame_range):
+        self.scene = scene
+        self.frames = list(frame_range)
+        self.samplers = OrderedDict()   # Entity key -> function returning the data of the current frame
+        self.samples = dict()           # Entity key -> [data per frame]
+
+    def add(self, key, sampler):
+        self.samplers[key] = sampler
+
+    def run(self):
+        if not self.samplers:
+            return
+        frameCurrent = self.scene.frame_current
+        for key in self.samplers:
+            self.samples[key] = []
+        for f in self.frames:
+            self.scene.frame_set(f)
+            for key, sampler in self.samplers.items():
+                self.samples[key].append(sampler())
+        if frameCurrent != self.scene.frame_current:
+            self.scene.frame_set(frameCurrent)
+
+    def get(self, key):
+        return self.samples[key]
+
+# Collects wall-clock times and byte counts of the export phases and of every exported object.
+# Phases may be nested (e.g. mesh preparation happens during serialization); deflation times
+# are summed over all worker threads.
+class ExportProfiler:
+    def __init__(self):
+        self.phases = OrderedDict()     # Phase name -> [seconds, bytes, calls]
+        self.objects = []               # (object name, seconds, bytes, cached)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name, byteCount=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, byteCount)
+
+    def add(self, name, seconds, byteCount=0):
+        with self.lock:
+            entry = self.phases.setdefault(name, [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += byteCount
+            entry[2] += 1
+
+    def add_object(self, name, seconds, byteCount, cached):
+        self.objects.append((name, seconds, byteCount, cached))
+
+    def summary(self):
+        lines = ["%-20s %10s %14s %8s"%("Phase", "Time [s]", "Bytes", "Calls")]
+        for name, (seconds, byteCount, calls) in self.phases.items():
+            lines.append("%-20s %10.3f %14d %8d"%(name, seconds, byteCount, calls))
+        if self.objects:
+            lines.append("Slowest objects:")
+            for name, seconds, byteCount, cached in sorted(self.objects, key=lambda o: o[1], reverse=True)[:10]:
+                lines.append("  %-38s %10.3f %14d%s"%(name, seconds, byteCount, " (cached)" if cached else ""))
+        return "\n".join(lines)
+
+    def write_json(self, filepath, settings):
+        profile = collections.OrderedDict()
+        profile['blender'] = bpy.app.version_string
+        profile['exporter'] = ".".join(str(v) for v in bl_info['version'])
+        profile['settings'] = settings
+        profile['phases'] = collections.OrderedDict(
+            (name, {'seconds': seconds, 'bytes': byteCount, 'calls': calls}) for name, (seconds, byteCount, calls) in self.phases.items())
+        profile['objects'] = [{'name': name, 'seconds': seconds, 'bytes': byteCount, 'cached': cached}
+                              for name, seconds, byteCount, cached in self.objects]
+        with open(filepath, 'w') as file:
+            json.dump(profile, file, indent=4)
+
+# Profiler of the running export; replaced at the start of every export
+profiler = ExportProfiler()
+
 # Overwrite a numeric value within a bytearray
 def write_num(binary, offset, size, num):
     binary[offset : offset+size] = num.to_bytes(size, byteorder='little')
 
+# File-backed replacement for the binary bytearray: data is appended to disk directly and
+# values already written (offsets, counts) are patched by seeking back. This keeps the peak memory
+# bounded by the largest single object instead of the entire file.
+# The data goes to a temporary file which only replaces the target once it is complete, so a failed
+# export leaves the previous file intact.
+class StreamingBinary:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.tempPath = filepath + ".tmp"
+        self.file = open(self.tempPath, 'wb')
+        self.size = 0
+
+    def extend(self, data):
+        with profiler.phase('file write', len(data)):
+            self.file.write(data)
+        self.size += len(data)
+
+    def __len__(self):
+        return self.size
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, slice) or key.start is None or key.stop - key.start != len(value):
+            raise Exception("Streamed binary can only be patched by slices of unchanged size")
+        if key.stop > self.size:
+            raise Exception("Cannot patch the streamed binary past its end (%d > %d)"%(key.stop, self.size))
+        with profiler.phase('file write'):
+            self.file.seek(key.start)
+            self.file.write(value)
+            self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tempPath, self.filepath)
+
+    # Drops the partially written data without touching the target file
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
 
 
 # If the object has LoDs there are two options:
@@ -730,29 +1028,40 @@ def is_instance(obj):
 
 
 
-def write_vertex_normals(vertexDataArray, mesh, use_compression):
-    if mesh.has_custom_normals:
-        # Create a lookuptable vertex -> any loop
-        loopNormals = [None] * len(mesh.vertices)
-        for i,l in enumerate(mesh.loops):
-            loopNormals[l.vertex_index] = l.normal
-        # Write out the normals
-        for k in range(len(mesh.vertices)):
-            # Sometimes not all vertices have custom normals (I suspect due to left-over vertices no longer in any face)
-            if loopNormals[k] is None:
-                normal = mesh.vertices[k].normal
-            else:
-                normal = loopNormals[k]
-            if use_compression:
-                vertexDataArray.extend(pack_normal32(normal).to_bytes(4, byteorder='little', signed=False))
-            else:
-                vertexDataArray.extend(struct.pack('<3f', *normal))
+# Reads a float property of every element in a bpy collection into a contiguous (N, components) array
+def get_float_array(collection, attribute, components):
+    data = numpy.empty(len(collection) * components, dtype=numpy.float32)
+    collection.foreach_get(attribute, data)
+    return data.reshape(-1, components)
+
+# Integer/boolean counterpart to get_float_array; the dtype has to match the property for the fast path
+def get_int_array(collection, attribute, components=1, dtype=numpy.int32):
+    data = numpy.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(attribute, data)
+    return data.reshape(-1, components) if components > 1 else data
+
+def get_loop_vertex_indices(mesh):
+    return get_int_array(mesh.loops, 'vertex_index')
+
+# Gathers per-loop data for the exported vertices; vertices without any loop get zeros
+def gather_loop_attribute(loopData, vertexLoops):
+    vertexData = numpy.zeros((len(vertexLoops), loopData.shape[1]), dtype=numpy.float32)
+    hasLoop = vertexLoops >= 0
+    vertexData[hasLoop] = loopData[vertexLoops[hasLoop]]
+    return vertexData
+
+def get_vertex_normals(mesh, splitMesh):
+    # Vertices without any loop keep their vertex normal, all others take the (split) loop normal
+    normals = get_float_array(mesh.vertices, 'normal', 3)[splitMesh.vertexIndices]
+    hasLoop = splitMesh.vertexLoops >= 0
+    normals[hasLoop] = get_float_array(mesh.loops, 'normal', 3)[splitMesh.vertexLoops[hasLoop]]
+    return normals
+
+def write_vertex_normals(vertexDataArray, normals, use_compression):
+    if use_compression:
+        vertexDataArray.extend(pack_normals32(normals).astype('<u4').tobytes())
     else:
-        for k in range(len(mesh.vertices)):
-            if use_compression:
-                vertexDataArray.extend(pack_normal32(mesh.vertices[k].normal).to_bytes(4, byteorder='little', signed=False))
-            else:
-                vertexDataArray.extend(struct.pack('<3f', *mesh.vertices[k].normal))
+        vertexDataArray.extend(normals.astype('<f4').tobytes())
 
 # Check if the transformation is valid. In case of spheres there should not be a rotation or
 # non-uniform scaling.
@@ -766,26 +1075,66 @@ def validate_transformation(self, instance):
     else:
         return instance.matrix_world
         
-# Computes the UV coordinate of a vertex based on spherical projection
-def spherical_projected_uv_coordinate(vertexCoords):
-    theta = math.acos(vertexCoords[1]/((1e-20 + math.sqrt((vertexCoords[0]*vertexCoords[0]) + (vertexCoords[1]*vertexCoords[1]) + (vertexCoords[2]*vertexCoords[2])))))
-    phi = numpy.arctan2(vertexCoords[2], vertexCoords[0])
-    if theta < 0:
-        theta += math.pi
-    if(phi < 0):
-        phi += 2*math.pi
+# Computes the UV coordinates of (N, 3) vertex positions based on spherical projection
+def spherical_projected_uv_coordinates(vertexCoords):
+    coords = vertexCoords.astype(numpy.float64)
+    x, y, z = coords[:, 0], coords[:, 1], coords[:, 2]
+    theta = numpy.arccos(y / (1e-20 + numpy.sqrt((x*x) + (y*y) + (z*z))))
+    phi = numpy.arctan2(z, x)
+    phi[phi < 0] += 2*math.pi
     u = theta / math.pi
     v = phi / (2*math.pi)
-    return [u, v]
+    return numpy.stack((u, v), axis=1).astype(numpy.float32)
 
-def write_instance_transformation(binary, transformMat):
+# Writes instances in bulk. names are the encoded instance names, objectIndices and keyframes are
+# scalars or (N,) arrays and transforms are (N, 4, 4) instance-to-world matrices.
+def write_instance_records(binary, names, objectIndices, keyframes, transforms):
+    if len(names) == 0:
+        return
     # As of version 1.4 we store the inverted matrices (ie. world-to-instance instead of instance-to-world)
-    invTransformMat = mathutils.Matrix([ transformMat[0], transformMat[2], -transformMat[1], transformMat[3] ])
-    invTransformMat.invert()
     # Apply the flip_space transformation on instance transformation level.
-    binary.extend(struct.pack('<4f', *invTransformMat[0]))
-    binary.extend(struct.pack('<4f', *invTransformMat[1]))
-    binary.extend(struct.pack('<4f', *invTransformMat[2]))
+    flipped = numpy.stack((transforms[:, 0], transforms[:, 2], -transforms[:, 1], transforms[:, 3]), axis=1)
+    inverted = numpy.linalg.inv(flipped)[:, :3]
+    nameLengths = set(len(name) for name in names)
+    fixedNames = len(nameLengths) == 1
+    if fixedNames:
+        # Equally long names (e.g. instancer output): every instance is one fixed-size record
+        nameLength = nameLengths.pop()
+        recordType = numpy.dtype([('nameLength', '<u4'), ('name', 'S%d'%(nameLength)), ('object', '<u4'),
+                                  ('keyframe', '<u4'), ('instanceId', '<u4'), ('transformation', '<f4', (3, 4))])
+        records = numpy.empty(len(names), dtype=recordType)
+        records['nameLength'] = nameLength
+        records['name'] = names
+    else:
+        recordType = numpy.dtype([('object', '<u4'), ('keyframe', '<u4'), ('instanceId', '<u4'),
+                                  ('transformation', '<f4', (3, 4))])
+        records = numpy.empty(len(names), dtype=recordType)
+    records['object'] = objectIndices
+    records['keyframe'] = keyframes
+    records['instanceId'] = 0xFFFFFFFF  # TODO Instance ID
+    records['transformation'] = inverted
+    if fixedNames:
+        binary.extend(records.tobytes())
+    else:
+        # Only the variable-length names are interleaved in Python
+        data = records.tobytes()
+        size = recordType.itemsize
+        binary.extend(b''.join(len(name).to_bytes(4, byteorder='little') + name + data[i*size : (i+1)*size]
+                               for i, name in enumerate(names)))
+
+# World matrices of the given objects as (N, 4, 4) array, read from bpy.data.objects in one call
+def get_world_matrices(self, objects):
+    matrices = numpy.empty(len(bpy.data.objects) * 16, dtype=numpy.float32)
+    bpy.data.objects.foreach_get('matrix_world', matrices)
+    # Blender stores matrices column-major
+    matrices = matrices.reshape(-1, 4, 4).transpose(0, 2, 1).astype(numpy.float64)
+    objectPositions = {obj: i for i, obj in enumerate(bpy.data.objects)}
+    worldMatrices = matrices[[objectPositions[obj] for obj in objects]] if objects else numpy.empty((0, 4, 4))
+    for i, obj in enumerate(objects):
+        # Perfect spheres ignore rotation and non-uniform scaling
+        if obj.mufflon_sphere:
+            worldMatrices[i] = validate_transformation(self, obj)
+    return worldMatrices
 
 def is_animated_instance(instance):
     # Check if there is an animation block or constraints
@@ -800,6 +1149,9 @@ def is_animated_instance(instance):
     return False
     
 def get_blender_viewport_near_far_planes(context):
+    # Without any window (background mode) fall back to the viewport defaults
+    if len(context.window_manager.windows) == 0:
+        return 0.01, 1000.0
     # Try to find a suitable area
     ctxArea = None
     for window in context.window_manager.windows:
@@ -823,10 +1175,30 @@ def get_blender_viewport_near_far_planes(context):
     return clipStart, clipEnd
 
 
-def export_json(context, self, binfilepath):
+# Registers the samplers of the cameras and lights exported by export_json
+def add_json_samplers(self, frameSweep):
+    for cameraObject in [o for o in bpy.data.objects if o.type == 'CAMERA']:
+        if cameraObject.data.users != 0 and cameraObject.data.type in ["PERSP", "ORTHO"]:
+            frameSweep.add(('camera', cameraObject.name), lambda cameraObject=cameraObject: sample_camera(cameraObject))
+    samplers = {"POINT": sample_point_light, "SPOT": sample_spot_light, "SUN": sample_directional_light}
+    for lampObject in [o for o in bpy.data.objects if o.type == 'LIGHT']:
+        lamp = lampObject.data
+        if lamp.users != 0 and lamp.type in samplers:
+            emissionNode = get_light_emission_node(lamp)
+            check_light_emission(lamp, emissionNode)
+            frameSweep.add(('light', lampObject.name), lambda sampler=samplers[lamp.type], lamp=lamp, lampObject=lampObject, emissionNode=emissionNode:
+                           sampler(self, lamp, lampObject, emissionNode))
+
+# Exports the JSON part; frameSweep may be shared with export_binary, otherwise a sweep over
+# the cameras and lights is run here
+def export_json(context, self, binfilepath, frameSweep=None):
     version = "1.6"
     binary = os.path.relpath(binfilepath, os.path.commonpath([self.filepath, binfilepath]))
     global rootFilePath; rootFilePath = os.path.dirname(self.filepath)
+    global bakeCache; bakeCache = None
+    if self.bake_textures:
+        # Same folder the baked images are saved to (relative to the .blend file)
+        bakeCache = BakeCache(bpy.path.abspath("//baked_textures"), self.bake_resolution)
 
     scn = context.scene
     dataDictionary = collections.OrderedDict()
@@ -860,9 +1232,10 @@ def export_json(context, self, binfilepath):
         dataDictionary['materials'] = collections.OrderedDict()
         dataDictionary['scenarios'] = collections.OrderedDict()
 
-    # Store current frame to reset it later
-    frame_current = scn.frame_current
-    frame_range = range(scn.frame_start, scn.frame_end + 1) if self.export_animation else [frame_current]
+    if frameSweep is None:
+        frameSweep = FrameSweep(scn, get_export_frame_range(self, scn))
+        add_json_samplers(self, frameSweep)
+        frameSweep.run()
     
     # Cameras
     cameras = [o for o in bpy.data.objects if o.type == 'CAMERA']
@@ -913,18 +1286,10 @@ def export_json(context, self, binfilepath):
         else:
             self.report({'WARNING'}, ("Skipping unsupported camera type: \"%s\" from: \"%s\"." % (camera.type, cameraObject.name)))
             continue
-        cameraPath = []
-        viewDirectionPath = []
-        upPath = []
-        for f in frame_range:
-            scn.frame_set(f)
-            trans, rot, scale = cameraObject.matrix_world.decompose()
-            cameraPath.append(flip_space(cameraObject.location))
-            viewDirectionPath.append(flip_space(rot @ Vector((0.0, 0.0, -1.0))))
-            upPath.append(flip_space(rot @ Vector((0.0, 1.0, 0.0))))
-        dataDictionary['cameras'][cameraObject.name]['path'] = junction_path(cameraPath)
-        dataDictionary['cameras'][cameraObject.name]['viewDir'] = junction_path(viewDirectionPath)
-        dataDictionary['cameras'][cameraObject.name]['up'] = junction_path(upPath)
+        cameraPath, viewDirectionPath, upPath = zip(*frameSweep.get(('camera', cameraObject.name)))
+        dataDictionary['cameras'][cameraObject.name]['path'] = junction_path(list(cameraPath))
+        dataDictionary['cameras'][cameraObject.name]['viewDir'] = junction_path(list(viewDirectionPath))
+        dataDictionary['cameras'][cameraObject.name]['up'] = junction_path(list(upPath))
 
     if len(dataDictionary['cameras']) == 0:
         self.report({'ERROR'}, "No camera found.")  # Stop if no camera was exported
@@ -938,89 +1303,23 @@ def export_json(context, self, binfilepath):
         lamp = lampObject.data
         if lamp.users == 0:
             continue
-        if lamp.use_nodes and lamp.node_tree:
-            # Fetch the emission node if the light uses nodes
-            outputNode = find_light_output_node(lamp)
-            if len(outputNode.inputs['Surface'].links) == 0:
-                raise Exception("light '%s' is missing output link"%(light.name))
-            emissionNode = outputNode.inputs['Surface'].links[0].from_node
-            if emissionNode.bl_idname != 'ShaderNodeEmission':
-                raise Exception("light '%s' does not have emission node as last output node (other nodes not yet supported!)"%(lamp.name))
-            
+        emissionNode = get_light_emission_node(lamp)
         if lamp.type == "POINT":
             if lampObject.name not in dataDictionary['lights']:
                 dataDictionary['lights'][lampObject.name] = collections.OrderedDict()
-            if lamp.use_nodes and lamp.node_tree:
-                dataDictionary['lights'][lampObject.name].update(write_point_light(self, lamp, lampObject, emissionNode, scn, frame_range))
-            else:
-                # TODO: this needs nodes too for goniometric lights!
-                positions = []
-                intensities = []
-                scales = []
-                # Go through all frames, accumulate the to-be-exported quantities
-                for f in frame_range:
-                    scn.frame_set(f)
-                    positions.append(flip_space(lampObject.location))
-                    intensities.append([lamp.color.r, lamp.color.g, lamp.color.b])
-                    scales.append(lamp.energy)
-                dataDictionary['lights'][lampObject.name]['type'] = "point"
-                dataDictionary['lights'][lampObject.name]['position'] = junction_path(positions)
-                dataDictionary['lights'][lampObject.name]['intensity'] = junction_path(intensities)
-                dataDictionary['lights'][lampObject.name]['scale'] = junction_path(scales)
+            dataDictionary['lights'][lampObject.name].update(write_point_light(self, lamp, emissionNode, frameSweep.get(('light', lampObject.name))))
         elif lamp.type == "SUN":
             if lampObject.name not in dataDictionary['lights']:
                 dataDictionary['lights'][lampObject.name] = collections.OrderedDict()
-            if lamp.use_nodes and lamp.node_tree:
-                dataDictionary['lights'][lampObject.name].update(write_directional_light(self, lamp, lampObject, emissionNode, scn, frame_range))
-            else:
-                directions = []
-                radiances = []
-                scales = []
-                # Go through all frames, accumulate the to-be-exported quantities
-                for f in frame_range:
-                    scn.frame_set(f)
-                    directions.append(flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))))
-                    radiances.append([lamp.color.r, lamp.color.g, lamp.color.b])
-                    scales.append(lamp.energy)
-                dataDictionary['lights'][lampObject.name]['type'] = "directional"
-                dataDictionary['lights'][lampObject.name]['direction'] = junction_path(directions)
-                dataDictionary['lights'][lampObject.name]['radiance'] = junction_path(radiances)
-                dataDictionary['lights'][lampObject.name]['scale'] = junction_path(scales)
+            dataDictionary['lights'][lampObject.name].update(write_directional_light(self, lamp, emissionNode, frameSweep.get(('light', lampObject.name))))
         elif lamp.type == "SPOT":
             if lampObject.name not in dataDictionary['lights']:
                 dataDictionary['lights'][lampObject.name] = collections.OrderedDict()
-            if lamp.use_nodes and lamp.node_tree:
-                dataDictionary['lights'][lampObject.name].update(write_spot_light(self, lamp, lampObject, emissionNode, scn, frame_range))
-            else:
-                positions = []
-                directions = []
-                intensities = []
-                scales = []
-                widths = []
-                falloffs = []
-                # Go through all frames, accumulate the to-be-exported quantities
-                for f in frame_range:
-                    scn.frame_set(f)
-                    positions.append(flip_space(lampObject.location))
-                    directions.append(flip_space(lampObject.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))))
-                    intensities.append([lamp.color.r, lamp.color.g, lamp.color.b])
-                    scales.append(lamp.energy)
-                    widths.append(lamp.spot_size / 2)
-                    # Try to match the inner circle for the falloff (not exact, blender seems buggy):
-                    # https://blender.stackexchange.com/questions/39555/how-to-calculate-blend-based-on-spot-size-and-inner-cone-angle
-                    falloffs.append(math.atan(math.tan(lamp.spot_size / 2) * math.sqrt(1-lamp.spot_blend)))
-                dataDictionary['lights'][lampObject.name]['type'] = "spot"
-                dataDictionary['lights'][lampObject.name]['position'] = junction_path(positions)
-                dataDictionary['lights'][lampObject.name]['direction'] = junction_path(directions)
-                dataDictionary['lights'][lampObject.name]['intensity'] = junction_path(intensities)
-                dataDictionary['lights'][lampObject.name]['scale'] = junction_path(scales)
-                dataDictionary['lights'][lampObject.name]['width'] = junction_path(widths)
-                dataDictionary['lights'][lampObject.name]['falloffStart'] = junction_path(falloffs)
+            dataDictionary['lights'][lampObject.name].update(write_spot_light(self, lamp, emissionNode, frameSweep.get(('light', lampObject.name))))
         else:
             self.report({'WARNING'}, ("Skipping unsupported lamp type: \"%s\" from: \"%s\"." % (lamp.type, lampObject.name)))
             continue
         lightNames.append(lampObject.name)
-    scn.frame_set(frame_current)
 
     for scene in bpy.data.scenes:
         world = scene.world
@@ -1042,6 +1341,7 @@ def export_json(context, self, binfilepath):
                 if materialSlot.material is not None:
                     materialNames.add(materialSlot.material.name)
 
+    materialStart = time.perf_counter()
     materials = bpy.data.materials
     for i in range(len(materials)):
         material = materials[i]
@@ -1098,7 +1398,7 @@ def export_json(context, self, binfilepath):
             dataDictionary['materials'][material.name].update(workDictionary)
         except Exception as e:
             self.report({'ERROR'}, ("Material '%s' not converted: %s"%(material.name, str(e))))
-            
+    profiler.add('materials', time.perf_counter() - materialStart)
 
     # Scenarios
     for scene in bpy.data.scenes:
@@ -1168,6 +1468,9 @@ def export_json(context, self, binfilepath):
     file = open(self.filepath, 'w')
     file.write(dump)
     file.close()
+    if bakeCache is not None:
+        bakeCache.save()
+        print("Reused %d baked textures"%(bakeCache.hitCount))
     return 0
 
 
@@ -1178,68 +1481,160 @@ def export_json(context, self, binfilepath):
 #   #  #  #  #  ##  #######  #  #    #
 #   ###   #  #   #  #     #  #  #    #
 
-def get_faces_to_triangulate(bm, triangulate):
-    return [f for f in bm.faces if len(f.edges) > 4 or (triangulate and len(f.edges) > 3)]
-
-def get_edges_to_split(bm):
-    edgesToSplit = set([e for e in bm.edges if e.seam or not e.smooth])
-    
-    for f in bm.faces:
-        if not f.smooth:
-            for e in f.edges:
-                edgesToSplit.add(e)
-    return list(edgesToSplit)
-    
-def count_tri_quads(self, bm):
-    numberOfTriangles = 0
-    numberOfQuads = 0
-    for face in bm.faces:
-        numVertices = len(face.verts)
-        if numVertices == 3:
-            numberOfTriangles += 1
-        elif numVertices == 4:
-            numberOfQuads += 1
-        else:
-            self.report({'ERROR'}, ("%d Vertices in face from object: \"%s\"." % (numVertices, lod.name)))
-            return 0, 0
-    return numberOfTriangles, numberOfQuads
+# Result of the vertex split stage: the exported vertices refer back to the mesh vertex and to a
+# representative loop (-1 for vertices without any face), the faces use the exported vertex indices
+class SplitMesh:
+    def __init__(self, vertexIndices, vertexLoops, triangles, quads, triangleMaterials, quadMaterials):
+        self.vertexIndices = vertexIndices
+        self.vertexLoops = vertexLoops
+        self.triangles = triangles
+        self.quads = quads
+        self.triangleMaterials = triangleMaterials
+        self.quadMaterials = quadMaterials
+        # Count the distinct edges of the exported faces
+        edges = numpy.concatenate((numpy.stack((triangles, numpy.roll(triangles, -1, axis=1)), axis=2).reshape(-1, 2),
+                                   numpy.stack((quads, numpy.roll(quads, -1, axis=1)), axis=2).reshape(-1, 2)))
+        self.edgeCount = len(numpy.unique(numpy.sort(edges, axis=1), axis=0))
+
+# Splits the mesh vertices where the attached loops disagree about UV coordinate or normal, or belong to
+# a flat-shaded face, and triangulates the faces which cannot be exported as they are.
+# Instead of marking seams and splitting edges with bmesh, the unique (vertex, uv, normal, smooth-group)
+# tuples of all loops become the exported vertices.
+def split_mesh_vertices(mesh, triangulate):
+    loopVertexIndices = get_loop_vertex_indices(mesh)
+    loopStarts = get_int_array(mesh.polygons, 'loop_start')
+    loopTotals = get_int_array(mesh.polygons, 'loop_total')
+    materialIndices = get_int_array(mesh.polygons, 'material_index')
+    useSmooth = get_int_array(mesh.polygons, 'use_smooth', dtype=numpy.bool_)
+
+    # Polygon of every loop (loops of a polygon are contiguous, but we do not rely on the polygon order)
+    loopPolygons = numpy.empty(len(loopVertexIndices), dtype=numpy.int64)
+    polygonOfLoop = numpy.repeat(numpy.arange(len(loopStarts)), loopTotals)
+    loopOffsets = numpy.arange(len(polygonOfLoop)) - numpy.repeat(numpy.cumsum(loopTotals) - loopTotals, loopTotals)
+    loopPolygons[loopStarts[polygonOfLoop] + loopOffsets] = polygonOfLoop
+
+    # Split normals capture flat faces as well as sharp edges (with auto smooth) and custom normals
+    mesh.calc_normals_split()
+    loopNormals = get_float_array(mesh.loops, 'normal', 3)
+    if len(mesh.uv_layers) > 0:
+        loopUVs = get_float_array(mesh.uv_layers[0].data, 'uv', 2)
+    else:
+        loopUVs = numpy.zeros((len(loopVertexIndices), 2), dtype=numpy.float32)
+    # Flat faces never share vertices, even if they are coplanar
+    smoothGroups = numpy.where(useSmooth[loopPolygons], -1, loopPolygons)
+    loopKeys = numpy.column_stack((loopVertexIndices, loopUVs, loopNormals, smoothGroups)).astype(numpy.float64)
+    _, representativeLoops, loopSplitVertices = numpy.unique(loopKeys, axis=0, return_index=True, return_inverse=True)
+    loopSplitVertices = loopSplitVertices.reshape(-1)
+
+    # Vertices which are not part of any face are kept at the end
+    looseVertices = numpy.setdiff1d(numpy.arange(len(mesh.vertices)), loopVertexIndices)
+    vertexIndices = numpy.concatenate((loopVertexIndices[representativeLoops], looseVertices))
+    vertexLoops = numpy.concatenate((representativeLoops, numpy.full(len(looseVertices), -1, dtype=numpy.int64)))
+
+    # Triangles and (unless triangulating) quads are taken as they are, everything else comes from Blender's tessellation
+    isTriangle = loopTotals == 3
+    isQuad = (loopTotals == 4) & (not triangulate)
+    triangleLoops = loopStarts[isTriangle, numpy.newaxis] + numpy.arange(3)
+    quadLoops = loopStarts[isQuad, numpy.newaxis] + numpy.arange(4)
+    triangleMaterials = materialIndices[isTriangle]
+    if not numpy.all(isTriangle | isQuad):
+        mesh.calc_loop_triangles()
+        tessellatedLoops = get_int_array(mesh.loop_triangles, 'loops', 3)
+        tessellatedPolygons = get_int_array(mesh.loop_triangles, 'polygon_index')
+        tessellate = ~(isTriangle | isQuad)[tessellatedPolygons]
+        triangleLoops = numpy.concatenate((triangleLoops, tessellatedLoops[tessellate]))
+        triangleMaterials = numpy.concatenate((triangleMaterials, materialIndices[tessellatedPolygons[tessellate]]))
+
+    return SplitMesh(vertexIndices, vertexLoops, loopSplitVertices[triangleLoops], loopSplitVertices[quadLoops],
+                     triangleMaterials, materialIndices[isQuad])
 
 def prepare_object_mesh(self, depsgraph, lod):
     # Disabling the armature modifier so we get rest-pose vertex positions is done in export_binary
-    mesh = lod.evaluated_get(depsgraph).data    # applies all modifiers
-    bm = bmesh.new()
-    bm.from_mesh(mesh)  # bmesh gives a local editable mesh copy
-    facesToTriangulate = get_faces_to_triangulate(bm, self.triangulate)
-    if len(facesToTriangulate) > 0:
-        bmesh.ops.triangulate(bm, faces=facesToTriangulate, quad_method='BEAUTY', ngon_method='BEAUTY')
-    # Split vertices if vertex has multiple uv coordinates (is used in multiple triangles)
-    # or if it is not smooth
-    
-    if len(lod.data.uv_layers) > 0:
-        # mark seams from uv islands
-        if bpy.ops.uv.seams_from_islands.poll():
-            bpy.ops.uv.seams_from_islands()
-    edgesToSplit = get_edges_to_split(bm)
-    if len(edgesToSplit) > 0:
-        bmesh.ops.split_edges(bm, edges=edgesToSplit)
-
-    numberOfTriangles, numberOfQuads = count_tri_quads(self, bm)
-    # Only change the mesh if any changes have been performed
-    if len(facesToTriangulate) > 0 or len(edgesToSplit) > 0:
-        bm.to_mesh(mesh)
-    bm.free()
-    return mesh, numberOfTriangles, numberOfQuads
+    with profiler.phase('mesh preparation'):
+        mesh = lod.evaluated_get(depsgraph).data    # applies all modifiers
+        return mesh, split_mesh_vertices(mesh, self.triangulate)
+
+# Deflates a data block and prefixes it with the compressed and uncompressed sizes
+def deflate_block(data):
+    with profiler.phase('deflation', len(data)):
+        outData = zlib.compress(data, 8)
+    return len(outData).to_bytes(4, byteorder='little') + len(data).to_bytes(4, byteorder='little') + outData
+
+# Compresses data blocks on worker threads; zlib releases the GIL, so this scales with the core count
+class DeflationPool:
+    def __init__(self, workerCount=None):
+        workerCount = workerCount or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workerCount)
+        # Bounds how many serialized objects may wait for their compression before being spliced
+        self.maxPendingObjects = 2 * workerCount
+
+    def submit(self, data):
+        return self.executor.submit(deflate_block, bytes(data))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+# Binary of a single object. Deflated blocks may still be in flight on the deflation pool, so the
+# object is spliced into the file binary only after they are done. All positions are object-local.
+class ObjectBinary:
+    def __init__(self, deflationPool=None):
+        self.head = bytearray()     # Bytes up to the first block still being deflated
+        self.tail = []              # Pending compression futures and the raw bytes behind them
+        self.offsetSlots = []       # 8-byte slots holding object-local offsets which need to become file offsets
+        self.deflationPool = deflationPool
+        self.profile = None         # (object name, serialization seconds, taken from cache)
+
+    def extend(self, data):
+        if self.tail:
+            if not isinstance(self.tail[-1], bytearray):
+                self.tail.append(bytearray())
+            self.tail[-1].extend(data)
+        else:
+            self.head.extend(data)
+
+    def extend_deflated(self, data):
+        if self.deflationPool is None:
+            self.extend(deflate_block(data))
+        else:
+            self.tail.append(self.deflationPool.submit(data))
+
+    # Waits for all pending blocks so that the object-local positions are known again
+    def resolve(self):
+        for segment in self.tail:
+            self.head.extend(segment if isinstance(segment, bytearray) else segment.result())
+        self.tail = []
+
+    def __len__(self):
+        if self.tail:
+            self.resolve()
+        return len(self.head)
+
+    def __getitem__(self, key):
+        return self.head[key]
+
+    def __setitem__(self, key, value):
+        self.head[key] = value
+
+    # Stores the current (object-local) end in the given slot; it is turned into a file offset on splicing
+    def write_offset(self, slot):
+        write_num(self, slot, 8, len(self))
+        self.offsetSlots.append(slot)
+
+    def splice_into(self, binary):
+        self.resolve()
+        base = len(binary)
+        for slot in self.offsetSlots:
+            write_num(self.head, slot, 8, int.from_bytes(self.head[slot : slot+8], byteorder='little') + base)
+        binary.extend(self.head)
 
 # Write some data block with (optional) deflation
 # Valid to be called for empty data which will write nothing
 def write_compressed(binary, data, use_deflation):
     if not data: return
-    outData = data
     if use_deflation:
-        outData = zlib.compress(data, 8)
-        binary.extend(len(outData).to_bytes(4, byteorder='little')) # compressed size
-        binary.extend(len(data).to_bytes(4, byteorder='little'))    # uncompressed size
-    binary.extend(outData)
+        binary.extend_deflated(data)
+    else:
+        binary.extend(data)
 
 def write_string(binary, string):
     binary.extend(len(string.encode()).to_bytes(4, byteorder='little')) # Length (always wriite)
@@ -1254,33 +1649,90 @@ def write_attribute_header(binary, attrName, metaInfo, metaFlags, typeCode, byte
     binary.extend(typeCode.to_bytes(4, byteorder='little'))
     binary.extend(byteSize.to_bytes(8, byteorder='little'))
 
-def write_mesh_lod(self, lodObject, objectFlags, objectFlagsBinaryPosition, mesh, binary, materialLookup, boneLookup):
+# Maps the mesh-local material slots to the global material indices
+def get_material_lookup_table(mesh, materialLookup):
+    # Empty slots fall back to the default material
+    return numpy.array([materialLookup[material.name] if material is not None else 0 for material in mesh.materials],
+                       dtype=numpy.uint16)
+
+def is_emissive_material(material):
+    for node in material.node_tree.nodes:
+        if node.bl_idname == 'ShaderNodeEmission' and (len(node.inputs['Strength'].links) > 0 or (node.inputs['Strength'].default_value > 0.0)):
+            return True
+    return False
+
+# Reads the vertex group memberships in CSR form: the groups and weights of vertex v are
+# groups[offsets[v]:offsets[v+1]] and weights[offsets[v]:offsets[v+1]]
+def get_vertex_group_weights(mesh):
+    counts = numpy.empty(len(mesh.vertices), dtype=numpy.int64)
+    groups = []
+    weights = []
+    for v, vert in enumerate(mesh.vertices):
+        vertexGroups = vert.groups
+        counts[v] = len(vertexGroups)
+        groups.extend([g.group for g in vertexGroups])
+        weights.extend([g.weight for g in vertexGroups])
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    return offsets, numpy.array(groups, dtype=numpy.int64), numpy.array(weights, dtype=numpy.float64)
+
+# Maps vertex group indices to global bone indices; groups which do not belong to a bone get -1
+def get_group_bone_table(lodObject, boneLookup):
+    return numpy.array([boneLookup.get(lodObject.parent.name + group.name, -1) for group in lodObject.vertex_groups],
+                       dtype=numpy.int64)
+
+# Encodes the (up to) four largest bone weights of every vertex as (10 bit weight << 22) | 22 bit bone index,
+# sorted by descending weight. Unused slots are 0x003fffff, i.e. weight 0 and the invalid bone.
+def encode_skinning_weights(offsets, groups, weights, groupBones):
+    vertexCount = len(offsets) - 1
+    counts = numpy.diff(offsets)
+    bones = groupBones[groups] if len(groups) > 0 else numpy.empty(0, dtype=numpy.int64)
+    # Non-bone groups and non-positive weights are dropped like in an empty slot
+    valid = (bones >= 0) & (weights > 0)
+    # Scatter into a dense (vertex, influence) layout
+    width = max(4, int(counts.max()) if vertexCount > 0 else 0)
+    denseWeights = numpy.zeros((vertexCount, width), dtype=numpy.float64)
+    denseBones = numpy.full((vertexCount, width), 0x003fffff, dtype=numpy.int64)
+    rows = numpy.repeat(numpy.arange(vertexCount), counts)
+    columns = numpy.arange(len(groups)) - offsets[rows]
+    denseWeights[rows[valid], columns[valid]] = weights[valid]
+    denseBones[rows[valid], columns[valid]] = bones[valid]
+    # Insertion sort with overflow into four slots, one group column at a time for all vertices. Ties are
+    # resolved exactly like the per-vertex loop did, which is not the same as a stable sort: an entry pushed
+    # down by a larger weight is inserted behind equal weights again
+    slotWeights = numpy.zeros((vertexCount, 4), dtype=numpy.float64)
+    slotBones = numpy.full((vertexCount, 4), 0x003fffff, dtype=numpy.int64)
+    for column in range(width):
+        w = denseWeights[:, column]
+        b = denseBones[:, column]
+        for i in range(4):
+            swap = w > slotWeights[:, i]
+            previousWeights = slotWeights[:, i].copy()
+            previousBones = slotBones[:, i].copy()
+            slotWeights[swap, i] = w[swap]
+            slotBones[swap, i] = b[swap]
+            w = numpy.where(swap, previousWeights, w)
+            b = numpy.where(swap, previousBones, b)
+    quantizedWeights = numpy.round(numpy.minimum(slotWeights, 1.0) * 1023).astype(numpy.uint32)
+    return (slotBones & 0x003fffff).astype(numpy.uint32) | (quantizedWeights << 22)
+
+def write_mesh_lod(self, lodObject, objectFlags, objectFlagsBinaryPosition, mesh, splitMesh, binary, materialLookup, boneLookup):
     # Vertex data
-    vertices = mesh.vertices
+    vertexCount = len(splitMesh.vertexIndices)
+    vertexLoops = splitMesh.vertexLoops
     mesh.calc_normals()
-    if mesh.has_custom_normals:
-        mesh.calc_normals_split()
-    uvCoordinates = numpy.empty(len(vertices), dtype=object)
+    # Gather everything in bulk; per-vertex access through the bpy API is far too slow for large meshes
+    positions = get_float_array(mesh.vertices, 'co', 3)[splitMesh.vertexIndices]
     if len(mesh.uv_layers) == 0:
         self.report({'WARNING'}, ("LOD Object: \"%s\" has no uv layers." % (lodObject.name)))
-        for k in range(len(uvCoordinates)):
-            uvCoordinates[k] = spherical_projected_uv_coordinate(vertices[k].co)
+        uvCoordinates = spherical_projected_uv_coordinates(positions)
     else:
-        uv_layer = mesh.uv_layers[0]
-        for polygon in mesh.polygons:
-            for loop_index in range(polygon.loop_start, polygon.loop_start + polygon.loop_total):
-                uvCoordinates[mesh.loops[loop_index].vertex_index] = uv_layer.data[loop_index].uv
-    
-    vertexDataArray = bytearray()  # Used for deflation
-    for k in range(len(vertices)):
-        vertexDataArray.extend(struct.pack('<3f', *mesh.vertices[k].co))
-    write_vertex_normals(vertexDataArray, mesh, self.use_compression)
-    for k in range(len(vertices)):
         # Same issue as with normals: there may be vertices which are not part of any loop and thus don't have UV coordinates
-        if uvCoordinates[k] is None:
-            vertexDataArray.extend(struct.pack('<2f', 0.0, 0.0))
-        else:
-            vertexDataArray.extend(struct.pack('<2f', uvCoordinates[k][0], uvCoordinates[k][1]))
+        uvCoordinates = gather_loop_attribute(get_float_array(mesh.uv_layers[0].data, 'uv', 2), vertexLoops)
+
+    vertexDataArray = bytearray()  # Used for deflation
+    vertexDataArray.extend(positions.astype('<f4').tobytes())
+    write_vertex_normals(vertexDataArray, get_vertex_normals(mesh, splitMesh), self.use_compression)
+    vertexDataArray.extend(uvCoordinates.astype('<f4').tobytes())
     write_compressed(binary, vertexDataArray, self.use_deflation)
 
     # Vertex Attributes
@@ -1305,122 +1757,67 @@ def write_mesh_lod(self, lodObject, objectFlags, objectFlagsBinaryPosition, mesh
             uv_layer = mesh.uv_layers[uvNumber]
             if not uv_layer:
                 continue
-            uvCoordinates = numpy.empty(len(vertices), dtype=object)
             vertexAttributeDataArray = bytearray()  # Used for deflation
-            write_attribute_header(vertexAttributeDataArray, uv_layer.name, "AdditionalUV2D", 0, 16, len(vertices)*4*2)
-            for polygon in mesh.polygons:
-                for loop_index in range(polygon.loop_start, polygon.loop_start + polygon.loop_total):
-                    uvCoordinates[mesh.loops[loop_index].vertex_index] = uv_layer.data[loop_index].uv
-            for k in range(len(vertices)):
-                vertexAttributeDataArray.extend(struct.pack('<2f', uvCoordinates[k][0], uvCoordinates[k][1]))
+            write_attribute_header(vertexAttributeDataArray, uv_layer.name, "AdditionalUV2D", 0, 16, vertexCount*4*2)
+            uvCoordinates = gather_loop_attribute(get_float_array(uv_layer.data, 'uv', 2), vertexLoops)
+            vertexAttributeDataArray.extend(uvCoordinates.astype('<f4').tobytes())
             write_compressed(binary, vertexAttributeDataArray, self.use_deflation)
 
         for colorNumber in range(len(mesh.vertex_colors)):
             vertex_color_layer = mesh.vertex_colors[colorNumber]
             if not vertex_color_layer:
                 continue
-            vertexColor = numpy.empty(len(vertices), dtype=object)
             vertexAttributeDataArray = bytearray()  # Used for deflation
-            write_attribute_header(vertexAttributeDataArray, vertex_color_layer.name, "Color", 0, 17, len(vertices)*4*3)
-            for polygon in mesh.polygons:
-                for loop_index in range(polygon.loop_start, polygon.loop_start + polygon.loop_total):
-                    vertexColor[mesh.loops[loop_index].vertex_index] = vertex_color_layer.data[loop_index].color
-            for k in range(len(vertices)):
-                vertexAttributeDataArray.extend(struct.pack('<3f', vertexColor[k][0], vertexColor[k][1], vertexColor[k][2]))
+            write_attribute_header(vertexAttributeDataArray, vertex_color_layer.name, "Color", 0, 17, vertexCount*4*3)
+            # Loop colors are RGBA, but we only export RGB
+            vertexColor = gather_loop_attribute(get_float_array(vertex_color_layer.data, 'color', 4)[:, :3], vertexLoops)
+            vertexAttributeDataArray.extend(vertexColor.astype('<f4').tobytes())
             write_compressed(binary, vertexAttributeDataArray, self.use_deflation)
 
         if self.export_animation and lodObject.parent and lodObject.parent.type == 'ARMATURE':
             # There is a bone animation, so we need the vertex weights
             vertexAttributeDataArray = bytearray()  # Used for deflation
-            write_attribute_header(vertexAttributeDataArray, "AnimationWeights", "", 0, 19, len(vertices)*4*4)
-            for vert in mesh.vertices:
-                weights = [0, 0, 0, 0]  # Intially no weights
-                idx = [0x003fffff, 0x003fffff, 0x003fffff, 0x003fffff]
-                # Collect weights. If there are more than 4, keep only the 4 largest.
-                for g in vert.groups:
-                    w = g.weight
-                    b = boneLookup[lodObject.parent.name + lodObject.vertex_groups[g.group].name]
-                    # Insertion(sort) with overflow
-                    for i in range(4):
-                        if w > weights[i]:
-                            w, weights[i] = weights[i], w
-                            b, idx[i] = idx[i], b
-                # Encode the weights
-                for i in range(4):
-                    if idx[i] > 0x003fffff:
-                        self.report({'WARNING'}, ("LOD Object: \"%s\". A vertex references a bone index > 0x003fffff." % (lodObject.name)))
-                    if weights[i] < 0 or weights[i] > 1:
-                        self.report({'WARNING'}, ("LOD Object: \"%s\". A vertex weight is outside [0,1]." % (lodObject.name)))
-                    code = (idx[i] & 0x003fffff) | (round(weights[i] * 1023) << 22)
-                    vertexAttributeDataArray.extend(code.to_bytes(4, byteorder='little'))
+            write_attribute_header(vertexAttributeDataArray, "AnimationWeights", "", 0, 19, vertexCount*4*4)
+            offsets, groups, weights = get_vertex_group_weights(mesh)
+            groupBones = get_group_bone_table(lodObject, boneLookup)
+            if len(groupBones) > 0 and groupBones.max() > 0x003fffff:
+                self.report({'WARNING'}, ("LOD Object: \"%s\". A vertex references a bone index > 0x003fffff." % (lodObject.name)))
+            if numpy.any(weights > 1):
+                self.report({'WARNING'}, ("LOD Object: \"%s\". A vertex weight is outside [0,1]." % (lodObject.name)))
+            codes = encode_skinning_weights(offsets, groups, weights, groupBones)
+            vertexAttributeDataArray.extend(codes[splitMesh.vertexIndices].astype('<u4').tobytes())
             write_compressed(binary, vertexAttributeDataArray, self.use_deflation)
 
     # TODO more Vertex Attributes? (with deflation)
 
-    # Triangles
-    triangleDataArray = bytearray()  # Used for deflation
-    for polygon in mesh.polygons:
-        if len(polygon.vertices) == 3:
-            for k in range(3):
-                triangleDataArray.extend(polygon.vertices[k].to_bytes(4, byteorder='little'))
-    triangleOutData = triangleDataArray
-    if self.use_deflation and len(triangleDataArray) > 0:
-        triangleOutData = zlib.compress(triangleDataArray, 8)
-        binary.extend(len(triangleOutData).to_bytes(4, byteorder='little'))
-        binary.extend(len(triangleDataArray).to_bytes(4, byteorder='little'))
-    binary.extend(triangleOutData)
-    # Quads
-    quadDataArray = bytearray()  # Used for deflation
-    for polygon in mesh.polygons:
-        if len(polygon.vertices) == 4:
-            for k in range(4):
-                quadDataArray.extend(polygon.vertices[k].to_bytes(4, byteorder='little'))
-    quadOutData = quadDataArray
-    if self.use_deflation and len(quadDataArray) > 0:
-        quadOutData = zlib.compress(quadDataArray, 8)
-        binary.extend(len(quadOutData).to_bytes(4, byteorder='little'))
-        binary.extend(len(quadDataArray).to_bytes(4, byteorder='little'))
-    binary.extend(quadOutData)
+    # Triangles, quads and material IDs in one bulk pass
+    triangleMaterials = splitMesh.triangleMaterials
+    quadMaterials = splitMesh.quadMaterials
+    write_compressed(binary, splitMesh.triangles.astype('<u4').tobytes(), self.use_deflation)
+    write_compressed(binary, splitMesh.quads.astype('<u4').tobytes(), self.use_deflation)
     # Material IDs
-    matIDDataArray = bytearray()
     if len(mesh.materials) == 0:
         self.report({'WARNING'}, ("LOD Object: \"%s\" has no materials." % (lodObject.name)))
-    for polygon in mesh.polygons:
-        if len(polygon.vertices) == 3:
-            if len(mesh.materials) != 0:
-                matIDDataArray.extend(materialLookup[mesh.materials[polygon.material_index].name].to_bytes(2, byteorder='little'))
-            else:
-                matIDDataArray.extend((0).to_bytes(2, byteorder='little'))
-    for polygon in mesh.polygons:
-        if len(polygon.vertices) == 4:
-            if len(mesh.materials) != 0:
-                matIDDataArray.extend(materialLookup[mesh.materials[polygon.material_index].name].to_bytes(2, byteorder='little'))
-            else:
-                matIDDataArray.extend((0).to_bytes(2, byteorder='little')) # first material is default when the object has no mats
+        # first material is default when the object has no mats
+        materialIDs = numpy.zeros(len(triangleMaterials) + len(quadMaterials), dtype=numpy.uint16)
+    else:
+        lookupTable = get_material_lookup_table(mesh, materialLookup)
+        materialIDs = numpy.concatenate((lookupTable[triangleMaterials], lookupTable[quadMaterials]))
     if (objectFlags & 1) == 0:
         if len(mesh.materials) != 0:
-            for polygon in mesh.polygons:
-                if len(mesh.materials) != 0:
-                    # Check if the material emits light
-                    for node in mesh.materials[polygon.material_index].node_tree.nodes:
-                        if node.bl_idname == 'ShaderNodeEmission' and (len(node.inputs['Strength'].links) > 0 or (node.inputs['Strength'].default_value > 0.0)):
-                            objectFlags |= 1
-                            objectFlagsBin = objectFlags.to_bytes(4, byteorder='little')
-                            for k in range(4):
-                                binary[objectFlagsBinaryPosition + k] = objectFlagsBin[k]
-                            break
+            # Check if any of the used materials emits light
+            for materialIndex in numpy.unique(numpy.concatenate((triangleMaterials, quadMaterials))).tolist():
+                if is_emissive_material(mesh.materials[materialIndex]):
+                    objectFlags |= 1
+                    write_num(binary, objectFlagsBinaryPosition, 4, objectFlags)
+                    break
     else:
         if materials[0] > 0.0:  # first material is default when the object has no mats
             objectFlags |= 1
             objectFlagsBin = objectFlags.to_bytes(4, byteorder='little')
             for k in range(4):
                 binary[objectFlagsBinaryPosition + k] = objectFlagsBin[k]
-    matIDOutData = matIDDataArray
-    if self.use_deflation and len(matIDDataArray) > 0:
-        matIDOutData = zlib.compress(matIDDataArray, 8)
-        binary.extend(len(matIDOutData).to_bytes(4, byteorder='little'))
-        binary.extend(len(matIDDataArray).to_bytes(4, byteorder='little'))
-    binary.extend(matIDOutData)
+    write_compressed(binary, materialIDs.astype('<u2').tobytes(), self.use_deflation)
     # Face Attributes
     # TODO Face Attributes (with deflation)
     lodObject.to_mesh_clear()
@@ -1447,13 +1844,8 @@ def write_sphere_lod(self, binary, lodObject, objectFlags, objectFlagsBinaryPosi
         self.report({'WARNING'}, ("LOD Object: \"%s\" has no materials." % (lodObject.name)))
         sphereDataArray.extend((0).to_bytes(2, byteorder='little'))  # first material is default when the object has no mats
 
-    sphereOutData = sphereDataArray
     # TODO Sphere Attributes
-    if self.use_deflation and len(sphereDataArray) > 0:
-        sphereOutData = zlib.compress(sphereDataArray, 8)
-        binary.extend(len(sphereOutData).to_bytes(4, byteorder='little'))
-        binary.extend(len(sphereDataArray).to_bytes(4, byteorder='little'))
-    binary.extend(sphereOutData)
+    write_compressed(binary, sphereDataArray, self.use_deflation)
     return 0
     
 def write_object_aabb_and_detect_lods(binary, currentObject, currObjectName, keyframe):
@@ -1515,30 +1907,31 @@ def write_object_binary(self, context, depsgraph, binary, materialLookup, boneLo
     for j in range(len(lodLevels)):
         lodObject = lodLevels[(lodChainStart+j+1) % len(lodLevels)]  # for the correct starting object
         # start Positions
-        write_num(binary, lodStartBinaryPosition + j*8, 8, len(binary))
+        binary.write_offset(lodStartBinaryPosition + j*8)
         # Type
         binary.extend("LOD_".encode())
         # Needs to set the target object to active, to be able to apply changes.
         objScenes = lodObject.users_scene
         if len(objScenes) < 1:
             continue
-        context.window.scene = objScenes[0] # Choose a valid scene which contains the object
+        if context.window is not None: # There is no window in background mode
+            context.window.scene = objScenes[0] # Choose a valid scene which contains the object
         hidden = lodObject.hide_render
         lodObject.hide_render = False
         context.view_layer.objects.active = lodObject
         if not lodObject.mufflon_sphere:
-            mesh, numberOfTriangles, numberOfQuads = prepare_object_mesh(self, depsgraph, lodObject)
-            binary.extend(numberOfTriangles.to_bytes(4, byteorder='little'))
-            binary.extend(numberOfQuads.to_bytes(4, byteorder='little'))
+            mesh, splitMesh = prepare_object_mesh(self, depsgraph, lodObject)
+            binary.extend(len(splitMesh.triangles).to_bytes(4, byteorder='little'))
+            binary.extend(len(splitMesh.quads).to_bytes(4, byteorder='little'))
             binary.extend((0).to_bytes(4, byteorder='little'))                  # Num. spheres
-            binary.extend(len(mesh.vertices).to_bytes(4, byteorder='little'))
-            binary.extend(len(mesh.edges).to_bytes(4, byteorder='little'))
+            binary.extend(len(splitMesh.vertexIndices).to_bytes(4, byteorder='little'))
+            binary.extend(splitMesh.edgeCount.to_bytes(4, byteorder='little'))
             numVertAttrBinaryPosition = len(binary)  # has to be corrected when value is known
             binary.extend((0).to_bytes(4, byteorder='little'))
             numFaceAttrBinaryPosition = len(binary)  # has to be corrected when value is known
             binary.extend((0).to_bytes(4, byteorder='little'))
             binary.extend((0).to_bytes(4, byteorder='little'))
-            numVertAttr, numFaceAttr = write_mesh_lod(self, lodObject, objectFlags, objectFlagsBinaryPosition, mesh, binary, materialLookup, boneLookup)
+            numVertAttr, numFaceAttr = write_mesh_lod(self, lodObject, objectFlags, objectFlagsBinaryPosition, mesh, splitMesh, binary, materialLookup, boneLookup)
             write_num(binary, numVertAttrBinaryPosition, 4, numVertAttr)
             write_num(binary, numFaceAttrBinaryPosition, 4, numFaceAttr)
         else:
@@ -1557,7 +1950,82 @@ def write_object_binary(self, context, depsgraph, binary, materialLookup, boneLo
     lodObject.hide_render = hidden
 
 
-def write_animation_binary(self, context, binary, frame_range):
+# Returns the binary of the object and the key to cache it under. Objects taken from the cache
+# are returned with a None key since they do not need to be stored again.
+def get_object_binary(self, context, depsgraph, objectCache, deflationPool, materialLookup, boneLookup, currentObject, currObjectName, keyframe, contentKey=None):
+    start = time.perf_counter()
+    cacheKey = None
+    if objectCache is not None:
+        cacheKey = get_object_cache_key(self, depsgraph, currentObject, currObjectName, keyframe, materialLookup, contentKey)
+        if cacheKey is not None:
+            objectBinary = objectCache.load(cacheKey)
+            if objectBinary is not None:
+                objectBinary.profile = (currObjectName, time.perf_counter() - start, True)
+                return objectBinary, None
+    objectBinary = ObjectBinary(deflationPool)
+    write_object_binary(self, context, depsgraph, objectBinary, materialLookup, boneLookup,
+                        currentObject, currObjectName, keyframe)
+    seconds = time.perf_counter() - start
+    profiler.add('serialization', seconds)
+    objectBinary.profile = (currObjectName, seconds, False)
+    return objectBinary, cacheKey
+
+# Armature-space rest matrices of all pose bones as (B, 4, 4) array
+def get_bone_rest_matrices(arm):
+    return numpy.array([numpy.array(bone.bone.matrix_local) for bone in arm.pose.bones], dtype=numpy.float64).reshape(-1, 4, 4)
+
+# Armature-space pose matrices of all pose bones as (B, 4, 4) array
+def get_bone_pose_matrices(arm):
+    matrices = numpy.empty(len(arm.pose.bones) * 16, dtype=numpy.float32)
+    arm.pose.bones.foreach_get('matrix', matrices)
+    # Blender stores matrices column-major
+    return matrices.reshape(-1, 4, 4).transpose(0, 2, 1).astype(numpy.float64)
+
+# Same as mathutils' Matrix.decompose() + to_quaternion() for a (B, 3, 3) stack; returns (w, x, y, z)
+def rotations_to_quaternions(rotations):
+    rotations = rotations / numpy.linalg.norm(rotations, axis=1, keepdims=True)
+    rotations[numpy.linalg.det(rotations) < 0] *= -1.0
+    # m[i][j] in Blender's notation is column i, row j
+    m = rotations.transpose(0, 2, 1)
+    quaternions = numpy.empty((len(m), 4), dtype=numpy.float64)
+    trace = 0.25 * (1.0 + m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2])
+    case0 = trace > 1.192092896e-07
+    case1 = ~case0 & (m[:, 0, 0] > m[:, 1, 1]) & (m[:, 0, 0] > m[:, 2, 2])
+    case2 = ~case0 & ~case1 & (m[:, 1, 1] > m[:, 2, 2])
+    case3 = ~(case0 | case1 | case2)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        s = numpy.sqrt(trace)
+        q = numpy.stack((s, (m[:, 1, 2] - m[:, 2, 1]) / (4 * s), (m[:, 2, 0] - m[:, 0, 2]) / (4 * s),
+                         (m[:, 0, 1] - m[:, 1, 0]) / (4 * s)), axis=1)
+        quaternions[case0] = q[case0]
+        s = 2.0 * numpy.sqrt(1.0 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2])
+        q = numpy.stack(((m[:, 1, 2] - m[:, 2, 1]) / s, 0.25 * s, (m[:, 1, 0] + m[:, 0, 1]) / s,
+                         (m[:, 2, 0] + m[:, 0, 2]) / s), axis=1)
+        quaternions[case1] = q[case1]
+        s = 2.0 * numpy.sqrt(1.0 + m[:, 1, 1] - m[:, 0, 0] - m[:, 2, 2])
+        q = numpy.stack(((m[:, 2, 0] - m[:, 0, 2]) / s, (m[:, 1, 0] + m[:, 0, 1]) / s, 0.25 * s,
+                         (m[:, 2, 1] + m[:, 1, 2]) / s), axis=1)
+        quaternions[case2] = q[case2]
+        s = 2.0 * numpy.sqrt(1.0 + m[:, 2, 2] - m[:, 0, 0] - m[:, 1, 1])
+        q = numpy.stack(((m[:, 0, 1] - m[:, 1, 0]) / s, (m[:, 2, 0] + m[:, 0, 2]) / s,
+                         (m[:, 2, 1] + m[:, 1, 2]) / s, 0.25 * s), axis=1)
+        quaternions[case3] = q[case3]
+    return quaternions / numpy.linalg.norm(quaternions, axis=1, keepdims=True)
+
+# Converts a (B, 4, 4) stack of rigid transformations into dual quaternions (B, 8) in the order
+# real (i, j, k, r), dual (i, j, k, r)
+def matrices_to_dual_quaternions(matrices):
+    real = rotations_to_quaternions(matrices[:, :3, :3])
+    # dual = (0, translation / 2) * real
+    t = matrices[:, :3, 3] / 2.0
+    w, x, y, z = real[:, 0], real[:, 1], real[:, 2], real[:, 3]
+    dual = numpy.stack((-t[:, 0] * x - t[:, 1] * y - t[:, 2] * z,
+                        t[:, 0] * w + t[:, 1] * z - t[:, 2] * y,
+                        -t[:, 0] * z + t[:, 1] * w + t[:, 2] * x,
+                        t[:, 0] * y - t[:, 1] * x + t[:, 2] * w), axis=1)
+    return numpy.concatenate((real[:, [1, 2, 3, 0]], dual[:, [1, 2, 3, 0]]), axis=1)
+
+def write_animation_binary(self, context, binary, frameSweep):
     binary.extend("Bone".encode())
     animSectionOffsetPos = len(binary)
     binary.extend((0).to_bytes(8, byteorder='little'))
@@ -1580,35 +2048,13 @@ def write_animation_binary(self, context, binary, frame_range):
             boneLookup[fullName] = count
             count = count + 1
     binary.extend(count.to_bytes(4, byteorder='little'))
-    nkeys = len(frame_range)
+    nkeys = len(frameSweep.frames)
     binary.extend(nkeys.to_bytes(4, byteorder='little'))
 
-    oldFrame = context.scene.frame_current
-    # Export all matrices for all keyframes
-    for frame in frame_range:
-        if frame != context.scene.frame_current:
-            context.scene.frame_set(frame)
-        for arm in armatures:
-            for bone in arm.pose.bones:
-                # For the transformation matrix see http://rodolphe-vaillant.fr/?e=77
-                worldRestMat = arm.convert_space(pose_bone=bone, matrix=bone.bone.matrix_local,
-                                                 from_space='POSE', to_space='WORLD')
-                worldPoseMat = arm.convert_space(pose_bone=bone, matrix=bone.matrix,
-                                                 from_space='POSE', to_space='WORLD')
-                transMat = worldPoseMat @ worldRestMat.inverted()
-                # Convert into dual quaternion
-                translation, q0, scale = transMat.decompose()
-                qe = mathutils.Quaternion((0.0, translation.x / 2.0, translation.y / 2.0, translation.z / 2.0))
-                qe = qe @ q0
-                # Swap the quaternion element order, since we expect i, j, k, r instead of w, x, y, z
-                q0 = mathutils.Quaternion((q0.x, q0.y, q0.z, q0.w))
-                qe = mathutils.Quaternion((qe.x, qe.y, qe.z, qe.w))
-                binary.extend(struct.pack('<4f', *q0))
-                binary.extend(struct.pack('<4f', *qe))
-
+    # Export all matrices for all keyframes, one block per frame
+    for frameData in frameSweep.get(('bones',)):
+        binary.extend(frameData.tobytes())
     write_num(binary, animSectionOffsetPos, 8, len(binary))
-    if oldFrame != context.scene.frame_current:
-        context.scene.frame_set(oldFrame)
     return boneLookup
 
 def get_bone_custom_shapes():
@@ -1619,7 +2065,8 @@ def get_bone_custom_shapes():
                 boneCustomShapes.append(bone.custom_shape)
     return boneCustomShapes
 
-def write_instances(self, binary, instances, exportedObjects):
+def write_instances(self, binary, instances, animationObjects, exportedObjects, frameSweep, objectIndex=None,
+                    instancerInstances=()):
     # Type
     binary.extend("Inst".encode())
     # Number of Instances
@@ -1627,67 +2074,429 @@ def write_instances(self, binary, instances, exportedObjects):
     binary.extend((0).to_bytes(4, byteorder='little'))  # has to be corrected later
     numberOfInstances = 0
     print("Exporting all-frame instances...")
-    perFrameInstances = []
-    for currentInstance in instances:
-        index = exportedObjects[currentInstance.data]
-        # Check if the object has animation data
-        if is_animated_instance(currentInstance):
-            perFrameInstances.append(currentInstance)
-            continue
-        binary.extend(len(currentInstance.name.encode()).to_bytes(4, byteorder='little'))
-        binary.extend(currentInstance.name.encode())
-        binary.extend(index.to_bytes(4, byteorder='little'))  # Object ID
-        binary.extend((0xFFFFFFFF).to_bytes(4, byteorder='little')) # Keyframe
-        binary.extend((0xFFFFFFFF).to_bytes(4, byteorder='little'))  # TODO Instance ID
-        write_instance_transformation(binary, validate_transformation(self, currentInstance))
-        numberOfInstances += 1
+    # Check if the object has animation data
+    perFrameInstances = [instance for instance in instances if is_animated_instance(instance)]
+    staticInstances = [instance for instance in instances if not is_animated_instance(instance)]
+    names = [instance.name.encode() for instance in staticInstances]
+    indices = numpy.array([exportedObjects[instance.data] for instance in staticInstances], dtype=numpy.uint32)
+    transforms = get_world_matrices(self, staticInstances)
+    write_instance_records(binary, names, indices, 0xFFFFFFFF, transforms)
+    if objectIndex is not None:
+        for name, index, transformMat in zip(names, indices, transforms):
+            objectIndex.add_instance(name.decode(), int(index), 0xFFFFFFFF, transformMat)
+    numberOfInstances += len(names)
+
+    print("Exporting instancer instances...")
+    # Instancers may generate millions of instances; their names are equally long per source object
+    for instancerName, source, transforms in instancerInstances:
+        index = exportedObjects[source.data]
+        digits = len(str(len(transforms) - 1))
+        names = [("%s__%s__%0*d"%(instancerName, source.name, digits, i)).encode() for i in range(len(transforms))]
+        write_instance_records(binary, names, index, 0xFFFFFFFF, transforms)
+        if objectIndex is not None:
+            for name, transformMat in zip(names, transforms):
+                objectIndex.add_instance(name.decode(), index, 0xFFFFFFFF, transformMat)
+        numberOfInstances += len(transforms)
         
     print("Exporting per-frame instances...")
-    if len(perFrameInstances) > 0:
-        for f in frame_range:
-            scn.frame_set(f)
-            # First the "normal" instances for this frame
-            for currentInstance in perFrameInstances:
-                transformMat = validate_transformation(self, currentInstance)
-                index = exportedObjects[currentInstance.data]
-                binary.extend(len(currentInstance.name.encode()).to_bytes(4, byteorder='little'))
-                binary.extend(currentInstance.name.encode())
-                binary.extend(index.to_bytes(4, byteorder='little'))  # Object ID
-                binary.extend(f.to_bytes(4, byteorder='little')) # Keyframe
-                binary.extend((0xFFFFFFFF).to_bytes(4, byteorder='little'))  # TODO Instance ID
-                write_instance_transformation(binary, validate_transformation(self, currentInstance))
-                numberOfInstances += 1
-            # Then come the animated object's instances
-            # Each object is exported for the entire frame range
-            for i in range(0, len(animationObjects)):
-                animatedInstance = animationObjects[i]
-                # Implicit object index: there is no "real" instancing
-                index = len(exportedObjects) + i * len(frame_range) + f - frame_range[0]
-                name = (animatedInstance.name + "__animated__frame_" + str(f)).encode()
-                binary.extend(len(name).to_bytes(4, byteorder='little'))
-                binary.extend(name)
-                binary.extend(index.to_bytes(4, byteorder='little'))  # Object ID
-                binary.extend(f.to_bytes(4, byteorder='little')) # Keyframe
-                binary.extend((0xFFFFFFFF).to_bytes(4, byteorder='little'))  # TODO Instance ID
-                transformMat = validate_transformation(self, animatedInstance)
-                write_instance_transformation(binary, transformMat)
-                numberOfInstances += 1
+    # The transformations were recorded by the frame sweep
+    frame_range = frameSweep.frames
+    # Meshes with identical content share an object, so there may be fewer objects than meshes
+    staticObjectCount = len(set(exportedObjects.values()))
+    perFrameIndices = [exportedObjects[instance.data] for instance in perFrameInstances]
+    perFrameTransforms = [frameSweep.get(('instance', instance.name)) for instance in perFrameInstances]
+    animatedTransforms = [frameSweep.get(('instance', instance.name)) for instance in animationObjects]
+    for frameIndex, f in enumerate(frame_range):
+        # First the "normal" instances for this frame, then come the animated object's instances.
+        # Each animated object is exported for the entire frame range with an implicit object
+        # index: there is no "real" instancing
+        names = [instance.name.encode() for instance in perFrameInstances]
+        names += [(instance.name + "__animated__frame_" + str(f)).encode() for instance in animationObjects]
+        indices = perFrameIndices + [staticObjectCount + i * len(frame_range) + frameIndex for i in range(len(animationObjects))]
+        transforms = numpy.array([samples[frameIndex] for samples in perFrameTransforms + animatedTransforms],
+                                 dtype=numpy.float64).reshape(-1, 4, 4)
+        write_instance_records(binary, names, numpy.array(indices, dtype=numpy.uint32), f, transforms)
+        if objectIndex is not None:
+            for name, index, transformMat in zip(names, indices, transforms):
+                objectIndex.add_instance(name.decode(), index, f, transformMat)
+        numberOfInstances += len(names)
     
     # Now that we're done we know the amount of instances
-    numberOfInstancesBytes = numberOfInstances.to_bytes(4, byteorder='little')
-    for i in range(4):
-        binary[numberOfInstancesBinaryPosition + i] = numberOfInstancesBytes[i]
-
-def export_binary(context, self, filepath):
+    write_num(binary, numberOfInstancesBinaryPosition, 4, numberOfInstances)
+
+# Random-access index written next to the .mff: where every object lies in the file, its bounds and
+# flags, and which object every instance refers to. Loaders can fetch single objects or a spatial
+# subset without parsing the whole binary.
+class ObjectIndex:
+    def __init__(self):
+        self.objects = dict()   # Object index -> entry
+        self.instances = []
+
+    # Reads name, flags, keyframe and bounding box from the serialized object header
+    def add_object(self, idx, offset, objectBinary):
+        head = objectBinary.head
+        nameLength = int.from_bytes(head[4:8], byteorder='little')
+        name = head[8 : 8+nameLength].decode()
+        flags, keyframe, previous = struct.unpack_from('<3I', head, 8 + nameLength)
+        bounds = struct.unpack_from('<6f', head, 20 + nameLength)
+        entry = collections.OrderedDict()
+        entry['name'] = name
+        entry['offset'] = offset
+        entry['size'] = len(head)
+        entry['flags'] = flags
+        entry['keyframe'] = keyframe
+        entry['aabb'] = [list(bounds[:3]), list(bounds[3:])]
+        self.objects[idx] = entry
+
+    # The instance bounds are the object's box transformed into (flipped) world space
+    def add_instance(self, name, objectIndex, keyframe, transformMat):
+        matrix = numpy.array(transformMat, dtype=numpy.float64)
+        matrix = numpy.stack((matrix[0], matrix[2], -matrix[1], matrix[3]))
+        aabbMin, aabbMax = self.objects[objectIndex]['aabb']
+        corners = numpy.array([[x, y, z] for x in (aabbMin[0], aabbMax[0]) for y in (aabbMin[1], aabbMax[1])
+                               for z in (aabbMin[2], aabbMax[2])])
+        corners = corners @ matrix[:3, :3].T + matrix[:3, 3]
+        entry = collections.OrderedDict()
+        entry['name'] = name
+        entry['object'] = objectIndex
+        entry['keyframe'] = keyframe
+        entry['aabb'] = [corners.min(axis=0).tolist(), corners.max(axis=0).tolist()]
+        self.instances.append(entry)
+
+    def write_json(self, filepath, binfilepath):
+        index = collections.OrderedDict()
+        index['binary'] = os.path.basename(binfilepath)
+        index['size'] = os.path.getsize(binfilepath)
+        index['objects'] = [self.objects[idx] for idx in sorted(self.objects)]
+        index['instances'] = self.instances
+        with open(filepath, 'w') as file:
+            json.dump(index, file, separators=(',', ':'))
+
+# Splices finished objects into the binary (in export order) until at most maxPending remain
+def splice_pending_objects(binary, pendingObjects, objectStartBinaryPosition, maxPending, objectCache=None, objectIndex=None):
+    while len(pendingObjects) > maxPending:
+        idx, objectBinary, cacheKey = pendingObjects.popleft()
+        if objectCache is not None and cacheKey is not None:
+            objectCache.store(cacheKey, objectBinary)
+        objectStart = len(binary)
+        write_num(binary, objectStartBinaryPosition[idx], 8, objectStart) # object start position
+        objectBinary.splice_into(binary)
+        if objectIndex is not None:
+            objectIndex.add_object(idx, objectStart, objectBinary)
+        name, seconds, cached = objectBinary.profile
+        profiler.add_object(name, seconds, len(objectBinary.head), cached)
+
+# Feeds a float/int property of every element in a bpy collection into the hasher
+def hash_collection(hasher, collection, attribute, components, dtype):
+    data = numpy.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(attribute, data)
+    hasher.update(data.tobytes())
+
+# Hashes everything the serialized geometry of an object depends on: the evaluated mesh, its materials
+# and the export flags, but not the object's name or keyframe. Objects with equal keys are exported once.
+# Returns None for objects whose content cannot be shared.
+def get_object_content_key(self, depsgraph, currentObject, materialLookup):
+    # Skinning weights depend on the armatures as well; these objects are always exported on their own
+    if self.export_animation and currentObject.parent and currentObject.parent.type == 'ARMATURE':
+        return None
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(repr((bl_info['version'], self.triangulate, self.use_compression, self.use_deflation,
+                        self.export_animation, currentObject.mufflon_sphere)).encode())
+    hasher.update(numpy.array([corner[:] for corner in currentObject.bound_box], dtype=numpy.float32).tobytes())
+    if currentObject.mufflon_sphere:
+        material = currentObject.active_material
+        if material is not None:
+            hasher.update(repr((materialLookup[material.name], 'Emission' in material.node_tree.nodes)).encode())
+        return hasher.hexdigest()
+
+    mesh = currentObject.evaluated_get(depsgraph).data
+    hasher.update(repr([(materialLookup[material.name], is_emissive_material(material)) if material is not None else None
+                        for material in mesh.materials]).encode())
+    hash_collection(hasher, mesh.vertices, 'co', 3, numpy.float32)
+    hash_collection(hasher, mesh.loops, 'vertex_index', 1, numpy.int32)
+    hash_collection(hasher, mesh.polygons, 'loop_start', 1, numpy.int32)
+    hash_collection(hasher, mesh.polygons, 'loop_total', 1, numpy.int32)
+    hash_collection(hasher, mesh.polygons, 'material_index', 1, numpy.int32)
+    hash_collection(hasher, mesh.polygons, 'use_smooth', 1, numpy.bool_)
+    # The vertex split depends on the split normals (sharp edges, auto smooth, custom normals)
+    mesh.calc_normals_split()
+    hash_collection(hasher, mesh.loops, 'normal', 3, numpy.float32)
+    for uv_layer in mesh.uv_layers:
+        hasher.update(uv_layer.name.encode())
+        hash_collection(hasher, uv_layer.data, 'uv', 2, numpy.float32)
+    for vertex_color_layer in mesh.vertex_colors:
+        hasher.update(vertex_color_layer.name.encode())
+        hash_collection(hasher, vertex_color_layer.data, 'color', 4, numpy.float32)
+    return hasher.hexdigest()
+
+# Computes the key under which the serialized object is cached: its content plus the name and
+# keyframe stored in the object header. Returns None for objects which cannot be cached.
+def get_object_cache_key(self, depsgraph, currentObject, currObjectName, keyframe, materialLookup, contentKey=None):
+    if contentKey is None:
+        contentKey = get_object_content_key(self, depsgraph, currentObject, materialLookup)
+        if contentKey is None:
+            return None
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(repr((contentKey, currObjectName, keyframe)).encode())
+    return hasher.hexdigest()
+
+# On-disk cache of serialized object binaries, stored next to the .mff.
+# Each entry holds the object-local offset slots followed by the object bytes.
+class ObjectCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.usedKeys = set()
+        self.hitCount = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, key):
+        self.usedKeys.add(key)
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as cacheFile:
+            data = cacheFile.read()
+        self.hitCount += 1
+        objectBinary = ObjectBinary()
+        slotCount = int.from_bytes(data[0:4], byteorder='little')
+        objectBinary.offsetSlots = [int.from_bytes(data[4+8*i : 12+8*i], byteorder='little') for i in range(slotCount)]
+        objectBinary.head = bytearray(data[4+8*slotCount:])
+        return objectBinary
+
+    def store(self, key, objectBinary):
+        self.usedKeys.add(key)
+        objectBinary.resolve()
+        with open(self.get_path(key), 'wb') as cacheFile:
+            cacheFile.write(len(objectBinary.offsetSlots).to_bytes(4, byteorder='little'))
+            for slot in objectBinary.offsetSlots:
+                cacheFile.write(slot.to_bytes(8, byteorder='little'))
+            cacheFile.write(objectBinary.head)
+
+    # Drops the entries of objects that were not part of this export
+    def remove_unused(self):
+        for fileName in os.listdir(self.directory):
+            if os.path.splitext(fileName)[0] not in self.usedKeys:
+                os.remove(os.path.join(self.directory, fileName))
+
+# Parallel export of animated objects: the frame range is split into contiguous shards, each of which is
+# serialized by a background Blender process working on the saved .blend file. The workers store their
+# object binaries in ObjectCache format, from which export_binary splices them in order.
+def get_frame_blob_key(objectNumber, frame):
+    return "%d_%d"%(objectNumber, frame)
+
+# Point caches of the simulations (cloth, soft body, dynamic paint, smoke) running on an object
+def get_point_caches(obj):
+    pointCaches = []
+    for mod in obj.modifiers:
+        if getattr(mod, 'point_cache', None) is not None:
+            pointCaches.append(mod.point_cache)
+        canvasSettings = getattr(mod, 'canvas_settings', None)
+        if canvasSettings is not None:
+            pointCaches.extend(surface.point_cache for surface in canvasSettings.canvas_surfaces)
+        domainSettings = getattr(mod, 'domain_settings', None)
+        if domainSettings is not None and getattr(domainSettings, 'point_cache', None) is not None:
+            pointCaches.append(domainSettings.point_cache)
+    return pointCaches
+
+# Simulations without a baked cache only advance frame by frame
+def needs_sequential_frames(obj):
+    return any(not pointCache.is_baked for pointCache in get_point_caches(obj))
+
+# If we're exporting a rigged mesh, we have to temporarily disable rigging since we expect the
+# vertices in rest position. Returns the disabled modifiers
+def disable_armature_modifiers(objects):
+    armMods = []
+    for obj in objects:
+        for mod in obj.modifiers:
+            if mod.type == 'ARMATURE' and mod.show_viewport:
+                armMods.append(mod)
+                mod.show_viewport = False
+    return armMods
+
+def restore_armature_modifiers(armMods):
+    for mod in armMods:
+        mod.show_viewport = True
+
+class AnimationWorkerOptions:
+    def __init__(self, options):
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    def report(self, level, message):
+        print("%s: %s"%(", ".join(level), message))
+
+def run_animation_workers(self, scn, animationObjects, frame_range, materialLookup, boneLookup, directory):
+    # The workers open the .blend file; unsaved changes are passed on through a copy
+    blendPath = bpy.data.filepath
+    if not blendPath or bpy.data.is_dirty:
+        blendPath = os.path.join(directory, "scene.blend")
+        try:
+            bpy.ops.wm.save_as_mainfile(filepath=blendPath, copy=True)
+        except RuntimeError as e:
+            self.report({'WARNING'}, "Failed to save the scene for the animation workers (%s); exporting the frames serially"%(str(e)))
+            return False
+    frames = list(frame_range)
+    options = {name: getattr(self, name) for name in ['triangulate', 'use_compression', 'use_deflation', 'export_animation']}
+    processes = []
+    for w, shard in enumerate(numpy.array_split(numpy.array(frames), min(self.animation_workers, len(frames)))):
+        jobPath = os.path.join(directory, "worker%d.json"%(w))
+        with open(jobPath, 'w') as jobFile:
+            json.dump({'scene': scn.name, 'objects': [obj.name for obj in animationObjects], 'frames': shard.tolist(),
+                       'options': options, 'materials': materialLookup, 'bones': boneLookup, 'directory': directory}, jobFile)
+        logFile = open(os.path.join(directory, "worker%d.log"%(w)), 'w')
+        command = [bpy.app.binary_path, "-b", blendPath, "--python-exit-code", "1",
+                   "--python", os.path.abspath(__file__), "--", "--mff-animation-worker", jobPath]
+        processes.append((subprocess.Popen(command, stdout=logFile, stderr=subprocess.STDOUT), logFile))
+    succeeded = True
+    for w, (process, logFile) in enumerate(processes):
+        process.wait()
+        logFile.close()
+        if process.returncode != 0:
+            with open(logFile.name) as log:
+                print(log.read())
+            self.report({'WARNING'}, "Animation worker %d failed (exit code %d); exporting the frames serially"%(w, process.returncode))
+            succeeded = False
+    return succeeded
+
+def run_animation_worker(jobPath):
+    with open(jobPath) as jobFile:
+        job = json.load(jobFile)
+    register()
+    context = bpy.context
+    scn = context.scene
+    if scn.name != job['scene']:
+        raise Exception("The .blend file opens scene \"%s\" instead of \"%s\""%(scn.name, job['scene']))
+    options = AnimationWorkerOptions(job['options'])
+    animationObjects = [bpy.data.objects[name] for name in job['objects']]
+    frames = job['frames']
+    # Same setup as the serial export; the worker's scene is discarded afterwards, so nothing is restored
+    if options.export_animation:
+        disable_armature_modifiers(animationObjects)
+    # Unbaked simulations have to be stepped up to the first frame of the shard
+    if any(needs_sequential_frames(obj) for obj in animationObjects):
+        for f in range(scn.frame_start, frames[0]):
+            scn.frame_set(f)
+    depsgraph = context.evaluated_depsgraph_get()
+    deflationPool = DeflationPool() if options.use_deflation else None
+    frameBlobs = ObjectCache(job['directory'])
+    for f in frames:
+        scn.frame_set(f)
+        for objectNumber, currentObject in enumerate(animationObjects):
+            objectBinary = ObjectBinary(deflationPool)
+            write_object_binary(options, context, depsgraph, objectBinary, job['materials'], job['bones'],
+                                currentObject, currentObject.data.name + "__animated__frame_" + str(f), f)
+            frameBlobs.store(get_frame_blob_key(objectNumber, f), objectBinary)
+    if deflationPool is not None:
+        deflationPool.shutdown()
+
+# Returns the instances to export and the deforming (cloth, fluid) objects which are exported per frame
+def get_exported_instances(self):
+    # Get all real geometric objects for export and make them unique (instancing may refer to the same
+    # mesh multiple times).
+    if self.use_selection:
+        instances = [obj for obj in bpy.context.selected_objects if is_instance(obj)]
+    else:
+        instances = [obj for obj in bpy.data.objects if is_instance(obj)]
+    
+    # If we have armatures its bones may have custom object representations which should not be exported
+    instances = list(set(instances) - set(get_bone_custom_shapes()))
+    
+    animationObjects = []
+    if self.export_animation:
+        print("Checking for animated meshes...")
+        # List of instances to remove because they're animated
+        remainingInstances = []
+        # To export deforming animations (such as fluid animations), we check if one of the modifiers for them is present
+        for idx in range(0, len(instances)):
+            instance = instances[idx]
+            if instance.type == "MESH":
+                fluidMods = [mod for mod in instance.modifiers if mod.type == "FLUID_SIMULATION"]
+                clothMods = [mod for mod in instance.modifiers if mod.type == "CLOTH"]
+                if fluidMods:
+                    # Check if we're the fluid, in which case we simply don't export the object
+                    if fluidMods[0].settings.type == "DOMAIN":
+                        animationObjects.append(instance)
+                    elif fluidMods[0].settings.type != "FLUID":
+                        remainingInstances.append(instance)
+                elif clothMods:
+                    animationObjects.append(instance)
+                else:
+                    remainingInstances.append(instance)
+                
+        instances = remainingInstances
+    return instances, animationObjects
+
+# Collects the instances generated by instancers (collection instances, particle systems, geometry
+# nodes) from the evaluated dependency graph. Returns (instancer name, source object, (N, 4, 4)
+# instance-to-world matrices) per instanced source object; the source's mesh is exported only once.
+def get_instancer_instances(self, depsgraph):
+    selectedObjects = set(bpy.context.selected_objects) if self.use_selection else None
+    groups = OrderedDict()
+    for inst in depsgraph.object_instances:
+        if not inst.is_instance or inst.parent is None:
+            continue
+        instancer = inst.parent.original
+        source = inst.object.original
+        if selectedObjects is not None and instancer not in selectedObjects:
+            continue
+        # Geometry generated by the instancer itself has no source object to refer to
+        if source == instancer:
+            continue
+        if source.type != "MESH" and not source.mufflon_sphere:
+            continue
+        key = (instancer.name, source.name)
+        if key not in groups:
+            if not is_instance(source):
+                groups[key] = None
+                continue
+            groups[key] = (source, [])
+        if groups[key] is not None:
+            groups[key][1].append(inst.matrix_world.copy())
+    instancerInstances = []
+    for (instancerName, sourceName), group in groups.items():
+        if group is not None:
+            instancerInstances.append((instancerName, group[0], numpy.array(group[1], dtype=numpy.float64)))
+    return instancerInstances
+
+def sample_bones(armatures, restInverses):
+    transforms = []
+    for arm, restInverse in zip(armatures, restInverses):
+        # For the transformation matrix see http://rodolphe-vaillant.fr/?e=77
+        # worldPose @ worldRest^-1 = world @ pose @ rest^-1 @ world^-1
+        worldMat = numpy.array(arm.matrix_world, dtype=numpy.float64)
+        transforms.append(worldMat @ get_bone_pose_matrices(arm) @ restInverse @ numpy.linalg.inv(worldMat))
+    return matrices_to_dual_quaternions(numpy.concatenate(transforms)).astype('<f4')
+
+def sample_instance_transformation(self, instance):
+    return numpy.array(validate_transformation(self, instance), dtype=numpy.float64)
+
+# Registers the samplers of the bone poses and of the per-frame instance transformations
+def add_binary_samplers(self, frameSweep):
+    armatures = [obj for obj in bpy.data.objects if obj.type == "ARMATURE"]
+    if armatures and self.export_animation:
+        # The rest matrices (in armature space) do not change over the frames
+        restInverses = [numpy.linalg.inv(get_bone_rest_matrices(arm)) for arm in armatures]
+        frameSweep.add(('bones',), lambda: sample_bones(armatures, restInverses))
+    instances, animationObjects = get_exported_instances(self)
+    for instance in [obj for obj in instances if is_animated_instance(obj)] + animationObjects:
+        frameSweep.add(('instance', instance.name), lambda instance=instance: sample_instance_transformation(self, instance))
+
+# Exports the binary part; frameSweep may be shared with export_json, otherwise a sweep over
+# the bones and animated instances is run here
+def export_binary(context, self, filepath, frameSweep=None):
     scn = context.scene
     # Store current frame to reset it later
     frame_current = scn.frame_current
-    frame_range = range(scn.frame_start, scn.frame_end + 1) if self.export_animation else [frame_current]
+    frame_range = get_export_frame_range(self, scn)
+    if frameSweep is None:
+        frameSweep = FrameSweep(scn, frame_range)
+        add_binary_samplers(self, frameSweep)
+        frameSweep.run()
     
-    # Binary
-    binary = bytearray()
-    # Materials Header
-    binary.extend("Mats".encode())
     materials = []
     materialNames = []
     materialNameLengths = []
@@ -1717,155 +2526,201 @@ def export_binary(context, self, filepath):
         materialNameLengths.append(materialNameLength.to_bytes(4, byteorder='little'))
         bytePosition += 4 + materialNameLength
 
-    binary.extend(bytePosition.to_bytes(8, byteorder='little'))
-    binary.extend(len(materials).to_bytes(4, byteorder='little'))
-    for i in range(len(materialNameLengths)):
-        binary.extend(materialNameLengths[i])
-        binary.extend(materialNames[i])
+    # Binary; the sections are streamed to disk as soon as they are produced
+    binary = StreamingBinary(filepath)
+    # The target file is only replaced by close(); a failed export discards the partial data instead
+    try:
+        # Materials Header
+        binary.extend("Mats".encode())
+        binary.extend(bytePosition.to_bytes(8, byteorder='little'))
+        binary.extend(len(materials).to_bytes(4, byteorder='little'))
+        for i in range(len(materialNameLengths)):
+            binary.extend(materialNameLengths[i])
+            binary.extend(materialNames[i])
 
-    # Write skeletal animation data
-    boneLookup = write_animation_binary(self, context, binary, frame_range)
+        # Write skeletal animation data
+        with profiler.phase('animation'):
+            boneLookup = write_animation_binary(self, context, binary, frameSweep)
 
-    # Objects Header
+        # Objects Header
 
-    # Type
-    binary.extend("Objs".encode())
-    instanceSectionStartBinaryPosition = len(binary)  # Save Position in binary has to be corrected later
-    # Next section start position
-    binary.extend((0).to_bytes(8, byteorder='little'))  # has to be corrected when the value is known
-    # Global object flags (compression etc.)
-    flags = 0x0
-    if self.use_deflation:
-        flags |= 1
-    if self.use_compression:
-        flags |= 2
-    binary.extend(flags.to_bytes(4, byteorder='little'))
-
-    # Get all real geometric objects for export and make them unique (instancing may refer to the same
-    # mesh multiple times).
-    if self.use_selection:
-        instances = [obj for obj in bpy.context.selected_objects if is_instance(obj)]
-    else:
-        instances = [obj for obj in bpy.data.objects if is_instance(obj)]
-    
-    # If we have armatures its bones may have custom object representations which should not be exported
-    instances = list(set(instances) - set(get_bone_custom_shapes()))
-    
-    animationObjects = []
-    if self.export_animation:
-        print("Checking for animated meshes...")
-        # List of instances to remove because they're animated
-        remainingInstances = []
-        # To export deforming animations (such as fluid animations), we check if one of the modifiers for them is present
-        for idx in range(0, len(instances)):
-            instance = instances[idx]
-            if instance.type == "MESH":
-                fluidMods = [mod for mod in instance.modifiers if mod.type == "FLUID_SIMULATION"]
-                clothMods = [mod for mod in instance.modifiers if mod.type == "CLOTH"]
-                if fluidMods:
-                    # Check if we're the fluid, in which case we simply don't export the object
-                    if fluidMods[0].settings.type == "DOMAIN":
-                        animationObjects.append(instance)
-                    elif fluidMods[0].settings.type != "FLUID":
-                        remainingInstances.append(instance)
-                elif clothMods:
-                    animationObjects.append(instance)
-                else:
-                    remainingInstances.append(instance)
-                
-        instances = remainingInstances
-    
-    # Get the number of unique data references. While it hurts to perform an entire set construction
-    # there is no much better way. The object count must be known to construct the jump-table properly.
-    countOfObjects = len({obj.data for obj in instances}) + len(animationObjects) * len(frame_range)
-    binary.extend(countOfObjects.to_bytes(4, byteorder='little'))
-
-    objectStartBinaryPosition = []  # Save Position in binary to set this correct later
-    for i in range(countOfObjects):
-        objectStartBinaryPosition.append(len(binary))
+        # Type
+        binary.extend("Objs".encode())
+        instanceSectionStartBinaryPosition = len(binary)  # Save Position in binary has to be corrected later
+        # Next section start position
         binary.extend((0).to_bytes(8, byteorder='little'))  # has to be corrected when the value is known
-
-    print("Exporting objects...")
-    activeObject = context.view_layer.objects.active    # Keep this for resetting later
-    exportedObjects = OrderedDict()
-    mode = 'OBJECT'
-    if context.object:
-        mode = context.object.mode   # Keep this for resetting later
-        bpy.ops.object.mode_set(mode='OBJECT')
-    
-    # Evaluating the dependency graph can be an expensive operation - it's best to evaluate it once!
-    depsgraph = context.evaluated_depsgraph_get()
-    # If we're exporting a rigged mesh, we have to temporarily disable rigging since
-    # we expects the vertices in rest position
-    armMods = []
-    if self.export_animation:
-        for obj in instances:
-            for mod in obj.modifiers:
-                if mod.type == 'ARMATURE' and mod.show_viewport:
-                    armMods.append(mod)
-                    mod.show_viewport = False
-        depsgraph.update()
-    
-    # Export regular objects
-    print("Exporting non-animated objects...")
-    for currentObject in instances:
-        # Due to instancing a mesh might be referenced multiple times
-        if currentObject.data in exportedObjects:
-            continue
-        print(currentObject.name)
-        idx = len(exportedObjects)
-        exportedObjects[currentObject.data] = idx # Store index for the instance export
-        write_num(binary, objectStartBinaryPosition[idx], 8, len(binary)) # object start position
-        write_object_binary(self, context, depsgraph, binary, materialLookup, boneLookup,
-                            currentObject, currentObject.data.name, 0xFFFFFFFF)
+        # Global object flags (compression etc.)
+        flags = 0x0
+        if self.use_deflation:
+            flags |= 1
+        if self.use_compression:
+            flags |= 2
+        binary.extend(flags.to_bytes(4, byteorder='little'))
+
+        instances, animationObjects = get_exported_instances(self)
     
-    # Export animated objects (cloth, fluid etc.)
-    # TODO: shape key support?
-    print("Exporting animated objects...")
-    idx = len(exportedObjects)
-    for currentObject in animationObjects:
-        print(currentObject.name)
-        # These need to be exported for every frame
-        for f in frame_range:
-            scn.frame_set(f)
-            # Implicit object index (no instancing supported)
-            write_num(binary, objectStartBinaryPosition[idx], 8, len(binary)) # object start position
-            write_object_binary(self, context, depsgraph, binary, materialLookup, boneLookup, currentObject,
-                                currentObject.data.name + "__animated__frame_" + str(f), f)
-            idx += 1
+        print("Exporting objects...")
+        activeObject = context.view_layer.objects.active    # Keep this for resetting later
+        mode = 'OBJECT'
+        if context.object:
+            mode = context.object.mode   # Keep this for resetting later
+            bpy.ops.object.mode_set(mode='OBJECT')
     
-    # Reset the armature modifier visibilities
-    if self.export_animation:
-        for mod in armMods:
-            mod.show_viewport = True
-        depsgraph.update()
+        # The scene is modified while exporting the objects and has to be restored even if this fails
+        armMods = []
+        deflationPool = None
+        frameDirectory = None
+        frameBlobs = None
+        try:
+            # Evaluating the dependency graph can be an expensive operation - it's best to evaluate it once!
+            depsgraph = context.evaluated_depsgraph_get()
+            if self.export_animation:
+                armMods = disable_armature_modifiers(instances + animationObjects)
+                depsgraph.update()
+            instancerInstances = []
+            if self.export_instancers:
+                with profiler.phase('instancers'):
+                    instancerInstances = get_instancer_instances(self, depsgraph)
+                print("Found %d instancer instances"%(sum(len(transforms) for _, _, transforms in instancerInstances)))
+
+            # Due to instancing a mesh might be referenced multiple times. Beyond that, distinct meshes with
+            # identical content (e.g. copied or imported assets) are mapped onto one exported object.
+            exportedObjects = OrderedDict()
+            uniqueObjects = []              # (object index, object, content key) of the objects to serialize
+            contentObjects = dict()         # Content key -> object index
+            # Sources of instancers (which may be hidden from the scene themselves) need an object as well
+            for currentObject in instances + [source for _, source, _ in instancerInstances]:
+                if currentObject.data in exportedObjects:
+                    continue
+                contentKey = None
+                if self.deduplicate_meshes:
+                    with profiler.phase('deduplication'):
+                        contentKey = get_object_content_key(self, depsgraph, currentObject, materialLookup)
+                if contentKey is not None and contentKey in contentObjects:
+                    exportedObjects[currentObject.data] = contentObjects[contentKey]
+                    continue
+                idx = len(uniqueObjects)
+                exportedObjects[currentObject.data] = idx # Store index for the instance export
+                uniqueObjects.append((idx, currentObject, contentKey))
+                if contentKey is not None:
+                    contentObjects[contentKey] = idx
+            if len(uniqueObjects) < len(exportedObjects):
+                print("Merged %d meshes with identical content"%(len(exportedObjects) - len(uniqueObjects)))
+
+            # The object count must be known to construct the jump-table properly
+            countOfObjects = len(uniqueObjects) + len(animationObjects) * len(frame_range)
+            binary.extend(countOfObjects.to_bytes(4, byteorder='little'))
+
+            objectStartBinaryPosition = []  # Save Position in binary to set this correct later
+            for i in range(countOfObjects):
+                objectStartBinaryPosition.append(len(binary))
+                binary.extend((0).to_bytes(8, byteorder='little'))  # has to be corrected when the value is known
+
+            # Objects are spliced into the binary in order once their deflated blocks are done; meanwhile
+            # the next objects are already being serialized
+            if self.use_deflation:
+                deflationPool = DeflationPool()
+            maxPendingObjects = deflationPool.maxPendingObjects if deflationPool is not None else 0
+            pendingObjects = collections.deque()
+            objectIndex = ObjectIndex() if self.write_index else None
+            # Unchanged objects are taken from the cache of the previous export
+            objectCache = ObjectCache(os.path.splitext(filepath)[0] + ".mffcache") if self.use_object_cache else None
+
+            # Export regular objects
+            print("Exporting non-animated objects...")
+            for idx, currentObject, contentKey in uniqueObjects:
+                print(currentObject.name)
+                objectBinary, cacheKey = get_object_binary(self, context, depsgraph, objectCache, deflationPool, materialLookup,
+                                                           boneLookup, currentObject, currentObject.data.name, 0xFFFFFFFF, contentKey)
+                pendingObjects.append((idx, objectBinary, cacheKey))
+                splice_pending_objects(binary, pendingObjects, objectStartBinaryPosition, maxPendingObjects, objectCache, objectIndex)
+
+            # Export animated objects (cloth, fluid etc.)
+            # TODO: shape key support?
+            print("Exporting animated objects...")
+            if self.animation_workers > 1 and len(animationObjects) > 0 and len(frame_range) > 1:
+                frameDirectory = tempfile.mkdtemp(prefix="mff_frames_", dir=os.path.dirname(os.path.abspath(filepath)))
+                with profiler.phase('animation workers'):
+                    if run_animation_workers(self, scn, animationObjects, frame_range, materialLookup, boneLookup, frameDirectory):
+                        frameBlobs = ObjectCache(frameDirectory)
+            idx = len(uniqueObjects)
+            for objectNumber, currentObject in enumerate(animationObjects):
+                print(currentObject.name)
+                # These need to be exported for every frame
+                for f in frame_range:
+                    currObjectName = currentObject.data.name + "__animated__frame_" + str(f)
+                    if frameBlobs is not None:
+                        # Already serialized by one of the workers
+                        start = time.perf_counter()
+                        objectBinary, cacheKey = frameBlobs.load(get_frame_blob_key(objectNumber, f)), None
+                        if objectBinary is None:
+                            raise Exception("Animation worker output for \"%s\" is missing"%(currObjectName))
+                        objectBinary.profile = (currObjectName, time.perf_counter() - start, False)
+                    else:
+                        scn.frame_set(f)
+                        # Implicit object index (no instancing supported)
+                        objectBinary, cacheKey = get_object_binary(self, context, depsgraph, objectCache, deflationPool, materialLookup,
+                                                                   boneLookup, currentObject, currObjectName, f)
+                    pendingObjects.append((idx, objectBinary, cacheKey))
+                    splice_pending_objects(binary, pendingObjects, objectStartBinaryPosition, maxPendingObjects, objectCache, objectIndex)
+                    idx += 1
+            splice_pending_objects(binary, pendingObjects, objectStartBinaryPosition, 0, objectCache, objectIndex)
+            if objectCache is not None:
+                objectCache.remove_unused()
+                print("Reused %d of %d cached objects"%(objectCache.hitCount, countOfObjects))
+        finally:
+            if frameDirectory is not None:
+                shutil.rmtree(frameDirectory, ignore_errors=True)
+            if deflationPool is not None:
+                deflationPool.shutdown()
+            # Reset the armature modifier visibilities
+            if armMods:
+                restore_armature_modifiers(armMods)
+                depsgraph.update()
     
-    #reset active object
-    context.view_layer.objects.active = activeObject
-    if mode != 'OBJECT':
-        bpy.ops.object.mode_set(mode=mode)
-
-    # Export instances
-    write_num(binary, instanceSectionStartBinaryPosition, 8, len(binary))
-    write_instances(self, binary, instances, exportedObjects)
-
-    # Reset scene
-    if frame_current != scn.frame_current:
-        scn.frame_set(frame_current)
-    context.window.scene = scn
-    # Write binary to file
-    binFile = open(filepath, 'bw')
-    binFile.write(binary)
-    binFile.close()
+            #reset active object
+            context.view_layer.objects.active = activeObject
+            if mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode=mode)
+
+            # Reset scene
+            if frame_current != scn.frame_current:
+                scn.frame_set(frame_current)
+
+        # Export instances
+        write_num(binary, instanceSectionStartBinaryPosition, 8, len(binary))
+        with profiler.phase('instances'):
+            write_instances(self, binary, instances, animationObjects, exportedObjects, frameSweep, objectIndex,
+                            instancerInstances)
+
+        if context.window is not None:
+            context.window.scene = scn
+        binary.close()
+    except:
+        binary.discard()
+        raise
+    if objectIndex is not None:
+        objectIndex.write_json(os.path.splitext(filepath)[0] + ".index.json", filepath)
     return 0
 
 
 def export_mufflon(context, self):
+    global profiler; profiler = ExportProfiler()
     filename = os.path.splitext(self.filepath)[0]
     binfilepath = filename + ".mff"
-    if export_json(context, self, binfilepath) == 0:
+    # All time-varying data of both files is recorded in one walk over the frame range
+    frameSweep = FrameSweep(context.scene, get_export_frame_range(self, context.scene))
+    add_json_samplers(self, frameSweep)
+    add_binary_samplers(self, frameSweep)
+    with profiler.phase('frame sweep'):
+        frameSweep.run()
+    with profiler.phase('json'):
+        jsonResult = export_json(context, self, binfilepath, frameSweep)
+    if jsonResult == 0:
         print("Succeeded exporting JSON")
-        if export_binary(context, self, binfilepath) == 0:
+        with profiler.phase('binary'):
+            binaryResult = export_binary(context, self, binfilepath, frameSweep)
+        if binaryResult == 0:
             print("Succeeded exporting binary")
         else:
             print("Failed exporting binary")
@@ -1875,6 +2730,13 @@ def export_mufflon(context, self):
         print("Failed exporting JSON")
         print("Stopped exporting")
         return {'CANCELLED'}
+    print(profiler.summary())
+    if self.write_profile:
+        settings = collections.OrderedDict((name, getattr(self, name)) for name in
+                                           ['use_selection', 'use_compression', 'use_deflation', 'triangulate',
+                                            'export_animation', 'bake_textures', 'bake_resolution', 'use_object_cache',
+                                            'animation_workers', 'deduplicate_meshes', 'export_instancers', 'write_index'])
+        profiler.write_json(filename + ".profile.json", settings)
     return {'FINISHED'}
 
 def pack_normal32(vec3):
@@ -1891,10 +2753,25 @@ def pack_normal32(vec3):
     v = math.floor(v * 32767.0 + 0.5)  # from [-1,1] to [-2^15,2^15-1]
     return ctypes.c_ushort(u).value | ctypes.c_uint(v << 16).value
 
+# Vectorized version of pack_normal32: packs (N, 3) normals into (N,) octahedral uint32 codes.
+# Computes in double precision to match the scalar encoder bit for bit.
+def pack_normals32(normals):
+    normals = numpy.asarray(normals, dtype=numpy.float64).reshape(-1, 3)
+    x, y, z = normals[:, 0], normals[:, 1], normals[:, 2]
+    l1norm = numpy.abs(x) + numpy.abs(y) + numpy.abs(z)
+    l1norm[l1norm == 0] = 1e-7 # Prevent division by zero
+    upper = z >= 0
+    # warp lower hemisphere
+    u = numpy.where(upper, x / l1norm, (1 - numpy.abs(y) / l1norm) * numpy.where(x >= 0, 1, -1))
+    v = numpy.where(upper, y / l1norm, (1 - numpy.abs(x) / l1norm) * numpy.where(y >= 0, 1, -1))
+    u = numpy.floor(u * 32767.0 + 0.5).astype(numpy.int64)  # from [-1,1] to [-2^15,2^15-1]
+    v = numpy.floor(v * 32767.0 + 0.5).astype(numpy.int64)  # from [-1,1] to [-2^15,2^15-1]
+    return ((u & 0xFFFF) | ((v << 16) & 0xFFFFFFFF)).astype(numpy.uint32)
+
 # ExportHelper is a helper class, defines filename and
 # invoke() function which calls the file selector.
 from bpy_extras.io_utils import (ExportHelper, path_reference_mode)
-from bpy.props import StringProperty, BoolProperty, EnumProperty, PointerProperty, FloatProperty, FloatVectorProperty
+from bpy.props import StringProperty, BoolProperty, IntProperty, EnumProperty, PointerProperty, FloatProperty, FloatVectorProperty
 from bpy.types import Operator, Panel, PropertyGroup
 
 
@@ -1948,6 +2825,43 @@ class MufflonExporter(Operator, ExportHelper):
             description="Bakes procedural textures used as e.g. color inputs and stores them on disk",
             default=False
             )
+    bake_resolution: IntProperty(
+            name="Bake resolution",
+            description="Width and height of baked procedural textures (materials may override it)",
+            default=1024,
+            min=1
+            )
+    use_object_cache: BoolProperty(
+            name="Cache objects",
+            description="Reuse the serialized objects of previous exports if their mesh and the export options are unchanged",
+            default=False
+            )
+    animation_workers: IntProperty(
+            name="Animation workers",
+            description="Number of background Blender processes exporting the frames of animated (cloth, fluid) objects in parallel; 0 or 1 exports them serially",
+            default=0,
+            min=0
+            )
+    deduplicate_meshes: BoolProperty(
+            name="Deduplicate meshes",
+            description="Exports distinct meshes with identical geometry and materials only once and lets their instances share it",
+            default=True
+            )
+    export_instancers: BoolProperty(
+            name="Export instancers",
+            description="Exports the instances of collection instances, particle systems and geometry nodes as instances of their source objects",
+            default=True
+            )
+    write_index: BoolProperty(
+            name="Write object index",
+            description="Writes the offset, size, bounds and flags of every object and the object of every instance as JSON next to the .mff",
+            default=False
+            )
+    write_profile: BoolProperty(
+            name="Write profile",
+            description="Writes the per-phase and per-object export timings as JSON next to the .mff",
+            default=False
+            )
     path_mode = path_reference_mode
 
     def execute(self, context):
@@ -1994,6 +2908,17 @@ class OuterMediumPanel(Panel):
     def draw_header(self, context):
         self.layout.prop(context.active_object.active_material.outer_medium, "enabled", text="")
 
+class BakeResolutionPanel(Panel):
+    bl_idname = "MATERIAL_PT_mufflon_bake_resolution"
+    bl_label = "Bake Resolution (Mufflon)"
+    bl_space_type = "PROPERTIES"
+    bl_region_type = 'WINDOW'
+    bl_context = "material"
+
+    def draw(self, context):
+        self.layout.use_property_split = True
+        self.layout.prop(context.active_object.active_material, "mufflon_bake_resolution")
+
 class SpherePanel(Panel):
     bl_idname = "OBJECT_PT_mufflon_sphere"
     bl_label = "Perfect Sphere (Mufflon)"
@@ -2012,6 +2937,7 @@ classes = (
     MufflonExporter,
     OuterMediumProperties,
     OuterMediumPanel,
+    BakeResolutionPanel,
     SpherePanel
 )
 
@@ -2022,6 +2948,12 @@ def register():
 
     bpy.types.Material.outer_medium = PointerProperty(type=OuterMediumProperties)
     bpy.types.Object.mufflon_sphere = BoolProperty()
+    bpy.types.Material.mufflon_bake_resolution = IntProperty(
+        name = "Resolution",
+        description = "Width and height of the procedural textures baked for this material; 0 uses the export setting",
+        min = 0,
+        default = 0
+    )
 
 
 def unregister():
@@ -2031,4 +2963,7 @@ def unregister():
 
 
 if __name__ == "__main__":
-    unregister()
+    if "--mff-animation-worker" in sys.argv:
+        run_animation_worker(sys.argv[sys.argv.index("--mff-animation-worker") + 1])
+    else:
+        unregister()
@@ -0,0 +1,408 @@
+
+# Memory-mapped reader and validator for the Mufflon binary format (.mff) as written by mff_exporter_28.py.
+#
+# Uncompressed data blocks are exposed as zero-copy NumPy views into the mapped file; deflated blocks
+# are only inflated when their data is accessed. Works without Blender:
+#
+#   python mff_reader.py scene.mff [--validate] [--objects]
+#
+# File layout (all little endian):
+#   "Mats" u64 next section, u32 count, count x (u32 length, name)
+#   "Bone" u64 next section, u32 bones, u32 frames, frames x bones x dual quaternion (8 x f32)
+#   "Objs" u64 instance section, u32 flags (1 = deflated, 2 = compressed normals), u32 count, count x u64 object offset
+#     "Obj_" u32 length, name, u32 flags, u32 keyframe, u32 previous object, 3 x f32 min, 3 x f32 max,
+#            u32 LoD count, count x u64 LoD offset
+#       "LOD_" u32 triangles, quads, spheres, vertices, edges, vertex attributes, face attributes, sphere attributes
+#              then the data blocks: vertices (positions, normals, uvs), vertex attributes, triangles, quads,
+#              material IDs (meshes) or center, radius, material ID (spheres)
+#   "Inst" u32 count, count x (u32 length, name, u32 object, u32 keyframe, u32 instance ID, 3 x 4 x f32 matrix)
+# With deflation every non-empty data block is prefixed with its compressed and uncompressed size.
+
+import argparse
+import collections
+import mmap
+import sys
+import zlib
+
+import numpy
+
+
+class MffFormatError(Exception):
+    pass
+
+MffInstance = collections.namedtuple('MffInstance', ['name', 'objectIndex', 'keyframe', 'instanceId', 'transformation'])
+
+NO_KEYFRAME = 0xFFFFFFFF
+
+# One data block; for deflated blocks the sizes come from the block prefix
+class MffBlock:
+    def __init__(self, mffFile, offset, rawSize, deflated):
+        self.mffFile = mffFile
+        self.offset = offset
+        self.deflated = deflated and rawSize != 0   # Empty blocks are not written at all
+        self.inflated = None
+        if self.deflated:
+            compressedSize = mffFile.u32(offset)
+            self.rawSize = mffFile.u32(offset + 4)
+            self.dataOffset = offset + 8
+            self.end = self.dataOffset + compressedSize
+        else:
+            self.rawSize = rawSize
+            self.dataOffset = offset
+            self.end = offset + rawSize
+        if self.end > len(mffFile.map):
+            raise MffFormatError("Data block at %d ends behind the end of the file"%(offset))
+
+    def buffer(self):
+        if not self.deflated:
+            return self.mffFile.map
+        if self.inflated is None:
+            self.inflated = zlib.decompress(self.mffFile.map[self.dataOffset : self.end])
+        return self.inflated
+
+    # View of count elements at the given byte offset within the (uncompressed) block
+    def array(self, dtype, byteOffset=0, count=-1):
+        base = 0 if self.deflated else self.dataOffset
+        return numpy.frombuffer(self.buffer(), dtype=dtype, count=count, offset=base + byteOffset)
+
+    def bytes(self, byteOffset, size):
+        base = 0 if self.deflated else self.dataOffset
+        return bytes(self.buffer()[base + byteOffset : base + byteOffset + size])
+
+class MffAttribute:
+    def __init__(self, block):
+        self.block = block
+        if block.bytes(0, 4) != b"Attr":
+            raise MffFormatError("Attribute at %d has no 'Attr' tag"%(block.offset))
+        self.name, offset = read_block_string(block, 4)
+        self.metaInfo, offset = read_block_string(block, offset)
+        self.metaFlags = int.from_bytes(block.bytes(offset, 4), byteorder='little')
+        self.typeCode = int.from_bytes(block.bytes(offset + 4, 4), byteorder='little')
+        self.byteSize = int.from_bytes(block.bytes(offset + 8, 8), byteorder='little')
+        self.headerSize = offset + 16
+
+    def data(self, dtype=numpy.uint8):
+        return self.block.array(dtype, self.headerSize, self.byteSize // numpy.dtype(dtype).itemsize)
+
+def read_block_string(block, offset):
+    length = int.from_bytes(block.bytes(offset, 4), byteorder='little')
+    return block.bytes(offset + 4, length).decode(), offset + 4 + length
+
+class MffLod:
+    def __init__(self, mffFile, offset):
+        self.mffFile = mffFile
+        self.offset = offset
+        if mffFile.tag(offset) != "LOD_":
+            raise MffFormatError("LoD at %d has no 'LOD_' tag"%(offset))
+        (self.triangleCount, self.quadCount, self.sphereCount, self.vertexCount, self.edgeCount,
+         self.vertexAttributeCount, self.faceAttributeCount, self.sphereAttributeCount) = mffFile.u32s(offset + 4, 8).tolist()
+        deflated = mffFile.isDeflated
+        normalSize = 4 if mffFile.hasCompressedNormals else 12
+        position = offset + 36
+        self.vertexBlock = MffBlock(mffFile, position, self.vertexCount * (12 + normalSize + 8), deflated)
+        position = self.vertexBlock.end
+        self.vertexAttributes = []
+        for i in range(self.vertexAttributeCount):
+            if deflated:
+                block = MffBlock(mffFile, position, None, True)
+            else:
+                # The size is only known from the attribute header
+                header = MffAttribute(MffBlock(mffFile, position, 0, False))
+                block = MffBlock(mffFile, position, header.headerSize + header.byteSize, False)
+            self.vertexAttributes.append(block)
+            position = block.end
+        self.triangleBlock = MffBlock(mffFile, position, self.triangleCount * 12, deflated)
+        self.quadBlock = MffBlock(mffFile, self.triangleBlock.end, self.quadCount * 16, deflated)
+        self.materialBlock = MffBlock(mffFile, self.quadBlock.end, (self.triangleCount + self.quadCount) * 2, deflated)
+        self.sphereBlock = MffBlock(mffFile, self.materialBlock.end, self.sphereCount * 18, deflated)
+        self.end = self.sphereBlock.end
+
+    def positions(self):
+        return self.vertexBlock.array('<f4', 0, self.vertexCount * 3).reshape(-1, 3)
+
+    # (N, 3) normals, or (N,) octahedral codes if the file uses compressed normals
+    def normals(self):
+        if self.mffFile.hasCompressedNormals:
+            return self.vertexBlock.array('<u4', self.vertexCount * 12, self.vertexCount)
+        return self.vertexBlock.array('<f4', self.vertexCount * 12, self.vertexCount * 3).reshape(-1, 3)
+
+    def uvs(self):
+        normalSize = 4 if self.mffFile.hasCompressedNormals else 12
+        return self.vertexBlock.array('<f4', self.vertexCount * (12 + normalSize), self.vertexCount * 2).reshape(-1, 2)
+
+    def attributes(self):
+        return [MffAttribute(block) for block in self.vertexAttributes]
+
+    def triangles(self):
+        return self.triangleBlock.array('<u4', 0, self.triangleCount * 3).reshape(-1, 3)
+
+    def quads(self):
+        return self.quadBlock.array('<u4', 0, self.quadCount * 4).reshape(-1, 4)
+
+    def material_ids(self):
+        return self.materialBlock.array('<u2', 0, self.triangleCount + self.quadCount)
+
+    def spheres(self):
+        dtype = numpy.dtype([('center', '<f4', 3), ('radius', '<f4'), ('material', '<u2')])
+        return self.sphereBlock.array(dtype, 0, self.sphereCount)
+
+class MffObject:
+    def __init__(self, mffFile, offset):
+        self.mffFile = mffFile
+        self.offset = offset
+        if mffFile.tag(offset) != "Obj_":
+            raise MffFormatError("Object at %d has no 'Obj_' tag"%(offset))
+        self.name, position = mffFile.string(offset + 4)
+        self.flags, self.keyframe, self.previousObject = mffFile.u32s(position, 3).tolist()
+        bounds = mffFile.f32s(position + 12, 6)
+        self.aabbMin = bounds[:3]
+        self.aabbMax = bounds[3:]
+        lodCount = mffFile.u32(position + 36)
+        self.lodOffsets = mffFile.u64s(position + 40, lodCount)
+        self.headerEnd = position + 40 + 8 * lodCount
+
+    def is_emissive(self):
+        return (self.flags & 1) != 0
+
+    def lod(self, index):
+        return MffLod(self.mffFile, int(self.lodOffsets[index]))
+
+    def lods(self):
+        return [self.lod(i) for i in range(len(self.lodOffsets))]
+
+class MffFile:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = open(filepath, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise MffFormatError("'%s' is empty"%(filepath))
+        self.parse_sections()
+
+    def close(self):
+        self.objectOffsets = None
+        try:
+            self.map.close()
+        except BufferError:
+            pass    # Views handed out keep the mapping alive until they are released
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def tag(self, offset):
+        return bytes(self.map[offset : offset + 4]).decode(errors='replace')
+
+    def u32(self, offset):
+        return int.from_bytes(self.map[offset : offset + 4], byteorder='little')
+
+    def u64(self, offset):
+        return int.from_bytes(self.map[offset : offset + 8], byteorder='little')
+
+    def u32s(self, offset, count):
+        return numpy.frombuffer(self.map, dtype='<u4', count=count, offset=offset)
+
+    def u64s(self, offset, count):
+        return numpy.frombuffer(self.map, dtype='<u8', count=count, offset=offset)
+
+    def f32s(self, offset, count):
+        return numpy.frombuffer(self.map, dtype='<f4', count=count, offset=offset)
+
+    def string(self, offset):
+        length = self.u32(offset)
+        return bytes(self.map[offset + 4 : offset + 4 + length]).decode(), offset + 4 + length
+
+    def expect_tag(self, offset, tag):
+        if offset + 4 > len(self.map) or self.tag(offset) != tag:
+            raise MffFormatError("Expected '%s' section at %d"%(tag, offset))
+
+    def parse_sections(self):
+        # Materials
+        self.expect_tag(0, "Mats")
+        self.boneSectionOffset = self.u64(4)
+        self.materials = []
+        position = 16
+        for i in range(self.u32(12)):
+            name, position = self.string(position)
+            self.materials.append(name)
+        self.materialSectionEnd = position
+        # Bone animation
+        self.expect_tag(self.boneSectionOffset, "Bone")
+        self.objectSectionOffset = self.u64(self.boneSectionOffset + 4)
+        self.boneCount = self.u32(self.boneSectionOffset + 12)
+        self.frameCount = self.u32(self.boneSectionOffset + 16)
+        self.boneSectionEnd = self.boneSectionOffset + 20 + self.boneCount * self.frameCount * 32
+        # Objects
+        self.expect_tag(self.objectSectionOffset, "Objs")
+        self.instanceSectionOffset = self.u64(self.objectSectionOffset + 4)
+        self.flags = self.u32(self.objectSectionOffset + 12)
+        self.isDeflated = (self.flags & 1) != 0
+        self.hasCompressedNormals = (self.flags & 2) != 0
+        self.objectCount = self.u32(self.objectSectionOffset + 16)
+        self.objectOffsets = self.u64s(self.objectSectionOffset + 20, self.objectCount)
+        self.objectTableEnd = self.objectSectionOffset + 20 + 8 * self.objectCount
+        # Instances
+        self.expect_tag(self.instanceSectionOffset, "Inst")
+        self.instanceCount = self.u32(self.instanceSectionOffset + 4)
+
+    # Bone transformations as (frames, bones, 8) dual quaternions: real (i, j, k, r), dual (i, j, k, r)
+    def bone_animation(self):
+        return self.f32s(self.boneSectionOffset + 20, self.boneCount * self.frameCount * 8).reshape(self.frameCount, self.boneCount, 8)
+
+    def object(self, index):
+        return MffObject(self, int(self.objectOffsets[index]))
+
+    def objects(self):
+        for i in range(self.objectCount):
+            yield self.object(i)
+
+    # Instance transformations are the inverted (world-to-instance) 3x4 matrices
+    def instances(self):
+        position = self.instanceSectionOffset + 8
+        for i in range(self.instanceCount):
+            name, position = self.string(position)
+            objectIndex, keyframe, instanceId = self.u32s(position, 3).tolist()
+            transformation = self.f32s(position + 12, 12).reshape(3, 4)
+            yield MffInstance(name, objectIndex, keyframe, instanceId, transformation)
+            position += 60
+        self.instanceSectionEnd = position
+
+    # Checks the offsets, counts and jump tables against the writer's layout.
+    # Returns a list of problems, which is empty for a valid file.
+    def validate(self):
+        problems = []
+        fileSize = len(self.map)
+        if self.boneSectionOffset != self.materialSectionEnd:
+            problems.append("Material section ends at %d, but the bone section starts at %d"%(self.materialSectionEnd, self.boneSectionOffset))
+        if self.objectSectionOffset != self.boneSectionEnd:
+            problems.append("Bone section ends at %d, but the object section starts at %d"%(self.boneSectionEnd, self.objectSectionOffset))
+        if self.flags & ~3:
+            problems.append("Unknown global object flags 0x%x"%(self.flags))
+
+        # Object jump table: every object lies between the table and the instance section; the objects
+        # must not overlap, so each one ends where the next one (in file order) starts
+        objectEnds = dict()
+        sortedOffsets = sorted(set(self.objectOffsets.tolist()))
+        if len(sortedOffsets) != self.objectCount:
+            problems.append("The object jump table contains duplicate offsets")
+        for i, offset in enumerate(sortedOffsets):
+            objectEnds[offset] = sortedOffsets[i + 1] if i + 1 < len(sortedOffsets) else self.instanceSectionOffset
+        if sortedOffsets and sortedOffsets[0] != self.objectTableEnd:
+            problems.append("The first object starts at %d instead of directly after the jump table (%d)"%(sortedOffsets[0], self.objectTableEnd))
+        for i in range(self.objectCount):
+            offset = int(self.objectOffsets[i])
+            if offset < self.objectTableEnd or offset >= self.instanceSectionOffset:
+                problems.append("Object %d: offset %d lies outside of the object section"%(i, offset))
+                continue
+            try:
+                problems += self.validate_object(i, self.object(i), objectEnds[offset])
+            except (MffFormatError, ValueError, zlib.error) as e:
+                problems.append("Object %d: %s"%(i, str(e)))
+
+        # Instances
+        try:
+            for i, instance in enumerate(self.instances()):
+                if instance.objectIndex >= self.objectCount:
+                    problems.append("Instance %d (%s) references object %d of %d"%(i, instance.name, instance.objectIndex, self.objectCount))
+                if not numpy.all(numpy.isfinite(instance.transformation)):
+                    problems.append("Instance %d (%s) has a non-finite transformation"%(i, instance.name))
+            if self.instanceSectionEnd != fileSize:
+                problems.append("Instance section ends at %d, but the file is %d bytes long"%(self.instanceSectionEnd, fileSize))
+        except (MffFormatError, ValueError, UnicodeDecodeError) as e:
+            problems.append("Instances: %s"%(str(e)))
+        return problems
+
+    def validate_object(self, index, obj, objectEnd):
+        problems = []
+        prefix = "Object %d (%s)"%(index, obj.name)
+        if numpy.any(obj.aabbMin > obj.aabbMax):
+            problems.append("%s: bounding box minimum exceeds its maximum"%(prefix))
+        if len(obj.lodOffsets) == 0:
+            problems.append("%s: has no LoDs"%(prefix))
+        lodOffsets = obj.lodOffsets.tolist()
+        if lodOffsets and lodOffsets[0] != obj.headerEnd:
+            problems.append("%s: first LoD starts at %d instead of after the LoD jump table (%d)"%(prefix, lodOffsets[0], obj.headerEnd))
+        for j, lodOffset in enumerate(lodOffsets):
+            if lodOffset < obj.headerEnd or lodOffset >= objectEnd:
+                problems.append("%s: LoD %d at %d lies outside of the object"%(prefix, j, lodOffset))
+                continue
+            lodEnd = lodOffsets[j + 1] if j + 1 < len(lodOffsets) else objectEnd
+            lod = obj.lod(j)
+            problems += ["%s, LoD %d: %s"%(prefix, j, problem) for problem in self.validate_lod(lod, lodEnd)]
+        return problems
+
+    def validate_lod(self, lod, lodEnd):
+        problems = []
+        if lod.end != lodEnd:
+            problems.append("data ends at %d, but the next entry starts at %d"%(lod.end, lodEnd))
+        normalSize = 4 if self.hasCompressedNormals else 12
+        expectedSizes = [(lod.vertexBlock, lod.vertexCount * (12 + normalSize + 8), "vertex"),
+                         (lod.triangleBlock, lod.triangleCount * 12, "triangle"),
+                         (lod.quadBlock, lod.quadCount * 16, "quad"),
+                         (lod.materialBlock, (lod.triangleCount + lod.quadCount) * 2, "material ID"),
+                         (lod.sphereBlock, lod.sphereCount * 18, "sphere")]
+        for block, expectedSize, name in expectedSizes:
+            if block.rawSize != expectedSize:
+                problems.append("%s block holds %d bytes instead of %d"%(name, block.rawSize, expectedSize))
+        if problems:
+            return problems
+        if lod.sphereCount > 0 and (lod.vertexCount > 0 or lod.triangleCount > 0 or lod.quadCount > 0):
+            problems.append("mixes spheres and polygons")
+        for attribute in lod.attributes():
+            if attribute.headerSize + attribute.byteSize != attribute.block.rawSize:
+                problems.append("attribute '%s' announces %d bytes, but its block holds %d"%(attribute.name, attribute.byteSize,
+                                                                                           attribute.block.rawSize - attribute.headerSize))
+        if lod.triangleCount > 0 and lod.triangles().max() >= lod.vertexCount:
+            problems.append("triangle index out of range")
+        if lod.quadCount > 0 and lod.quads().max() >= lod.vertexCount:
+            problems.append("quad index out of range")
+        if lod.triangleCount + lod.quadCount > 0 and lod.material_ids().max() >= len(self.materials):
+            problems.append("material ID out of range")
+        if lod.sphereCount > 0 and lod.spheres()['material'].max() >= len(self.materials):
+            problems.append("sphere material ID out of range")
+        if lod.vertexCount > 0 and not numpy.all(numpy.isfinite(lod.positions())):
+            problems.append("non-finite vertex positions")
+        return problems
+
+
+def print_summary(mffFile, listObjects):
+    print("%s: %d materials, %d bones x %d frames, %d objects, %d instances%s%s"%(
+          mffFile.filepath, len(mffFile.materials), mffFile.boneCount, mffFile.frameCount, mffFile.objectCount,
+          mffFile.instanceCount, ", deflated" if mffFile.isDeflated else "",
+          ", compressed normals" if mffFile.hasCompressedNormals else ""))
+    if listObjects:
+        for obj in mffFile.objects():
+            for lod in obj.lods():
+                print("  %-40s %10d vertices %10d triangles %10d quads %4d spheres"%(
+                      obj.name, lod.vertexCount, lod.triangleCount, lod.quadCount, lod.sphereCount))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Inspects and validates Mufflon binary files")
+    parser.add_argument("files", nargs='+', help=".mff files")
+    parser.add_argument("--validate", action='store_true', help="Check offsets, counts and indices")
+    parser.add_argument("--objects", action='store_true', help="List the objects and their LoDs")
+    args = parser.parse_args(argv)
+    failures = 0
+    for filepath in args.files:
+        try:
+            with MffFile(filepath) as mffFile:
+                print_summary(mffFile, args.objects)
+                if args.validate:
+                    problems = mffFile.validate()
+                    for problem in problems:
+                        print("  " + problem)
+                    print("  %s"%("valid" if not problems else "%d problems"%(len(problems))))
+                    failures += 1 if problems else 0
+        except MffFormatError as e:
+            print("%s: %s"%(filepath, str(e)))
+            failures += 1
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,7 @@
 import bpy
 import bgl
+import functools
+import numpy
 import os
 from . import engine
 from .engine import MufflonEngine
@@ -75,11 +77,38 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
             raise Exception("No binary path for Mufflon has been specified")
         self.engine = MufflonEngine(mufflon_binary)
         self.renderable = False
+        # Viewport rendering runs on a background thread which restarts whenever the view changes
+        self.render_thread = None
+        self.camera_state = None
+        self.render_state = None
 
     # When the render engine instance is destroy, this is called. Clean up any
     # render engine data here, for example stopping running render threads.
     def __del__(self):
-        pass
+        self.stop_render_thread()
+
+    def stop_render_thread(self):
+        renderThread = getattr(self, 'render_thread', None)
+        if renderThread is not None:
+            renderThread.stop()
+            self.render_thread = None
+        self.camera_state = None
+        self.render_state = None
+
+    # Timer callback on the main thread: the render thread must not call into bpy itself, so its
+    # progress is polled here until it finishes or is replaced
+    def poll_render_thread(self, renderThread):
+        try:
+            if self.render_thread is not renderThread:
+                return None
+            finished = not renderThread.is_running()
+            if renderThread.take_new_image():
+                self.tag_redraw()
+        except ReferenceError:
+            # Blender already freed the engine
+            renderThread.stop()
+            return None
+        return None if finished else 0.05
 
     # This is the method called by Blender for both final renders (F12) and
     # small preview for materials, world and lights.
@@ -98,9 +127,11 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
             # Here we write the pixel values to the RenderResult
             result = self.begin_result(0, 0, self.size_x, self.size_y)
             layer = result.layers[0].passes["Combined"]
-            pixels = [[0.0, 0.0, 0.0, 0.0]] * self.size_x * self.size_y
             for s in range(scene.mufflon.samples):
-                layer.rect = self.engine.render_iteration(self.size_x, self.size_y, pixels)
+                # (width * height, 4) view of the engine's pixels; the render result is opaque
+                pixels = self.engine.render_iteration(self.size_x, self.size_y)
+                pixels[:, 3] = 1.0
+                layer.rect = pixels
                 self.update_result(result)
             self.end_result(result)
         except Exception as e:
@@ -112,6 +143,8 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
     # should be read from Blender in the same thread. Typically a render
     # thread will be started to do the work while keeping Blender responsive.
     def view_update(self, context, depsgraph):
+        # Changing the scene requires the core, and the accumulated image is outdated anyway
+        self.stop_render_thread()
         self.renderable = True
         try:
             self.engine.update(context.blend_data, depsgraph)
@@ -120,6 +153,7 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
             self.report({'ERROR'}, ("%s (DLL message: '%s')"%(str(e), self.engine.get_last_error())))
         
     def update(self, data, depsgraph):
+        self.stop_render_thread()
         self.renderable = True
         try:
             self.engine.update(data, depsgraph)
@@ -149,14 +183,31 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
         if not self.draw_data or self.draw_data.dimensions != dimensions:
             self.draw_data = CustomDrawData(dimensions)
         try:
-            self.engine.update_viewport_camera(context.space_data, scene.render.resolution_y / scene.render.resolution_x)
-            self.engine.prepare_render(region.width, region.height,  scene.mufflon.min_path_length, scene.mufflon.max_path_length,
-                                       scene.mufflon.nee_count, scene.mufflon.merge_radius, scene.mufflon.integrator,
-                                       Device.CUDA if (scene.mufflon.device == 'CUDA') and (scene.mufflon.integrator in engine.CUDA_INTEGRATORS) else Device.CPU)
-            # TODO: how to render it piece by piece
-            for s in range(scene.mufflon.preview_samples):
-                pixels = self.engine.render_iteration(region.width, region.height, None)
-                self.draw_data.draw(pixels)
+            # Restart the accumulation if anything that influences the image changed; only changes of
+            # the camera itself need to be passed to the core's camera
+            cameraState = (dimensions, tuple(tuple(row) for row in context.space_data.region_3d.view_matrix), context.space_data.lens)
+            renderState = (scene.mufflon.min_path_length, scene.mufflon.max_path_length, scene.mufflon.nee_count,
+                           scene.mufflon.merge_radius, scene.mufflon.integrator, scene.mufflon.device, scene.mufflon.preview_samples)
+            cameraChanged = cameraState != self.camera_state
+            if cameraChanged or renderState != self.render_state:
+                self.stop_render_thread()
+                if cameraChanged:
+                    self.engine.update_viewport_camera(context.space_data, scene.render.resolution_y / scene.render.resolution_x)
+                self.engine.prepare_render(region.width, region.height,  scene.mufflon.min_path_length, scene.mufflon.max_path_length,
+                                           scene.mufflon.nee_count, scene.mufflon.merge_radius, scene.mufflon.integrator,
+                                           Device.CUDA if (scene.mufflon.device == 'CUDA') and (scene.mufflon.integrator in engine.CUDA_INTEGRATORS) else Device.CPU)
+                self.engine.renderer.render_reset()
+                self.render_thread = engine.RenderThread(self.engine, region.width, region.height,
+                                                         scene.mufflon.preview_samples)
+                bpy.app.timers.register(functools.partial(self.poll_render_thread, self.render_thread), first_interval=0.05)
+                self.camera_state = cameraState
+                self.render_state = renderState
+            if self.render_thread.error is not None:
+                error = self.render_thread.error
+                self.stop_render_thread()
+                self.renderable = False
+                raise error
+            self.render_thread.draw_latest(self.draw_data.draw)
         except Exception as e:
             self.report({'ERROR'}, ("%s (DLL message: '%s')"%(str(e), self.engine.get_last_error())))
 
@@ -164,6 +215,18 @@ class MufflonRenderEngine(bpy.types.RenderEngine):
         bgl.glDisable(bgl.GL_BLEND)
 
 
+# Writable float32 view of a bgl.Buffer's memory, or None if the buffer does not support the buffer
+# protocol (older Blender versions)
+def get_buffer_view(buffer, count):
+    try:
+        view = numpy.frombuffer(buffer, dtype=numpy.float32, count=count)
+    except (TypeError, ValueError):
+        return None
+    if not view.flags.writeable:
+        return None
+    return view
+
+
 class CustomDrawData:
     def __init__(self, dimensions):
         # Generate dummy float image buffer
@@ -172,6 +235,9 @@ class CustomDrawData:
 
         pixels = [0.1, 0.2, 0.1, 1.0] * width * height
         pixels = bgl.Buffer(bgl.GL_FLOAT, width * height * 4, pixels)
+        # The texture is updated from this buffer; it is kept for the lifetime of the draw data
+        self.buffer = pixels
+        self.pixels = get_buffer_view(self.buffer, width * height * 4)
 
         # Generate texture
         self.texture = bgl.Buffer(bgl.GL_INT, 1)
@@ -227,10 +293,14 @@ class CustomDrawData:
 
     def draw(self, pixels):
         width, height = self.dimensions
+        if self.pixels is None:
+            # No view of the buffer's memory: copy into it
+            self.buffer[:] = pixels.ravel().tolist()
+        elif pixels.base is not self.pixels and pixels is not self.pixels:
+            self.pixels[:] = pixels.ravel()
         bgl.glActiveTexture(bgl.GL_TEXTURE0)
         bgl.glBindTexture(bgl.GL_TEXTURE_2D, self.texture[0])
-        pixels = bgl.Buffer(bgl.GL_FLOAT, width * height * 4, pixels)
-        bgl.glTexSubImage2D(bgl.GL_TEXTURE_2D, 0, 0, 0, width, height, bgl.GL_RGBA, bgl.GL_FLOAT, pixels)
+        bgl.glTexSubImage2D(bgl.GL_TEXTURE_2D, 0, 0, 0, width, height, bgl.GL_RGBA, bgl.GL_FLOAT, self.buffer)
         bgl.glBindVertexArray(self.vertex_array[0])
         bgl.glDrawArrays(bgl.GL_TRIANGLE_FAN, 0, 4)
         bgl.glBindVertexArray(0)
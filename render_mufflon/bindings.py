@@ -3,6 +3,7 @@ from ctypes import *
 from time import *
 from enum import IntEnum
 import ntpath
+import numpy
 import os
 
 class ProcessTime(Structure):
@@ -39,6 +40,29 @@ class UVec4(Structure):
         ("w", c_uint32)
     ]
 
+class AABB(Structure):
+    _fields_ = [
+        ("min", Vec3),
+        ("max", Vec3)
+    ]
+
+class BulkType(IntEnum):
+    FILE = 0,
+    ARRAY = 1
+
+class BulkDescriptor(Union):
+    _fields_ = [
+        ("file", c_void_p),
+        ("bytes", c_char_p)
+    ]
+
+# Source of the bulk upload functions; the engine passes NumPy arrays as raw bytes
+class BulkLoader(Structure):
+    _fields_ = [
+        ("type", c_uint32),
+        ("descriptor", BulkDescriptor)
+    ]
+
 class NormalDistFunction(IntEnum):
     BECKMANN = 0,
     GGX = 1,
@@ -258,6 +282,16 @@ class DllHolder:
         self.core.polygon_add_triangle_material.argtypes = [c_void_p, UVec3, c_ushort]
         self.core.polygon_add_quad_material.restype = c_int
         self.core.polygon_add_quad_material.argtypes = [c_void_p, UVec4, c_ushort]
+        self.core.polygon_add_vertex_bulk.restype = c_int
+        self.core.polygon_add_vertex_bulk.argtypes = [c_void_p, c_size_t, POINTER(BulkLoader), POINTER(BulkLoader),
+                                                      POINTER(BulkLoader), POINTER(AABB), POINTER(c_size_t),
+                                                      POINTER(c_size_t), POINTER(c_size_t)]
+        self.core.polygon_add_triangle_bulk.restype = c_int
+        self.core.polygon_add_triangle_bulk.argtypes = [c_void_p, c_size_t, POINTER(BulkLoader), POINTER(BulkLoader),
+                                                        POINTER(c_size_t), POINTER(c_size_t)]
+        self.core.polygon_add_quad_bulk.restype = c_int
+        self.core.polygon_add_quad_bulk.argtypes = [c_void_p, c_size_t, POINTER(BulkLoader), POINTER(BulkLoader),
+                                                    POINTER(c_size_t), POINTER(c_size_t)]
         self.core.world_create_instance.restype = c_void_p
         self.core.world_create_instance.argtypes = [c_void_p, c_void_p, c_uint32]
         self.core.world_add_pinhole_camera.restype = c_void_p
@@ -538,6 +572,47 @@ class DllInterface:
     def instance_set_transformation_matrix(self, instHdl, mat, isWorldToInst):
         return self.dllHolder.core.instance_set_transformation_matrix(self.muffInst, instHdl, mat, isWorldToInst)
 
+    # The bulk functions take whole NumPy arrays: (N, 3) float32 points and normals, (N, 2) float32
+    # UVs, (N, 3) or (N, 4) uint32 indices and (N,) uint16 material indices. They return False if the
+    # core read fewer elements than given.
+    def polygon_add_vertex_bulk(self, lodHdl, points, normals, uvs):
+        points = numpy.ascontiguousarray(points, dtype=numpy.float32)
+        normals = numpy.ascontiguousarray(normals, dtype=numpy.float32)
+        uvs = numpy.ascontiguousarray(uvs, dtype=numpy.float32)
+        count = len(points)
+        if count == 0:
+            return True
+        aabb = AABB(Vec3(*points.min(axis=0)), Vec3(*points.max(axis=0)))
+        pointsRead, normalsRead, uvsRead = c_size_t(0), c_size_t(0), c_size_t(0)
+        if self.dllHolder.core.polygon_add_vertex_bulk(lodHdl, count, byref(get_bulk_loader(points)), byref(get_bulk_loader(normals)),
+                                                       byref(get_bulk_loader(uvs)), byref(aabb), byref(pointsRead),
+                                                       byref(normalsRead), byref(uvsRead)) == -1:
+            return False
+        return pointsRead.value == count and normalsRead.value == count and uvsRead.value == count
+
+    def polygon_add_triangle_bulk(self, lodHdl, indices, materialIndices):
+        return self.polygon_add_face_bulk(self.dllHolder.core.polygon_add_triangle_bulk, lodHdl, indices, materialIndices)
+
+    def polygon_add_quad_bulk(self, lodHdl, indices, materialIndices):
+        return self.polygon_add_face_bulk(self.dllHolder.core.polygon_add_quad_bulk, lodHdl, indices, materialIndices)
+
+    def polygon_add_face_bulk(self, function, lodHdl, indices, materialIndices):
+        indices = numpy.ascontiguousarray(indices, dtype=numpy.uint32)
+        materialIndices = numpy.ascontiguousarray(materialIndices, dtype=numpy.uint16)
+        count = len(indices)
+        if count == 0:
+            return True
+        indicesRead, materialsRead = c_size_t(0), c_size_t(0)
+        if function(lodHdl, count, byref(get_bulk_loader(indices)), byref(get_bulk_loader(materialIndices)),
+                    byref(indicesRead), byref(materialsRead)) == -1:
+            return False
+        return indicesRead.value == count and materialsRead.value == count
+
+
+# The array has to stay alive (and unchanged) until the core has read it
+def get_bulk_loader(array):
+    return BulkLoader(BulkType.ARRAY, BulkDescriptor(bytes=array.ctypes.data_as(c_char_p)))
+
 
 def path_leaf(path):
     head, tail = ntpath.split(path)
@@ -551,6 +626,8 @@ class RenderActions:
 
     def __init__(self, binary_path=None, useLoader=True):
         self.dllInterface = DllInterface(binary_path, useLoader)
+        # (lower-case name or short name, devices) -> (renderer index, variation); built on first use
+        self.rendererLookup = None
 
     def load_json(self, sceneJson, defaultRenderTarget="Radiance"):
         fileName = path_leaf(sceneJson)
@@ -560,16 +637,26 @@ class RenderActions:
             raise Exception("Failed to load scene '" + sceneJson + "' (error code: " + returnValue.name + ")")
         self.enable_render_target(defaultRenderTarget, False)
 
-    def enable_renderer(self, rendererName, devices):
-        for i in range(self.dllInterface.render_get_renderer_count()):
-            name = self.dllInterface.render_get_renderer_name(i)
-            shortName = self.dllInterface.render_get_renderer_short_name(i)
-            if (name.lower() == rendererName.lower() or shortName.lower() == rendererName.lower()):
+    # The renderers of a loaded DLL do not change, so they are only enumerated once
+    def get_renderer_lookup(self):
+        if self.rendererLookup is None:
+            self.rendererLookup = {}
+            for i in range(self.dllInterface.render_get_renderer_count()):
+                names = [self.dllInterface.render_get_renderer_name(i).lower(),
+                         self.dllInterface.render_get_renderer_short_name(i).lower()]
                 for v in range(self.dllInterface.render_get_renderer_variations(i)):
-                    if devices == self.dllInterface.render_get_renderer_devices(i, v):
-                        self.activeRendererName = rendererName
-                        self.dllInterface.render_enable_renderer(i, v)
-                        return
+                    devices = self.dllInterface.render_get_renderer_devices(i, v)
+                    for name in names:
+                        # The first match wins, as in a linear search
+                        self.rendererLookup.setdefault((name, devices), (i, v))
+        return self.rendererLookup
+
+    def enable_renderer(self, rendererName, devices):
+        rendererIndex = self.get_renderer_lookup().get((rendererName.lower(), devices))
+        if rendererIndex is not None:
+            self.activeRendererName = rendererName
+            self.dllInterface.render_enable_renderer(*rendererIndex)
+            return
         deviceStr = "[ "
         for dev in Device:
             if (devices & dev) != 0:
@@ -2,13 +2,15 @@ import bpy
 import bmesh
 import mathutils
 import math
+import numpy
+import threading
 from enum import Enum
 from mathutils import Vector
 from . import (bindings, lights, materials, util)
 from ctypes import *
 from .bindings import *
 from .util import *
-from .lights import add_lights
+from .lights import (add_lights, is_supported_light, set_light_parameters)
 from .materials import add_materials
 
 NEE_INTEGRATORS = ['PT', 'LT']
@@ -39,6 +41,17 @@ def get_instance_transformation(instance):
     #else:
     return flip_space_mat(instance.matrix_world)
 
+# Reads a float/int property of every element in a bpy collection with a single foreach_get
+def get_float_array(collection, attribute, components):
+    data = numpy.empty(len(collection) * components, dtype=numpy.float32)
+    collection.foreach_get(attribute, data)
+    return data.reshape(-1, components)
+
+def get_int_array(collection, attribute):
+    data = numpy.empty(len(collection), dtype=numpy.int32)
+    collection.foreach_get(attribute, data)
+    return data
+
 def get_faces_to_triangulate(bm):
     return [f for f in bm.faces if len(f.edges) > 4]
 
@@ -98,6 +111,10 @@ def get_pinhole_fov(camera, width, height):
         # correct aspect ratio because camera.angle is defined in x direction
         return math.atan(math.tan(camera.data.angle / 2) * height / width) * 2
         
+def is_pinhole_camera(cameraData):
+    aperture = cameraData.dof.aperture_fstop if cameraData.dof.use_dof else 128.0
+    return aperture >= 128.0
+
 def add_camera(interface, camera, width, height):
     if camera.data.type != "PERSP":
         raise Exception("Invalid camera type")
@@ -107,7 +124,7 @@ def add_camera(interface, camera, width, height):
     camUp = to_vec3(flip_space(rot @ Vector((0.0, 1.0, 0.0))))
     
     aperture = camera.data.dof.aperture_fstop if camera.data.dof.use_dof else 128.0
-    if aperture >= 128.0:
+    if is_pinhole_camera(camera.data):
         return interface.world_add_pinhole_camera(camera.name, camPos, camDir, camUp, 1, 0.1, 5000.0, get_pinhole_fov(camera, width, height))
     else:
         # TODO
@@ -123,6 +140,22 @@ class MufflonEngine:
         self.scenarioHdl = c_void_p(0)
         self.cameraHdl = c_void_p(0)
         self.lightCount = 0
+        # Handles of the uploaded scene, keyed by the names of the Blender datablocks; update() uses
+        # them to apply changes without rebuilding the world
+        self.objectHdls = {}        # Mesh name -> object handle
+        self.instanceHdls = {}      # Object name -> instance handle
+        self.materialHdls = {}      # Material name -> material handle
+        self.lightHdls = {}         # Light object name -> (light handle, light type)
+        self.cameraName = None
+        self.pinholeCamera = True
+        self.resolution = None
+        self.sceneBuilt = False
+        # What prepare_render last set up; each step is only repeated if its inputs changed
+        self.sceneChanged = True
+        self.renderResolution = None
+        self.rendererState = None
+        self.parameterState = None
+        self.rectArray = None
         self.renderer.set_renderer_log_level(LogLevel.PEDANTIC)
     
     def __del__(self):
@@ -131,13 +164,100 @@ class MufflonEngine:
     def get_last_error(self):
         return self.renderer.dllInterface.core_get_dll_error()
     
+    # Applies the changes Blender reports through depsgraph.updates. Transformations of instances,
+    # lights and the camera as well as light settings are changed in place; everything the core cannot
+    # change after creation (geometry, materials, added or removed objects) rebuilds the world.
     def update(self, data, depsgraph):
+        self.sceneChanged = True
+        if self.needs_rebuild(data, depsgraph):
+            self.rebuild(data, depsgraph)
+            return
+        interface = self.renderer.dllInterface
+        for update in depsgraph.updates:
+            datablock = update.id.original
+            if isinstance(datablock, bpy.types.Object):
+                if datablock.name in self.instanceHdls and update.is_updated_transform:
+                    transMat = get_instance_transformation(datablock)
+                    if not interface.instance_set_transformation_matrix(self.instanceHdls[datablock.name], (c_float * 12)(*mat4x4_to_cfloat_array(transMat)), 0):
+                        raise Exception("Failed to set transformation matrix for instance '%s'"%(datablock.name))
+                elif datablock.name in self.lightHdls:
+                    set_light_parameters(interface, self.lightHdls[datablock.name][0], datablock)
+                elif datablock.name == self.cameraName and update.is_updated_transform:
+                    self.update_camera(depsgraph.scene.camera)
+            elif isinstance(datablock, bpy.types.Light):
+                for obj in data.objects:
+                    if obj.data == datablock and obj.name in self.lightHdls:
+                        set_light_parameters(interface, self.lightHdls[obj.name][0], obj)
+            elif isinstance(datablock, bpy.types.Camera):
+                self.update_camera(depsgraph.scene.camera)
+
+    # Checks whether the reported updates can be applied to the uploaded scene
+    def needs_rebuild(self, data, depsgraph):
+        if not self.sceneBuilt:
+            return True
+        scene = depsgraph.scene
+        if scene.camera is None or scene.camera.name != self.cameraName or self.get_resolution(scene) != self.resolution:
+            return True
+        # Added, removed or renamed objects and lights
+        instanceNames = set()
+        lightTypes = {}
+        for obj in data.objects:
+            if is_instance(obj):
+                instanceNames.add(obj.name)
+            elif obj.type == 'LIGHT' and is_supported_light(obj):
+                lightTypes[obj.name] = obj.data.type
+        if instanceNames != set(self.instanceHdls.keys()):
+            return True
+        if lightTypes != {name: lightType for name, (lightHdl, lightType) in self.lightHdls.items()}:
+            return True
+        if set(material.name for material in data.materials) != set(self.materialHdls.keys()):
+            return True
+        for update in depsgraph.updates:
+            datablock = update.id.original
+            if isinstance(datablock, bpy.types.Object):
+                if datablock.name in self.instanceHdls and update.is_updated_geometry:
+                    return True
+                # Thin-lens cameras have no setters
+                if datablock.name == self.cameraName and not self.pinholeCamera:
+                    return True
+            elif isinstance(datablock, (bpy.types.Mesh, bpy.types.Material, bpy.types.NodeTree)):
+                # There is no way to replace the geometry or material of an existing handle
+                if update.is_updated_geometry or update.is_updated_shading or isinstance(datablock, bpy.types.Material):
+                    return True
+            elif isinstance(datablock, bpy.types.Camera):
+                if not self.pinholeCamera or not is_pinhole_camera(datablock) or datablock.type != "PERSP":
+                    return True
+        return False
+
+    def get_resolution(self, scene):
+        scale = scene.render.resolution_percentage / 100.0
+        return int(scene.render.resolution_x * scale), int(scene.render.resolution_y * scale)
+
+    def update_camera(self, camera):
+        width, height = self.resolution
+        trans, rot, scale = camera.matrix_world.decompose()
+        pos = to_vec3(flip_space(camera.location))
+        dir = to_vec3(flip_space(rot @ Vector((0.0, 0.0, -1.0))))
+        up = to_vec3(flip_space(rot @ Vector((0.0, 1.0, 0.0))))
+        if not self.renderer.dllInterface.dllHolder.core.world_set_camera_position(self.cameraHdl, pos, 0):
+            raise Exception("Failed to set camera position")
+        if not self.renderer.dllInterface.dllHolder.core.world_set_camera_direction(self.cameraHdl, dir, up, 0):
+            raise Exception("Failed to set camera direction")
+        if not self.renderer.dllInterface.dllHolder.core.world_set_pinhole_camera_fov(self.cameraHdl, get_pinhole_fov(camera, width, height)):
+            raise Exception("Failed to set camera FoV")
+
+    def rebuild(self, data, depsgraph):
         self.renderer.dllInterface.world_clear_all()
+        self.objectHdls = {}
+        self.instanceHdls = {}
+        self.materialHdls = {}
+        self.lightHdls = {}
+        self.sceneBuilt = False
+        # The renderer is set up again for the new world
+        self.rendererState = None
         camera = depsgraph.scene.camera
         scene = depsgraph.scene
-        scale = scene.render.resolution_percentage / 100.0
-        width = int(scene.render.resolution_x * scale)
-        height = int(scene.render.resolution_y * scale)
+        width, height = self.get_resolution(scene)
         instanceCount = 0
         meshes = {}
         lights = []
@@ -157,6 +277,7 @@ class MufflonEngine:
         materialIndices = {}
         for i in range(len(data.materials)):
             materialIndices[data.materials[i]] = i
+            self.materialHdls[data.materials[i].name] = materialHdls[i] if i < len(materialHdls) else None
         
         # Add meshes(objects) and instances
         instanceHdls = []
@@ -166,36 +287,37 @@ class MufflonEngine:
             if len(mesh.materials) == 0:
                 raise Exception("Mesh '%s' has no materials"%(mesh.name))
             objHdl = self.renderer.dllInterface.world_create_object(mesh.name, 0)
+            self.objectHdls[mesh.name] = objHdl
             lodHdl = self.renderer.dllInterface.dllHolder.core.object_add_lod(objHdl, 0);
             evalMesh, tris, quads = prepare_object_mesh(depsgraph, meshTuple[1][0])
             if not self.renderer.dllInterface.dllHolder.core.polygon_reserve(lodHdl, len(evalMesh.vertices),
                                                                              len(evalMesh.edges), tris, quads):
                 raise Exception("Failed to reserve polygon '%s' data (%d/%d/%d/%d)"%(mesh.name, len(evalMesh.vertices), len(evalMesh.edges), tris, quads))
-            for v in evalMesh.vertices:
-                point = Vec3(v.co[0], v.co[1], v.co[2])
-                normal = Vec3(v.normal[0], v.normal[1], v.normal[2])
-                uv = Vec2(0, 0)
-                if self.renderer.dllInterface.dllHolder.core.polygon_add_vertex(lodHdl, point, normal, uv) == -1:
-                    raise Exception("Failed to add vertex to polygon '%s'"%(mesh.name))
+            # Upload the whole LoD in a few bulk calls
+            points = get_float_array(evalMesh.vertices, 'co', 3)
+            normals = get_float_array(evalMesh.vertices, 'normal', 3)
+            uvs = numpy.zeros((len(points), 2), dtype=numpy.float32)
+            if not self.renderer.dllInterface.polygon_add_vertex_bulk(lodHdl, points, normals, uvs):
+                raise Exception("Failed to add vertices to polygon '%s'"%(mesh.name))
             
             # Get the list of material indices
-            localMatIndices = [0] * len(mesh.materials)
-            for i in range(len(mesh.materials)):
-                localMatIndices[i] = materialIndices[mesh.materials[i]]
+            localMatIndices = numpy.array([materialIndices[material] for material in mesh.materials], dtype=numpy.uint16)
             
-            for polygon in evalMesh.polygons:
-                if len(polygon.vertices) == 3:
-                    indices = UVec3(polygon.vertices[0], polygon.vertices[1], polygon.vertices[2])
-                    if self.renderer.dllInterface.dllHolder.core.polygon_add_triangle_material(lodHdl, indices, 0) == -1:
-                        raise Exception("Failed to add triangle to polygon '%s'(probably a non-manifold mesh)"%(mesh.name))
-                    # TODO: material index
-            for polygon in evalMesh.polygons:
-                if len(polygon.vertices) == 4:
-                    indices = UVec4(polygon.vertices[0], polygon.vertices[1], polygon.vertices[2], polygon.vertices[3])
-                    if polygon.material_index >= len(localMatIndices):
-                        raise Exception("Mesh '%s' has polygon without assigned material"%(mesh.name))
-                    if self.renderer.dllInterface.dllHolder.core.polygon_add_quad_material(lodHdl, indices, localMatIndices[polygon.material_index]) == -1:
-                        raise Exception("Failed to add quad to polygon '%s'(probably a non-manifold mesh)"%(mesh.name))
+            loopVertices = get_int_array(evalMesh.loops, 'vertex_index')
+            loopStarts = get_int_array(evalMesh.polygons, 'loop_start')
+            loopTotals = get_int_array(evalMesh.polygons, 'loop_total')
+            polygonMaterials = get_int_array(evalMesh.polygons, 'material_index')
+            if len(polygonMaterials) > 0 and polygonMaterials.max() >= len(localMatIndices):
+                raise Exception("Mesh '%s' has polygon without assigned material"%(mesh.name))
+            for vertexCount in (3, 4):
+                faces = loopTotals == vertexCount
+                indices = loopVertices[loopStarts[faces, numpy.newaxis] + numpy.arange(vertexCount)]
+                faceMaterials = localMatIndices[polygonMaterials[faces]]
+                if vertexCount == 3:
+                    if not self.renderer.dllInterface.polygon_add_triangle_bulk(lodHdl, indices, faceMaterials):
+                        raise Exception("Failed to add triangles to polygon '%s'(probably a non-manifold mesh)"%(mesh.name))
+                elif not self.renderer.dllInterface.polygon_add_quad_bulk(lodHdl, indices, faceMaterials):
+                    raise Exception("Failed to add quads to polygon '%s'(probably a non-manifold mesh)"%(mesh.name))
             
             # Create all instances for this mesh(object)
             for i in meshTuple[1]:
@@ -206,15 +328,19 @@ class MufflonEngine:
                 if not self.renderer.dllInterface.instance_set_transformation_matrix(instHdl, (c_float * 12)(*mat4x4_to_cfloat_array(transMat)), 0):
                         raise Exception("Failed to set transformation matrix for instance '%s'"%(i.name))
                 instanceHdls.append(instHdl)
+                self.instanceHdls[i.name] = instHdl
          
         # Load the camera
         self.cameraHdl = add_camera(self.renderer.dllInterface, camera, width, height)
         if self.cameraHdl == c_void_p(0):
             raise Exception("Failed to create camera '%s'"%(camera.name))
+        self.cameraName = camera.name
+        self.pinholeCamera = is_pinhole_camera(camera.data)
+        self.resolution = (width, height)
                                                                                
         # Load lights
-        lightHdls = add_lights(self.renderer.dllInterface, lights)
-        self.lightCount = len(lightHdls)
+        self.lightHdls = add_lights(self.renderer.dllInterface, lights)
+        self.lightCount = len(self.lightHdls)
         errMsg = c_char_p(0)
         if not self.renderer.dllInterface.world_finalize(errMsg):
             raise Exception(errMsg.value)
@@ -229,7 +355,7 @@ class MufflonEngine:
             raise Exception("Failed to set camera for render scenario")
         if not self.renderer.dllInterface.dllHolder.core.scenario_set_resolution(self.scenarioHdl, width, height):
             raise Exception("Failed to set resolution for render scenario")
-        for l in lightHdls:
+        for l, lightType in self.lightHdls.values():
             if not self.renderer.dllInterface.scenario_add_light(self.scenarioHdl, l):
                 raise Exception("Failed to add light to render scenario")
         if not self.renderer.dllInterface.dllHolder.core.scenario_reserve_material_slots(self.scenarioHdl, len(materialHdls)):
@@ -243,6 +369,7 @@ class MufflonEngine:
                 raise Exception("Failed to associate material with render scenario")
         if not self.renderer.dllInterface.world_finalize_scenario(self.scenarioHdl, errMsg):
             raise Exception(errMsg.value)
+        self.sceneBuilt = True
         
     def update_viewport_camera(self, spaceView3D, aspectRatio):
         r3d = spaceView3D.region_3d
@@ -259,13 +386,36 @@ class MufflonEngine:
             raise Exception("Failed to set camera direction")
         if not self.renderer.dllInterface.dllHolder.core.world_set_pinhole_camera_fov(self.cameraHdl, fov):
             raise Exception("Failed to set camera FoV")
+        # The loaded scenario references the camera, so no reload is necessary; the renderer picks the
+        # changes up on its next reset
 
     def prepare_render(self, width, height, minPathLength, maxPathLength, neeCount, mergeRadius, renderer, device):
-        if not self.renderer.dllInterface.dllHolder.core.scenario_set_resolution(self.scenarioHdl, width, height):
-            raise Exception("Failed to set render resolution")
-        if self.renderer.dllInterface.world_load_scenario(self.scenarioHdl) == c_void_p(0):
-            raise Exception("Failed to load scene")
-        self.renderer.enable_renderer(renderer, device)
+        if self.sceneChanged or self.renderResolution != (width, height):
+            if not self.renderer.dllInterface.dllHolder.core.scenario_set_resolution(self.scenarioHdl, width, height):
+                raise Exception("Failed to set render resolution")
+            if self.renderer.dllInterface.world_load_scenario(self.scenarioHdl) == c_void_p(0):
+                raise Exception("Failed to load scene")
+            self.renderResolution = (width, height)
+            self.sceneChanged = False
+        if self.rendererState != (renderer, device):
+            self.renderer.enable_renderer(renderer, device)
+            if renderer == 'WF':
+                renderTarget = 'Border'
+            else:
+                renderTarget = 'Radiance'
+            self.renderer.enable_render_target(renderTarget, False)
+            self.rendererState = (renderer, device)
+            # The parameters belong to the renderer
+            self.parameterState = None
+        if self.parameterState != (minPathLength, maxPathLength, neeCount, mergeRadius):
+            self.set_renderer_parameters(minPathLength, maxPathLength, neeCount, mergeRadius, renderer)
+            self.parameterState = (minPathLength, maxPathLength, neeCount, mergeRadius)
+        if self.rectArray is None or len(self.rectArray) != 4 * width * height:
+            self.rectArray = (c_float * (4 * width * height))()
+            # (width * height, 4) view of the same memory
+            self.pixels = numpy.ctypeslib.as_array(self.rectArray).reshape(-1, 4)
+
+    def set_renderer_parameters(self, minPathLength, maxPathLength, neeCount, mergeRadius, renderer):
         if not self.renderer.renderer_set_parameter_int("Min. path length", minPathLength):
             raise Exception("Failed to set min. path length %d"%(minPathLength))
         if not self.renderer.renderer_set_parameter_int("Max. path length", maxPathLength):
@@ -276,23 +426,77 @@ class MufflonEngine:
         if renderer in MERGE_INTEGRATORS:
             if not self.renderer.renderer_set_parameter_float("Relative merge radius", mergeRadius):
                 raise Exception("Failed to set merge radius %f"%(mergeRadius))
-        if renderer == 'WF':
-            renderTarget = 'Border'
-        else:
-            renderTarget = 'Radiance'
-        self.renderer.enable_render_target(renderTarget, False)
-        self.rectArray = (c_float * (4 * width * height))()
-            
-    def render_iteration(self, width, height, nestedPixels):
+    
+    # Copies the rendered image into target (a contiguous float32 array with four channels per pixel,
+    # e.g. the viewport's texture buffer) or, without target, into the engine's own pixels.
+    # Returns the (width * height, 4) pixel array.
+    def render_iteration(self, width, height, target=None):
         if not self.renderer.dllInterface.render_iterate():
             raise Exception("Failed to render iteration")
         if not self.renderer.dllInterface.mufflon_get_target_image("Radiance", 0, POINTER(POINTER(c_float))()):
             raise Exception("Failed to get rendered image")
-        if not self.renderer.dllInterface.mufflon_copy_screen_texture_rgba32(self.rectArray, 1.0):
+        if target is None:
+            target = self.pixels
+        if target.size != 4 * width * height:
+            raise Exception("Pixel buffer size does not match the resolution %dx%d"%(width, height))
+        if not self.renderer.dllInterface.mufflon_copy_screen_texture_rgba32(target.ctypes.data_as(POINTER(c_float)), 1.0):
             raise Exception("Failed to copy rendered image")
-        if nestedPixels is not None:
-            for i in range(width * height):
-                nestedPixels[i] = [ self.rectArray[4 * i + 0], self.rectArray[4 * i + 1], self.rectArray[4 * i + 2], 1.0 ]
-            return nestedPixels
-        else:
-            return self.rectArray
\ No newline at end of file
+        return target.reshape(-1, 4)
+
+
+# Renders the viewport iterations on a background thread. Every finished iteration is published into
+# one of two pixel buffers while the next one is written into the other, so view_draw only has to
+# upload the newest image and never waits for the renderer.
+class RenderThread:
+    def __init__(self, engine, width, height, iterations):
+        self.engine = engine
+        self.width = width
+        self.height = height
+        self.iterations = iterations
+        self.buffers = [numpy.zeros(4 * width * height, dtype=numpy.float32) for i in range(2)]
+        self.front = None       # Index of the published buffer
+        self.newImage = False   # Set when an image (or error) is published; bpy may only be notified from the main thread
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        back = 0
+        try:
+            for i in range(self.iterations):
+                if self.cancelled.is_set():
+                    return
+                self.engine.render_iteration(self.width, self.height, self.buffers[back])
+                with self.lock:
+                    self.front = back
+                    self.newImage = True
+                back = 1 - back
+        except Exception as e:
+            with self.lock:
+                self.error = e
+                self.newImage = True
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    # Returns whether something new was published since the last call
+    def take_new_image(self):
+        with self.lock:
+            newImage = self.newImage
+            self.newImage = False
+            return newImage
+
+    # Passes the newest image to draw(pixels) unless there is none yet; the thread will not
+    # overwrite it meanwhile
+    def draw_latest(self, draw):
+        with self.lock:
+            if self.front is None:
+                return
+            draw(self.buffers[self.front].reshape(-1, 4))
+
+    # Waits for the current iteration; the core may only be used by one thread at a time
+    def stop(self):
+        self.cancelled.set()
+        self.thread.join()
@@ -78,78 +78,84 @@ def get_directional_light_radiance(light, emissionNode):
     scale = light.energy * get_scalar_def_only_input(emissionNode, 'Strength')
     return to_vec3([scale * radiance[0], scale * radiance[1], scale * radiance[2]])
 
+def get_light_emission_node(lamp):
+    if not (lamp.use_nodes and lamp.node_tree):
+        return None
+    # Fetch the emission node if the light uses nodes
+    outputNode = find_light_output_node(lamp)
+    if len(outputNode.inputs['Surface'].links) == 0:
+        raise Exception("light '%s' is missing output link"%(lamp.name))
+    emissionNode = outputNode.inputs['Surface'].links[0].from_node
+    if emissionNode.bl_idname != 'ShaderNodeEmission':
+        raise Exception("light '%s' does not have emission node as last output node (other nodes not yet supported!)"%(lamp.name))
+    return emissionNode
+
+# Sets position, direction and intensity of an already added light
+def set_light_parameters(interface, lightHdl, lampObject):
+    lamp = lampObject.data
+    emissionNode = get_light_emission_node(lamp)
+    if lamp.type == "POINT":
+        if emissionNode is not None:
+            intensity = get_point_light_intensity(lamp, emissionNode)
+        else:
+            intensity = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
+        pos = to_vec3(flip_space(lampObject.location)) 
+        if not interface.world_set_point_light_position(lightHdl, pos, 0):
+            raise Exception("Failed to set light position of light '%s'"%(lamp.name))
+        if not interface.world_set_point_light_intensity(lightHdl, intensity, 0):
+            raise Exception("Failed to set light intensity of light '%s'"%(lamp.name))
+    elif lamp.type == "SPOT":
+        if emissionNode is not None:
+            intensity = get_spot_light_intensity(lamp, emissionNode)
+        else:
+            intensity = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
+        pos = to_vec3(flip_space(lampObject.location))
+        dir = to_vec3(flip_space(lampObject.matrix_world.to_quaternion() @ mathutils.Vector((0.0, 0.0, -1.0))))
+        width = lamp.spot_size / 2
+        # Try to match the inner circle for the falloff (not exact, blender seems buggy):
+        # https://blender.stackexchange.com/questions/39555/how-to-calculate-blend-based-on-spot-size-and-inner-cone-angle
+        falloff = math.atan(math.tan(lamp.spot_size / 2) * math.sqrt(1-lamp.spot_blend))
+        if not interface.world_set_spot_light_position(lightHdl, pos, 0):
+            raise Exception("Failed to set light position of light '%s'"%(lamp.name))
+        if not interface.world_set_spot_light_direction(lightHdl, dir, 0):
+            raise Exception("Failed to set light direction of light '%s'"%(lamp.name))
+        if not interface.world_set_spot_light_intensity(lightHdl, intensity, 0):
+            raise Exception("Failed to set light intensity of light '%s'"%(lamp.name))
+        if not interface.world_set_spot_light_angle(lightHdl, width, 0):
+            raise Exception("Failed to set light angle of light '%s'"%(lamp.name))
+        if not interface.world_set_spot_light_falloff(lightHdl, falloff, 0):
+            raise Exception("Failed to set light falloff of light '%s'"%(lamp.name))
+    elif lamp.type == "SUN":
+        if emissionNode is not None:
+            radiance = get_directional_light_radiance(lamp, emissionNode)
+        else:
+            radiance = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
+        dir = to_vec3(flip_space(lampObject.matrix_world.to_quaternion() @ mathutils.Vector((0.0, 0.0, -1.0))))
+        if not interface.world_set_dir_light_direction(lightHdl, dir, 0):
+            raise Exception("Failed to set light direction of light '%s'"%(lamp.name))
+        if not interface.world_set_dir_light_irradiance(lightHdl, radiance, 0):
+            raise Exception("Failed to set light irradiance of light '%s'"%(lamp.name))
+
+lightTypes = {
+    "POINT": LightType.POINT,
+    "SPOT": LightType.SPOT,
+    "SUN": LightType.DIRECTIONAL
+}
+
+# Unused lamps and types without a counterpart (e.g. area lights) are not added to the world
+def is_supported_light(lampObject):
+    return lampObject.data.users != 0 and lampObject.data.type in lightTypes
+
+# Returns the light handles and types per light object name
 def add_lights(interface, lamps):
-    lightHdls = []
+    lightHdls = {}
     for lampObject in lamps:
         lamp = lampObject.data
-        if lamp.users == 0:
-            continue
-        if lamp.use_nodes and lamp.node_tree:
-            # Fetch the emission node if the light uses nodes
-            outputNode = find_light_output_node(lamp)
-            if len(outputNode.inputs['Surface'].links) == 0:
-                raise Exception("light '%s' is missing output link"%(light.name))
-            emissionNode = outputNode.inputs['Surface'].links[0].from_node
-            if emissionNode.bl_idname != 'ShaderNodeEmission':
-                raise Exception("light '%s' does not have emission node as last output node (other nodes not yet supported!)"%(lamp.name))
-            
-        if lamp.type == "POINT":
-            lightHdl = interface.world_add_light(lampObject.name, LightType.POINT, 1)
-            if lightHdl == c_void_p(0):
-                raise Exception("Failed to add light '%s'"%(lamp.name))
-            lightHdls.append(lightHdl)
-            
-            if lamp.use_nodes and lamp.node_tree:
-                intensity = get_point_light_intensity(lamp, emissionNode)
-            else:
-                intensity = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
-            pos = to_vec3(flip_space(lampObject.location)) 
-            if not interface.world_set_point_light_position(lightHdl, pos, 0):
-                raise Exception("Failed to set light position of light '%s'"%(lamp.name))
-            if not interface.world_set_point_light_intensity(lightHdl, intensity, 0):
-                raise Exception("Failed to set light intensity of light '%s'"%(lamp.name))
-        elif lamp.type == "SPOT":
-            lightHdl = interface.world_add_light(lampObject.name, LightType.SPOT, 1)
-            if lightHdl == c_void_p(0):
-                raise Exception("Failed to add light '%s'"%(lamp.name))
-            lightHdls.append(lightHdl)
-            
-            if lamp.use_nodes and lamp.node_tree:
-                intensity = get_spot_light_intensity(lamp, emissionNode)
-            else:
-                intensity = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
-            pos = to_vec3(flip_space(lampObject.location))
-            dir = to_vec3(flip_space(lampObject.matrix_world.to_quaternion() @ mathutils.Vector((0.0, 0.0, -1.0))))
-            width = lamp.spot_size / 2
-            # Try to match the inner circle for the falloff (not exact, blender seems buggy):
-            # https://blender.stackexchange.com/questions/39555/how-to-calculate-blend-based-on-spot-size-and-inner-cone-angle
-            falloff = math.atan(math.tan(lamp.spot_size / 2) * math.sqrt(1-lamp.spot_blend))
-            if not interface.world_set_spot_light_position(lightHdl, pos, 0):
-                raise Exception("Failed to set light position of light '%s'"%(lamp.name))
-            if not interface.world_set_spot_light_direction(lightHdl, dir, 0):
-                raise Exception("Failed to set light direction of light '%s'"%(lamp.name))
-            if not interface.world_set_spot_light_intensity(lightHdl, intensity, 0):
-                raise Exception("Failed to set light intensity of light '%s'"%(lamp.name))
-            if not interface.world_set_spot_light_angle(lightHdl, width, 0):
-                raise Exception("Failed to set light angle of light '%s'"%(lamp.name))
-            if not interface.world_set_spot_light_falloff(lightHdl, falloff, 0):
-                raise Exception("Failed to set light falloff of light '%s'"%(lamp.name))
-        elif lamp.type == "SUN":
-            lightHdl = interface.world_add_light(lampObject.name, LightType.DIRECTIONAL, 1)
-            if lightHdl == c_void_p(0):
-                raise Exception("Failed to add light '%s'"%(lamp.name))
-            lightHdls.append(lightHdl)
-            
-            if lamp.use_nodes and lamp.node_tree:
-                radiance = get_directional_light_radiance(lamp, emissionNode)
-            else:
-                radiance = to_vec3([lamp.energy * lamp.color.r, lamp.energy * lamp.color.g, lamp.energy * lamp.color.b])
-            dir = to_vec3(flip_space(lampObject.matrix_world.to_quaternion() @ mathutils.Vector((0.0, 0.0, -1.0))))
-            if not interface.world_set_dir_light_direction(lightHdl, dir, 0):
-                raise Exception("Failed to set light direction of light '%s'"%(lamp.name))
-            if not interface.world_set_dir_light_irradiance(lightHdl, radiance, 0):
-                raise Exception("Failed to set light irradiance of light '%s'"%(lamp.name))
-            pass
-        else:
+        if not is_supported_light(lampObject):
             continue
-    return lightHdls
\ No newline at end of file
+        lightHdl = interface.world_add_light(lampObject.name, lightTypes[lamp.type], 1)
+        if lightHdl == c_void_p(0):
+            raise Exception("Failed to add light '%s'"%(lamp.name))
+        set_light_parameters(interface, lightHdl, lampObject)
+        lightHdls[lampObject.name] = (lightHdl, lamp.type)
+    return lightHdls